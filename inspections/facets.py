@@ -0,0 +1,53 @@
+"""
+Search sidebar facets (cuisine, borough, zip code) with restaurant counts.
+
+Facets are computed from RestaurantSummary once per dataset version and kept
+in the cache, so rendering the search page never scans the data for them.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from inspections.models import DatasetVersion, RestaurantSummary
+
+FACET_FIELDS = {
+    "cuisine": "CUISINE_DESCRIPTION",
+    "borough": "BORO",
+    "zipcode": "ZIPCODE",
+}
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _facet_value(name, value):
+    if name == "zipcode":
+        return str(int(value))
+    return value
+
+
+def compute_facets():
+    facets = {}
+    for name, field in FACET_FIELDS.items():
+        rows = RestaurantSummary.objects.exclude(**{f"{field}__isnull": True})
+        if name != "zipcode":
+            rows = rows.exclude(**{f"{field}__exact": ""})
+        rows = rows.values_list(field).annotate(count=Count("id")).order_by(field)
+        facets[name] = [
+            {
+                "value": _facet_value(name, value),
+                "count": count,
+                "label": f"{_facet_value(name, value)} ({count:,})",
+            }
+            for value, count in rows
+        ]
+    return facets
+
+
+def get_facets():
+    """Return cached facets for the current dataset version"""
+    key = f"inspections:facets:{DatasetVersion.current()}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets()
+        cache.set(key, facets, CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,145 @@
+"""
+SQLite FTS5 index over restaurant name, cuisine and street.
+
+The index is an external-content FTS5 table on top of RestaurantSummary,
+keyed by CAMIS and kept in sync by triggers, so every write path (the CSV
+loader, single model saves, the admin) updates it without extra code.
+Databases without FTS5 simply fall back to ``icontains`` matching.
+"""
+
+import re
+
+from django.db import OperationalError, connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+CONTENT_TABLE = "inspections_restaurantsummary"
+FTS_TABLE = "inspections_restaurantsummary_fts"
+INDEXED_COLUMNS = ("DBA", "CUISINE_DESCRIPTION", "STREET")
+
+_availability = {}
+
+
+def _column_list(prefix=""):
+    return ", ".join(f"{prefix}{column}" for column in INDEXED_COLUMNS)
+
+
+def _create_table_sql(name):
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+        f"{_column_list()}, content='{CONTENT_TABLE}', content_rowid='CAMIS', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+
+
+def create_index(connection):
+    """Create the FTS table and its sync triggers. Returns False without FTS5."""
+    if connection.vendor != "sqlite":
+        return False
+    columns = _column_list()
+    old_values = _column_list("old.")
+    new_values = _column_list("new.")
+    statements = [
+        _create_table_sql(FTS_TABLE),
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON "
+        f"{CONTENT_TABLE} BEGIN INSERT INTO {FTS_TABLE}(rowid, {columns}) "
+        f"VALUES (new.CAMIS, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON "
+        f"{CONTENT_TABLE} BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, "
+        f"{columns}) VALUES ('delete', old.CAMIS, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON "
+        f"{CONTENT_TABLE} BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, "
+        f"{columns}) VALUES ('delete', old.CAMIS, {old_values}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) "
+        f"VALUES (new.CAMIS, {new_values}); END",
+    ]
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(statements[0])
+        except OperationalError:
+            # SQLite was built without FTS5
+            return False
+        for statement in statements[1:]:
+            cursor.execute(statement)
+    _availability.clear()
+    return True
+
+
+def build_detached_index(connection, name, source):
+    """
+    Create FTS table ``name`` over CONTENT_TABLE, filled from the rows of
+    ``source`` and without triggers, ready to be renamed to FTS_TABLE once
+    ``source`` has replaced CONTENT_TABLE. Returns False without FTS5.
+    """
+    if connection.vendor != "sqlite":
+        return False
+    columns = _column_list()
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(_create_table_sql(name))
+        except OperationalError:
+            return False
+        cursor.execute(
+            f"INSERT INTO {name}(rowid, {columns}) "
+            f"SELECT CAMIS, {columns} FROM {source}"
+        )
+    return True
+
+
+def drop_index(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for suffix in ("ai", "ad", "au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _availability.clear()
+
+
+def rebuild_index(connection):
+    """Re-read every summary row into the index (e.g. after raw SQL writes)"""
+    if is_available(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def is_available(connection):
+    key = (connection.alias, str(connection.settings_dict["NAME"]))
+    if key not in _availability:
+        _availability[key] = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _availability[key]
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match as a prefix.
+    Quoting each token keeps FTS5 operators and punctuation out of the query.
+    """
+    tokens = re.findall(r"\w+", query.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def filter_text(queryset, query):
+    """
+    Restrict a RestaurantSummary queryset to rows matching ``query`` and
+    annotate ``search_rank`` (lower is more relevant).
+    """
+    connection = connections[queryset.db]
+    expression = match_expression(query)
+    if not expression or not is_available(connection):
+        return queryset.filter(
+            Q(DBA__icontains=query) | Q(CUISINE_DESCRIPTION__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    matches = RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (expression,)
+    )
+    rank = RawSQL(
+        f"SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+        f'AND rowid = "{CONTENT_TABLE}"."CAMIS"',
+        (expression,),
+    )
+    return queryset.filter(CAMIS__in=matches).annotate(search_rank=rank)
@@ -0,0 +1,158 @@
+"""
+"Near me" search over restaurant coordinates.
+
+Candidates come from an SQLite R*Tree over RestaurantSummary coordinates, so
+a radius query only visits tree nodes around the search point. The R*Tree is
+kept in sync by triggers on the summary table. Distances use an
+equirectangular approximation, which is well under 1% off at city scale and
+needs nothing but arithmetic in SQL. Without R*Tree support the same
+bounding box is applied to the latitude/longitude columns instead.
+"""
+
+import math
+
+from django.db import OperationalError, connections
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Sqrt
+
+CONTENT_TABLE = "inspections_restaurantsummary"
+RTREE_TABLE = "inspections_restaurantsummary_rtree"
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG = 111.320
+
+DEFAULT_RADIUS_KM = 1.0
+MAX_RADIUS_KM = 10.0
+
+_availability = {}
+
+
+def _create_table_sql(name):
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING rtree("
+        "id, min_lat, max_lat, min_lng, max_lng)"
+    )
+
+
+def _fill_sql(name, source):
+    return (
+        f"INSERT INTO {name} SELECT CAMIS, latitude, latitude, "
+        f"longitude, longitude FROM {source} "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+    )
+
+
+def create_index(connection):
+    """Create the R*Tree and its sync triggers. Returns False without R*Tree."""
+    if connection.vendor != "sqlite":
+        return False
+    located = "new.latitude IS NOT NULL AND new.longitude IS NOT NULL"
+    insert_new = (
+        f"INSERT INTO {RTREE_TABLE} SELECT new.CAMIS, new.latitude, new.latitude, "
+        f"new.longitude, new.longitude WHERE {located};"
+    )
+    statements = [
+        _create_table_sql(RTREE_TABLE),
+        f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ai AFTER INSERT ON "
+        f"{CONTENT_TABLE} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ad AFTER DELETE ON "
+        f"{CONTENT_TABLE} BEGIN DELETE FROM {RTREE_TABLE} WHERE id = old.CAMIS; END",
+        f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_au AFTER UPDATE OF "
+        f"latitude, longitude ON {CONTENT_TABLE} BEGIN "
+        f"DELETE FROM {RTREE_TABLE} WHERE id = old.CAMIS; {insert_new} END",
+    ]
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(statements[0])
+        except OperationalError:
+            # SQLite was built without R*Tree
+            return False
+        for statement in statements[1:]:
+            cursor.execute(statement)
+    _availability.clear()
+    return True
+
+
+def drop_index(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for suffix in ("ai", "ad", "au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {RTREE_TABLE}_{suffix}")
+        cursor.execute(f"DROP TABLE IF EXISTS {RTREE_TABLE}")
+    _availability.clear()
+
+
+def rebuild_index(connection):
+    """Reload every located summary row into the R*Tree"""
+    if is_available(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {RTREE_TABLE}")
+            cursor.execute(_fill_sql(RTREE_TABLE, CONTENT_TABLE))
+
+
+def build_detached_index(connection, name, source):
+    """
+    Create R*Tree ``name`` filled from the rows of ``source`` and without
+    triggers, ready to be renamed to RTREE_TABLE once ``source`` has replaced
+    CONTENT_TABLE. Returns False without R*Tree.
+    """
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(_create_table_sql(name))
+        except OperationalError:
+            return False
+        cursor.execute(_fill_sql(name, source))
+    return True
+
+
+def is_available(connection):
+    key = (connection.alias, str(connection.settings_dict["NAME"]))
+    if key not in _availability:
+        _availability[key] = (
+            connection.vendor == "sqlite"
+            and RTREE_TABLE in connection.introspection.table_names()
+        )
+    return _availability[key]
+
+
+def bounding_box(lat, lng, radius_km):
+    """Return (min_lat, max_lat, min_lng, max_lng) enclosing the circle"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlng = radius_km / (KM_PER_DEGREE_LNG * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def distance_km(lat, lng):
+    """ORM expression for the approximate distance from (lat, lng) in km"""
+    lng_scale = KM_PER_DEGREE_LNG * math.cos(math.radians(lat))
+    dx = (F("longitude") - lng) * lng_scale
+    dy = (F("latitude") - lat) * KM_PER_DEGREE_LAT
+    return Sqrt(ExpressionWrapper(dx * dx + dy * dy, output_field=FloatField()))
+
+
+def filter_nearby(queryset, lat, lng, radius_km):
+    """
+    Restrict a RestaurantSummary queryset to restaurants within ``radius_km``
+    and annotate ``distance_km``.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    if is_available(connections[queryset.db]):
+        queryset = queryset.filter(
+            CAMIS__in=RawSQL(
+                f"SELECT id FROM {RTREE_TABLE} WHERE min_lat <= %s AND "
+                "max_lat >= %s AND min_lng <= %s AND max_lng >= %s",
+                (max_lat, min_lat, max_lng, min_lng),
+            )
+        )
+    else:
+        queryset = queryset.filter(
+            Q(latitude__range=(min_lat, max_lat))
+            & Q(longitude__range=(min_lng, max_lng))
+        )
+    return queryset.annotate(distance_km=distance_km(lat, lng)).filter(
+        distance_km__lte=radius_km
+    )
@@ -0,0 +1,436 @@
+"""
+Column-wise conversion of the city inspection CSV into model rows.
+
+Each pandas chunk is converted a whole column at a time: dates are parsed
+with an explicit format, numbers with ``to_numeric`` and blanks become None
+in one ``where``. Python objects are only created when the final model
+instances are built.
+
+The instances are feed-shaped RestaurantInspection rows;
+``RestaurantInspection.store()`` splits them into the restaurant, visit and
+violation tables. Incremental loads match rows on their natural key there
+instead of relying on a unique constraint: visits without violations have
+no violation code, and NULLs never conflict in a unique index.
+"""
+
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+import django
+import pandas as pd
+from django.db import OperationalError
+
+from inspections.models import RestaurantInspection
+
+CHUNK_SIZE = 5000
+
+# CSV header -> RestaurantInspection field
+COLUMN_MAP = {
+    "CAMIS": "CAMIS",
+    "DBA": "DBA",
+    "BORO": "BORO",
+    "BUILDING": "BUILDING",
+    "STREET": "STREET",
+    "ZIPCODE": "ZIPCODE",
+    "PHONE": "PHONE",
+    "CUISINE DESCRIPTION": "CUISINE_DESCRIPTION",
+    "INSPECTION DATE": "INSPECTION_DATE",
+    "ACTION": "ACTION",
+    "VIOLATION CODE": "VIOLATION_CODE",
+    "VIOLATION DESCRIPTION": "VIOLATION_DESCRIPTION",
+    "CRITICAL FLAG": "CRITICAL_FLAG",
+    "SCORE": "SCORE",
+    "GRADE": "GRADE",
+    "GRADE DATE": "GRADE_DATE",
+    "INSPECTION TYPE": "INSPECTION_TYPE",
+    "Community Board": "Community_Board",
+    "Council District": "Council_District",
+    "Census Tract": "Census_Tract",
+}
+MODEL_FIELDS = list(COLUMN_MAP.values())
+_FIELD_ORDER = [
+    field.attname
+    for field in RestaurantInspection._meta.concrete_fields
+    if not field.primary_key
+]
+
+DATE_FIELDS = ("INSPECTION_DATE", "GRADE_DATE")
+NUMBER_FIELDS = (
+    "ZIPCODE",
+    "SCORE",
+    "Community_Board",
+    "Council_District",
+    "Census_Tract",
+)
+DATE_FORMAT = "%m/%d/%Y"
+
+# Bytes hashed from each end of a file for its fingerprint
+FINGERPRINT_SAMPLE = 1 << 20
+
+# Inputs decompressed on the fly, by file extension
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# sqlite_bulk_load settings: a 256 MB page cache (negative means KiB)
+BULK_CACHE_SIZE = -256 * 1024
+
+
+class CountingReader(io.RawIOBase):
+    """
+    Binary reader that counts the bytes taken from ``raw``. For compressed
+    inputs it sits under the decompressor, so ``position`` and ``size`` are
+    both in compressed bytes.
+    """
+
+    def __init__(self, raw, size=None):
+        self.raw = raw
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        self.position += count or 0
+        return count
+
+
+@contextmanager
+def open_source(path):
+    """
+    Open a CSV for a single streaming pass: ``-`` is stdin and .gz, .bz2
+    and .xz files are decompressed as they are read. Yields
+    ``(stream, counter)``: the binary stream to parse and the
+    CountingReader tracking progress (its ``size`` is None for stdin).
+    """
+    if path == "-":
+        raw, size = sys.stdin.buffer, None
+    else:
+        raw = open(path, "rb")
+        size = os.fstat(raw.fileno()).st_size
+    counter = CountingReader(raw, size)
+    opener = OPENERS.get(os.path.splitext(path)[1].lower())
+    stream = opener(counter, "rb") if opener else counter
+    try:
+        yield stream, counter
+    finally:
+        stream.close()
+        if raw is not sys.stdin.buffer:
+            raw.close()
+
+
+def fingerprint(path):
+    """
+    Cheap identity of an input file for resuming loads: a hash of its size
+    and its first and last megabyte. Empty for stdin.
+    """
+    if path == "-":
+        return ""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        digest.update(str(size).encode())
+        digest.update(file.read(FINGERPRINT_SAMPLE))
+        if size > FINGERPRINT_SAMPLE:
+            file.seek(max(size - FINGERPRINT_SAMPLE, FINGERPRINT_SAMPLE))
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def read_chunks(source, chunksize=CHUNK_SIZE):
+    """
+    Read the CSV in chunks with every column as text, so codes and phone
+    numbers are never turned into floats before transform_chunk sees them.
+    """
+    return pd.read_csv(source, chunksize=chunksize, dtype=str, encoding="utf-8")
+
+
+def read_blocks(stream, chunksize=CHUNK_SIZE):
+    """
+    Split a binary CSV stream into self-contained blocks: the header line
+    plus up to ``chunksize`` records, as bytes. Only line ends and quote
+    counts are looked at, so the tokenizing is left to whoever parses the
+    block (see ``parse_block``), which can be a worker process.
+    """
+    if isinstance(stream, io.RawIOBase):
+        # Line iteration on an unbuffered stream reads a byte at a time
+        stream = io.BufferedReader(stream)
+    records = _records(stream)
+    header = next(records, None)
+    if header is None:
+        return
+    while block := list(islice(records, chunksize)):
+        yield header + b"".join(block)
+
+
+def _records(lines):
+    """
+    CSV records from an iterable of lines. A quoted field may span lines;
+    blank lines are skipped, as ``read_csv`` does.
+    """
+    record, quoted = [], False
+    for line in lines:
+        record.append(line)
+        if line.count(b'"') % 2:
+            quoted = not quoted
+        if not quoted:
+            if len(record) > 1 or line.strip():
+                yield b"".join(record)
+            record = []
+    if record:
+        yield b"".join(record)
+
+
+def parse_block(block):
+    """The raw chunk in a ``read_blocks`` block, read as ``read_chunks`` does"""
+    return pd.read_csv(io.BytesIO(block), dtype=str, encoding="utf-8")
+
+
+def parse_dates(column):
+    """Parse a text column of MM/DD/YYYY dates; anything unparseable is NaT"""
+    parsed = pd.to_datetime(column, format=DATE_FORMAT, errors="coerce")
+    leftover = parsed.isna() & column.notna()
+    if leftover.any():
+        # The open-data API sends ISO timestamps
+        parsed[leftover] = pd.to_datetime(
+            column[leftover], format="ISO8601", errors="coerce"
+        )
+        leftover = parsed.isna() & column.notna()
+    # Rare rows in another layout go through the slower per-value parser
+    if leftover.any():
+        parsed[leftover] = pd.to_datetime(
+            column[leftover], format="mixed", errors="coerce"
+        )
+    return parsed
+
+
+def transform_chunk(chunk):
+    """
+    Convert a raw CSV chunk into a DataFrame with one column per model field.
+    Missing values are None; dates are ``datetime.date``.
+    """
+    chunk = chunk.rename(columns=lambda name: name.strip())
+    frame = pd.DataFrame(index=chunk.index)
+    for column, field in COLUMN_MAP.items():
+        if column not in chunk:
+            frame[field] = None
+            continue
+        values = chunk[column]
+        if field in DATE_FIELDS:
+            values = parse_dates(values).dt.date
+        elif field in NUMBER_FIELDS:
+            values = pd.to_numeric(values, errors="coerce")
+        elif field == "CAMIS":
+            values = pd.to_numeric(values, errors="coerce").astype("Int64")
+        frame[field] = values
+
+    # Rows without a CAMIS cannot be attributed to a restaurant
+    frame = frame[frame["CAMIS"].notna()]
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def coordinates(chunk):
+    """
+    ``{camis: (latitude, longitude)}`` from a raw chunk. The feed uses 0 for
+    restaurants it could not geocode.
+    """
+    chunk = chunk.rename(columns=lambda name: name.strip())
+    if "Latitude" not in chunk or "Longitude" not in chunk:
+        return {}
+    camis = pd.to_numeric(chunk["CAMIS"], errors="coerce")
+    lat = pd.to_numeric(chunk["Latitude"], errors="coerce")
+    lng = pd.to_numeric(chunk["Longitude"], errors="coerce")
+    located = camis.notna() & lat.notna() & lng.notna() & (lat != 0) & (lng != 0)
+    return dict(
+        zip(
+            camis[located].astype(int).tolist(),
+            zip(lat[located].tolist(), lng[located].tolist()),
+        )
+    )
+
+
+def build_inspections(frame):
+    """RestaurantInspection instances for a transformed chunk"""
+    return build_from_rows(frame[_FIELD_ORDER].itertuples(index=False, name=None))
+
+
+def build_from_rows(rows):
+    """RestaurantInspection instances from tuples in model field order"""
+    # Positional construction skips the per-row kwargs handling of
+    # Model.__init__
+    return [RestaurantInspection(None, *row) for row in rows]
+
+
+def prepare_chunk(chunk):
+    """
+    Everything a raw chunk needs before it can be written, returned as plain
+    picklable values: ``(rows, coordinates)`` with rows as tuples in model
+    field order. Runs in worker processes for parallel loads.
+    """
+    frame = transform_chunk(chunk)
+    rows = list(frame[_FIELD_ORDER].itertuples(index=False, name=None))
+    return rows, coordinates(chunk)
+
+
+def prepare_block(block):
+    """``prepare_chunk`` for a raw ``read_blocks`` block"""
+    return prepare_chunk(parse_block(block))
+
+
+def prepared_chunks(blocks, workers=1):
+    """
+    Yield ``prepare_block`` results for raw CSV blocks in input order. With
+    several workers a feeder thread hands blocks to a process pool, which
+    both parses and converts them, while the caller consumes (and writes)
+    earlier results; the bounded queue keeps at most two blocks per worker
+    in flight.
+    """
+    if workers <= 1:
+        for block in blocks:
+            yield prepare_block(block)
+        return
+
+    pending = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+
+    def feed(pool):
+        try:
+            for block in blocks:
+                if stop.is_set():
+                    return
+                pending.put(pool.submit(prepare_block, block))
+        except Exception as exc:  # reading failed; re-raised by the consumer
+            pending.put(exc)
+        finally:
+            pending.put(None)
+
+    # Workers import the models, so each one sets Django up first
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        feeder = threading.Thread(target=feed, args=(pool,), daemon=True)
+        feeder.start()
+        try:
+            while (item := pending.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item.result()
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            # Unblock the feeder if it is waiting on a full queue
+            while feeder.is_alive():
+                try:
+                    pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+def prefetch(iterable, depth=2):
+    """
+    Yield the items of ``iterable``, producing up to ``depth`` of them ahead
+    in a background thread so the caller's work overlaps with the producer's
+    I/O. Errors in the producer are re-raised in the caller.
+    """
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                pending.put((item, None))
+        except Exception as exc:
+            pending.put((None, exc))
+        finally:
+            pending.put((done, None))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, exc = pending.get()
+            if exc is not None:
+                raise exc
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue
+        while producer.is_alive():
+            try:
+                pending.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def batched(iterable, size):
+    """Lists of up to ``size`` consecutive items"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def sqlite_bulk_load(connection):
+    """
+    Tune a SQLite connection for a large load and put everything back
+    afterwards: WAL journal with synchronous=NORMAL and a large page cache.
+
+    Indexes stay in place. Dropping them for the load saved little, and a
+    process killed before recreating them left the tables without them.
+
+    Journal mode and safety level cannot change inside a transaction, so
+    they are left alone when called from one, and WAL stays on if other
+    connections keep the database from leaving it. Other databases are
+    untouched.
+    """
+    if connection.vendor != "sqlite":
+        yield
+        return
+
+    tune_journal = not connection.in_atomic_block
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA cache_size")
+        cache_size = cursor.fetchone()[0]
+        cursor.execute(f"PRAGMA cache_size = {BULK_CACHE_SIZE}")
+        if tune_journal:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+            cursor.execute("PRAGMA synchronous")
+            synchronous = cursor.fetchone()[0]
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA cache_size = {cache_size}")
+            if tune_journal:
+                try:
+                    cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+                except OperationalError:
+                    # Leaving WAL needs the only connection to the database.
+                    # With readers attached it stays, which is safe.
+                    pass
+                cursor.execute(f"PRAGMA synchronous = {synchronous}")
+
+
+def upsert_inspections(inspections):
+    """
+    Insert inspections whose natural key is new and update the ones whose
+    other columns changed. Returns ``(inserted, updated)`` Counters by visit
+    and the set of visits created.
+    """
+    return RestaurantInspection.store(inspections, match=True)
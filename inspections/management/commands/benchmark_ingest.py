@@ -0,0 +1,108 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from inspections import ingest
+from inspections.models import RestaurantInspection
+
+
+def write_synthetic_csv(path, rows, seed=0):
+    """Write ``rows`` feed-shaped inspection rows to ``path``"""
+    rng = np.random.default_rng(seed)
+    camis = rng.integers(40000000, 40000000 + max(rows // 10, 1), rows)
+    days = pd.Timestamp("2016-01-01") + pd.to_timedelta(
+        rng.integers(0, 3650, rows), unit="D"
+    )
+    dates = days.strftime(ingest.DATE_FORMAT)
+    grades = rng.choice(np.array(["A", "B", "C", "N", ""], dtype=object), rows)
+    frame = pd.DataFrame(
+        {
+            "CAMIS": camis,
+            "DBA": pd.Series(camis).map("Restaurant {}".format),
+            "BORO": rng.choice(["Manhattan", "Brooklyn", "Queens", "Bronx"], rows),
+            "BUILDING": rng.integers(1, 999, rows),
+            "STREET": "Broadway",
+            "ZIPCODE": rng.integers(10001, 11697, rows),
+            "PHONE": rng.integers(2120000000, 7189999999, rows),
+            "CUISINE DESCRIPTION": rng.choice(["Pizza", "Chinese", "Thai"], rows),
+            "INSPECTION DATE": dates,
+            "ACTION": "Violations were cited in the following area(s).",
+            "VIOLATION CODE": rng.choice(["04L", "06C", "10F", ""], rows),
+            "VIOLATION DESCRIPTION": "Synthetic violation description",
+            "CRITICAL FLAG": rng.choice(["Critical", "Not Critical"], rows),
+            "SCORE": rng.integers(0, 60, rows),
+            "GRADE": grades,
+            "GRADE DATE": np.where(grades != "", dates, ""),
+            "INSPECTION TYPE": "Cycle Inspection / Initial Inspection",
+            "Latitude": rng.uniform(40.5, 40.9, rows).round(6),
+            "Longitude": rng.uniform(-74.2, -73.7, rows).round(6),
+            "Community Board": rng.integers(101, 595, rows),
+            "Council District": rng.integers(1, 51, rows),
+            "Census Tract": rng.integers(100, 99999, rows),
+        }
+    )
+    frame.to_csv(path, index=False)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report load_inspections conversion throughput (rows/s) on a "
+        "synthetic CSV. With --write, also time the inserts inside a "
+        "transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=400_000,
+            help="Synthetic CSV size in rows (default: 400000)",
+        )
+        parser.add_argument(
+            "--write",
+            action="store_true",
+            help="Also bulk_create the rows, then roll the transaction back",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Parse and convert in this many processes (default: 1)",
+        )
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        try:
+            self.stdout.write(f"Writing {rows} synthetic rows to {path}...")
+            write_synthetic_csv(path, rows)
+            self.stdout.write(f"CSV size: {os.path.getsize(path) / 2**20:.1f} MB")
+
+            started = time.perf_counter()
+            converted = 0
+            with transaction.atomic(), open(path, "rb") as stream:
+                prepared = ingest.prepared_chunks(
+                    ingest.read_blocks(stream), workers=options["workers"]
+                )
+                for rows, _ in prepared:
+                    inspections = ingest.build_from_rows(rows)
+                    if options["write"]:
+                        RestaurantInspection.objects.bulk_create(inspections)
+                    converted += len(inspections)
+                elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+        finally:
+            os.remove(path)
+
+        stage = "parse + convert + insert" if options["write"] else "parse + convert"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{stage} ({options['workers']} workers): {converted} rows in {elapsed:.2f}s "
+                f"({converted / elapsed:,.0f} rows/s)"
+            )
+        )
@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from inspections import ratings
+from inspections.models import RestaurantInspection, RestaurantSummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the vectorized citywide rating engine with calling "
+        "get_restaurant_rating() once per restaurant. Read-only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=500,
+            help="Restaurants to time the per-restaurant loop on (default: 500)",
+        )
+
+    def handle(self, *args, **options):
+        camis_values = list(RestaurantSummary.objects.values_list("CAMIS", flat=True))
+        if not camis_values:
+            self.stdout.write("No restaurants loaded; nothing to benchmark.")
+            return
+        total = len(camis_values)
+
+        started = time.perf_counter()
+        frame = ratings.load_frame()
+        loaded = time.perf_counter()
+        computed = ratings.compute_ratings(frame)
+        finished = time.perf_counter()
+        vectorized = finished - started
+        self.stdout.write(
+            f"Vectorized: {len(computed)} rated restaurants from {len(frame)} "
+            f"graded visits in {vectorized:.2f}s "
+            f"(load {loaded - started:.2f}s, compute {finished - loaded:.2f}s)"
+        )
+
+        sample = random.sample(camis_values, min(options["sample"], total))
+        started = time.perf_counter()
+        for camis in sample:
+            RestaurantInspection.get_restaurant_rating(camis)
+        elapsed = time.perf_counter() - started
+        per_restaurant = elapsed / len(sample)
+        self.stdout.write(
+            f"Per-restaurant loop: {len(sample)} restaurants in {elapsed:.2f}s, "
+            f"~{per_restaurant * total:.1f}s projected for all {total}"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Speedup: {per_restaurant * total / vectorized:.0f}x")
+        )
@@ -1,12 +1,42 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
 from inspections.models import (
     FollowedRestaurant,
+    IngestDelta,
     RestaurantInspection,
     RestaurantNotification,
+    visit_key,
 )
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 
+GRADE_HIERARCHY = {"A": 4, "B": 3, "C": 2, "N": 1, "P": 1, "Z": 1}
+
+OUTBREAK_KEYWORDS = [
+    "outbreak",
+    "norovirus",
+    "salmonella",
+    "hepatitis",
+    "shigella",
+    "e. coli",
+    "listeria",
+    "foodborne illness",
+    "contagious disease",
+    "infectious disease",
+    "health outbreak",
+    "disease outbreak",
+    "illness outbreak",
+    "public health hazard",
+    "unsafe food",
+    "contaminated food",
+    "epidemic",
+    "pandemic",
+]
+
+
 class Command(BaseCommand):
     help = "Check for restaurant updates and create notifications for followers"
 
@@ -14,176 +44,141 @@ class Command(BaseCommand):
         parser.add_argument(
             "--days",
             type=int,
-            default=1,
-            help="Number of days back to check for updates (default: 1)",
+            help=(
+                "Scan inspections from this many days back instead of "
+                "processing the changes recorded by new data loads"
+            ),
         )
 
     def handle(self, *args, **options):
-        days_back = options["days"]
+        if options["days"] is not None:
+            self.check_recent(options["days"])
+        else:
+            self.check_changes()
+
+    def check_changes(self):
+        """
+        Notify followers of the restaurants that completed loads inserted or
+        changed rows for, consuming those changes in the same transaction
+        so each is processed exactly once. Every visit the loads created is
+        reported, including ones older than the restaurant's latest.
+        """
+        self.stdout.write("🔍 Checking for restaurant updates from new data...")
+        before = timezone.now()
+        pending = IngestDelta.pending(before).aggregate(
+            deltas=Count("id"), restaurants=Count("camis", distinct=True)
+        )
+        if not pending["deltas"]:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "✅ Notification check complete! No new inspection data since the last check."
+                )
+            )
+            return
+
+        # A full reload changes every restaurant, so the CAMIS values go to
+        # the database as a subquery rather than a parameter list
+        followed_restaurants = list(
+            FollowedRestaurant.objects.filter(
+                camis__in=IngestDelta.pending(before).values("camis")
+            )
+        )
+        latest_inspections = RestaurantInspection.latest_for(
+            {followed.camis for followed in followed_restaurants}
+        )
+        new_visits = self.new_visits(
+            IngestDelta.pending(before)
+            .filter(
+                new_visit=True,
+                camis__in=FollowedRestaurant.objects.values("camis"),
+            )
+            .values_list("camis", "inspection_date", "inspection_type")
+        )
+        notifications, changed = self.evaluate(
+            followed_restaurants, latest_inspections, new_visits
+        )
+
+        with transaction.atomic():
+            if IngestDelta.consume(before) != pending["deltas"]:
+                # Another run got to some of these changes first
+                transaction.set_rollback(True)
+                self.stdout.write(
+                    self.style.WARNING(
+                        "⚠️ These changes are being processed by another run."
+                    )
+                )
+                return
+            self.save(notifications, changed)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Notification check complete! Created {len(notifications)} new notifications for {len(followed_restaurants)} followed restaurants "
+                f"with changes in {pending['restaurants']} restaurants."
+            )
+        )
+        self.clean_up()
+
+    def check_recent(self, days_back):
+        """Notify followers about inspections from the last ``days_back`` days"""
         cutoff_date = datetime.now().date() - timedelta(days=days_back)
 
         self.stdout.write(f"🔍 Checking for restaurant updates since {cutoff_date}...")
 
-        notifications_created = 0
-        followed_restaurants = FollowedRestaurant.objects.all()
+        followed_restaurants = list(FollowedRestaurant.objects.all())
+        # One query for every followed restaurant, however many followers
+        # each one has
+        latest_inspections = RestaurantInspection.latest_for(
+            FollowedRestaurant.objects.values("camis"), since=cutoff_date
+        )
+        notifications, changed = self.evaluate(followed_restaurants, latest_inspections)
+        with transaction.atomic():
+            self.save(notifications, changed)
 
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Notification check complete! Created {len(notifications)} new notifications for {len(followed_restaurants)} followed restaurants."
+            )
+        )
+        self.clean_up()
+
+    def new_visits(self, keys):
+        """
+        ``{camis: [rows, ...]}``: the feed rows of each visit in ``keys``
+        (natural keys), grouped by visit, oldest visit first
+        """
+        keys = set(keys)
+        camis_values = sorted({camis for camis, _, _ in keys})
+        batch_size = RestaurantInspection.RATING_BATCH_SIZE
+        visits = defaultdict(dict)
+        for start in range(0, len(camis_values), batch_size):
+            for row in RestaurantInspection.objects.filter(
+                CAMIS__in=camis_values[start : start + batch_size]
+            ).order_by("INSPECTION_DATE", "id"):
+                key = (row.CAMIS, row.INSPECTION_DATE, row.INSPECTION_TYPE)
+                if key in keys:
+                    visits[row.CAMIS].setdefault(key, []).append(row)
+        return {camis: list(rows.values()) for camis, rows in visits.items()}
+
+    def evaluate(self, followed_restaurants, latest_inspections, new_visits=None):
+        """
+        ``(notifications, changed)``: unsaved notifications for the
+        followers, and the followers whose tracked state moved on
+        """
+        new_visits = new_visits or {}
+        notifications, changed = [], []
         for followed in followed_restaurants:
+            latest_inspection = latest_inspections.get(followed.camis)
+            if not latest_inspection:
+                continue
+            tracked = (followed.last_known_grade, followed.last_inspection_date)
             try:
-                # Get the latest inspection for this restaurant
-                latest_inspection = (
-                    RestaurantInspection.objects.filter(
-                        CAMIS=followed.camis, INSPECTION_DATE__gte=cutoff_date
+                notifications.extend(
+                    self.notifications_for(
+                        followed,
+                        latest_inspection,
+                        new_visits.get(followed.camis, ()),
                     )
-                    .order_by("-INSPECTION_DATE")
-                    .first()
                 )
-
-                if not latest_inspection:
-                    continue
-
-                # Check for grade changes
-                if (
-                    followed.notify_grade_changes
-                    and followed.last_known_grade != latest_inspection.GRADE
-                    and latest_inspection.GRADE
-                ):
-                    old_grade = followed.last_known_grade or "No grade"
-                    new_grade = latest_inspection.GRADE
-
-                    # Determine notification type
-                    grade_hierarchy = {"A": 4, "B": 3, "C": 2, "N": 1, "P": 1, "Z": 1}
-                    old_score = grade_hierarchy.get(followed.last_known_grade, 0)
-                    new_score = grade_hierarchy.get(new_grade, 0)
-
-                    if new_score > old_score:
-                        notification_type = "score_improvement"
-                        title = f"🎉 {followed.restaurant_name} grade improved!"
-                        message = (
-                            f"{followed.restaurant_name} improved from grade {old_grade} to {new_grade}. "
-                            f"This means the restaurant's health standards have gotten better. "
-                            f"Previous grade: {old_grade}. New grade: {new_grade}."
-                        )
-                    elif new_score < old_score:
-                        notification_type = "score_decline"
-                        title = f"⚠️ {followed.restaurant_name} grade declined."
-                        message = (
-                            f"{followed.restaurant_name} declined from grade {old_grade} to {new_grade}. "
-                            f"This may indicate a drop in health standards. "
-                            f"Previous grade: {old_grade}. New grade: {new_grade}."
-                        )
-                    else:
-                        notification_type = "grade_change"
-                        title = f"📊 {followed.restaurant_name} grade changed."
-                        message = (
-                            f"{followed.restaurant_name} received a new grade: {new_grade} (previously {old_grade}). "
-                            f"Check the inspection details for more information."
-                        )
-
-                    RestaurantNotification.objects.create(
-                        followed_restaurant=followed,
-                        notification_type=notification_type,
-                        title=title,
-                        message=message,
-                    )
-                    notifications_created += 1
-
-                    # Update the tracked grade
-                    followed.last_known_grade = new_grade
-                    followed.save()
-
-                # Check for new inspections
-                if (
-                    followed.notify_new_inspections
-                    and latest_inspection.INSPECTION_DATE
-                    > (followed.last_inspection_date or datetime.min.date())
-                ):
-                    inspection_date_str = (
-                        latest_inspection.INSPECTION_DATE.strftime("%B %d, %Y")
-                        if latest_inspection.INSPECTION_DATE
-                        else "Unknown date"
-                    )
-                    grade_str = latest_inspection.GRADE or "Pending"
-                    violations = (
-                        latest_inspection.VIOLATION_DESCRIPTION
-                        or "No violations reported."
-                    )
-                    message = (
-                        f"A new health inspection was completed on {inspection_date_str}. "
-                        f"Grade received: {grade_str}. "
-                        f"Violations noted: {violations[:120]}... "
-                        f"See the inspection details for the full report."
-                    )
-                    RestaurantNotification.objects.create(
-                        followed_restaurant=followed,
-                        notification_type="new_inspection",
-                        title=f"🔍 New inspection at {followed.restaurant_name}",
-                        message=message,
-                    )
-                    notifications_created += 1
-
-                    # Update the last inspection date
-                    followed.last_inspection_date = latest_inspection.INSPECTION_DATE
-                    followed.save()
-
-                # Check for violations if enabled
-                if followed.notify_violations and latest_inspection.VIOLATION_CODE:
-                    # Check if this is a critical violation
-                    if latest_inspection.CRITICAL_FLAG == "Critical":
-                        violation_code = latest_inspection.VIOLATION_CODE or "N/A"
-                        violation_desc = (
-                            latest_inspection.VIOLATION_DESCRIPTION or "No description."
-                        )
-                        message = (
-                            f"A critical health violation was reported: [Code: {violation_code}] "
-                            f"{violation_desc[:120]}... "
-                            f"This violation is considered critical and may impact health safety."
-                        )
-                        RestaurantNotification.objects.create(
-                            followed_restaurant=followed,
-                            notification_type="violation_added",
-                            title=f"⚠️ Critical violation at {followed.restaurant_name}",
-                            message=message,
-                        )
-                        notifications_created += 1
-
-                    # Check for health outbreak keywords in violation description
-                    outbreak_keywords = [
-                        "outbreak",
-                        "norovirus",
-                        "salmonella",
-                        "hepatitis",
-                        "shigella",
-                        "e. coli",
-                        "listeria",
-                        "foodborne illness",
-                        "contagious disease",
-                        "infectious disease",
-                        "health outbreak",
-                        "disease outbreak",
-                        "illness outbreak",
-                        "public health hazard",
-                        "unsafe food",
-                        "contaminated food",
-                        "epidemic",
-                        "pandemic",
-                    ]
-                    violation_desc = (
-                        latest_inspection.VIOLATION_DESCRIPTION or ""
-                    ).lower()
-                    if any(keyword in violation_desc for keyword in outbreak_keywords):
-                        message = (
-                            f"A potential health outbreak or serious foodborne illness was reported: "
-                            f"{latest_inspection.VIOLATION_DESCRIPTION[:120]}... "
-                            f"This may indicate a public health risk. Please review the inspection details for more information."
-                        )
-                        RestaurantNotification.objects.create(
-                            followed_restaurant=followed,
-                            notification_type="health_outbreak",
-                            title=f"🚨 Health outbreak alert at {followed.restaurant_name}",
-                            message=message,
-                        )
-                        notifications_created += 1
-
             except Exception as e:
                 self.stdout.write(
                     self.style.ERROR(
@@ -191,13 +186,17 @@ class Command(BaseCommand):
                     )
                 )
                 continue
+            if (followed.last_known_grade, followed.last_inspection_date) != tracked:
+                changed.append(followed)
+        return notifications, changed
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"✅ Notification check complete! Created {notifications_created} new notifications for {followed_restaurants.count()} followed restaurants."
-            )
+    def save(self, notifications, changed):
+        RestaurantNotification.objects.bulk_create(notifications)
+        FollowedRestaurant.objects.bulk_update(
+            changed, ["last_known_grade", "last_inspection_date"]
         )
 
+    def clean_up(self):
         # Clean up old notifications (older than 90 days)
         old_notifications = RestaurantNotification.objects.filter(
             created_at__lt=datetime.now() - timedelta(days=90)
@@ -211,3 +210,166 @@ class Command(BaseCommand):
                     f"🧹 Cleaned up {deleted_count} old notifications (older than 90 days)."
                 )
             )
+
+    def notifications_for(self, followed, latest_inspection, new_visits=()):
+        """
+        Unsaved notifications for one follower of a restaurant whose latest
+        inspection is ``latest_inspection``. Updates the follower's tracked
+        grade and inspection date in memory.
+
+        Violations are only reported for an inspection newer than the last
+        one the follower was told about, so reloading or re-checking the
+        same data never repeats them. ``new_visits`` are the rows, grouped
+        by visit, of visits a load created: each is reported once whatever
+        its date, so a backfilled inspection is not missed, unless the
+        follower was already told about an inspection on that date.
+        """
+        notifications = []
+        known_date = followed.last_inspection_date
+        is_new_inspection = (
+            latest_inspection.INSPECTION_DATE is not None
+            and latest_inspection.INSPECTION_DATE
+            > (followed.last_inspection_date or datetime.min.date())
+        )
+
+        # Check for grade changes
+        if (
+            followed.notify_grade_changes
+            and followed.last_known_grade != latest_inspection.GRADE
+            and latest_inspection.GRADE
+        ):
+            old_grade = followed.last_known_grade or "No grade"
+            new_grade = latest_inspection.GRADE
+
+            # Determine notification type
+            old_score = GRADE_HIERARCHY.get(followed.last_known_grade, 0)
+            new_score = GRADE_HIERARCHY.get(new_grade, 0)
+
+            if new_score > old_score:
+                notification_type = "score_improvement"
+                title = f"🎉 {followed.restaurant_name} grade improved!"
+                message = (
+                    f"{followed.restaurant_name} improved from grade {old_grade} to {new_grade}. "
+                    f"This means the restaurant's health standards have gotten better. "
+                    f"Previous grade: {old_grade}. New grade: {new_grade}."
+                )
+            elif new_score < old_score:
+                notification_type = "score_decline"
+                title = f"⚠️ {followed.restaurant_name} grade declined."
+                message = (
+                    f"{followed.restaurant_name} declined from grade {old_grade} to {new_grade}. "
+                    f"This may indicate a drop in health standards. "
+                    f"Previous grade: {old_grade}. New grade: {new_grade}."
+                )
+            else:
+                notification_type = "grade_change"
+                title = f"📊 {followed.restaurant_name} grade changed."
+                message = (
+                    f"{followed.restaurant_name} received a new grade: {new_grade} (previously {old_grade}). "
+                    f"Check the inspection details for more information."
+                )
+
+            notifications.append(
+                RestaurantNotification(
+                    followed_restaurant=followed,
+                    notification_type=notification_type,
+                    title=title,
+                    message=message,
+                )
+            )
+
+            # Update the tracked grade
+            followed.last_known_grade = new_grade
+
+        latest_visit = visit_key(latest_inspection)
+        if is_new_inspection:
+            notifications.extend(
+                self.inspection_notifications(followed, [latest_inspection])
+            )
+            # Update the last inspection date
+            followed.last_inspection_date = latest_inspection.INSPECTION_DATE
+
+        for rows in new_visits:
+            if rows[0].INSPECTION_DATE == known_date or (
+                is_new_inspection and visit_key(rows[0]) == latest_visit
+            ):
+                # Known to the follower, or reported above
+                continue
+            notifications.extend(self.inspection_notifications(followed, rows))
+
+        return notifications
+
+    def inspection_notifications(self, followed, rows):
+        """
+        New-inspection and violation notifications for one visit, from its
+        feed ``rows``
+        """
+        notifications = []
+        inspection = rows[0]
+
+        # Check for new inspections
+        if followed.notify_new_inspections:
+            inspection_date_str = (
+                inspection.INSPECTION_DATE.strftime("%B %d, %Y")
+                if inspection.INSPECTION_DATE
+                else "Unknown date"
+            )
+            grade_str = inspection.GRADE or "Pending"
+            violations = inspection.VIOLATION_DESCRIPTION or "No violations reported."
+            message = (
+                f"A new health inspection was completed on {inspection_date_str}. "
+                f"Grade received: {grade_str}. "
+                f"Violations noted: {violations[:120]}... "
+                f"See the inspection details for the full report."
+            )
+            notifications.append(
+                RestaurantNotification(
+                    followed_restaurant=followed,
+                    notification_type="new_inspection",
+                    title=f"🔍 New inspection at {followed.restaurant_name}",
+                    message=message,
+                )
+            )
+
+        # Check for violations if enabled
+        if not followed.notify_violations:
+            return notifications
+        for row in rows:
+            if not row.VIOLATION_CODE:
+                continue
+            # Check if this is a critical violation
+            if row.CRITICAL_FLAG == "Critical":
+                violation_code = row.VIOLATION_CODE or "N/A"
+                violation_desc = row.VIOLATION_DESCRIPTION or "No description."
+                message = (
+                    f"A critical health violation was reported: [Code: {violation_code}] "
+                    f"{violation_desc[:120]}... "
+                    f"This violation is considered critical and may impact health safety."
+                )
+                notifications.append(
+                    RestaurantNotification(
+                        followed_restaurant=followed,
+                        notification_type="violation_added",
+                        title=f"⚠️ Critical violation at {followed.restaurant_name}",
+                        message=message,
+                    )
+                )
+
+            # Check for health outbreak keywords in violation description
+            violation_desc = (row.VIOLATION_DESCRIPTION or "").lower()
+            if any(keyword in violation_desc for keyword in OUTBREAK_KEYWORDS):
+                message = (
+                    f"A potential health outbreak or serious foodborne illness was reported: "
+                    f"{row.VIOLATION_DESCRIPTION[:120]}... "
+                    f"This may indicate a public health risk. Please review the inspection details for more information."
+                )
+                notifications.append(
+                    RestaurantNotification(
+                        followed_restaurant=followed,
+                        notification_type="health_outbreak",
+                        title=f"🚨 Health outbreak alert at {followed.restaurant_name}",
+                        message=message,
+                    )
+                )
+
+        return notifications
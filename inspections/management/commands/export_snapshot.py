@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+from inspections import snapshot
+from inspections.models import RestaurantInspection
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the inspection, summary, visit, violation and rating tables to "
+        "a directory of compressed columnar archives for import_snapshot"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", type=str, help="Snapshot directory")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = snapshot.export_snapshot(
+            connections[router.db_for_write(RestaurantInspection)], options["directory"]
+        )
+        for table, rows in counts.items():
+            self.stdout.write(f"{table}: {rows} rows")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Snapshot written to {options['directory']} in "
+                f"{time.perf_counter() - started:.2f}s"
+            )
+        )
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from inspections import snapshot
+from inspections.models import RestaurantInspection
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace the inspection, summary, visit, violation and rating tables "
+        "with a snapshot written by export_snapshot"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", type=str, help="Snapshot directory")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            counts = snapshot.import_snapshot(
+                connections[router.db_for_write(RestaurantInspection)],
+                options["directory"],
+            )
+        except snapshot.SnapshotError as exc:
+            raise CommandError(str(exc)) from exc
+        for table, rows in counts.items():
+            self.stdout.write(f"{table}: {rows} rows")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Snapshot restored from {options['directory']} in "
+                f"{time.perf_counter() - started:.2f}s"
+            )
+        )
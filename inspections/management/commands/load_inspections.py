@@ -1,97 +1,292 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
-from inspections.models import RestaurantInspection
+import time
+from collections import Counter
+from contextlib import nullcontext
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from inspections import ingest, shadow
+from inspections.models import (
+    DatasetVersion,
+    IngestDelta,
+    IngestRun,
+    RestaurantInspection,
+    RestaurantRating,
+    RestaurantSummary,
+)
+
+
+# Chunks committed together with --fast
+FAST_CHUNKS_PER_TRANSACTION = 20
 
 
 class Command(BaseCommand):
     help = "Load NYC restaurant inspection CSV data"
 
     def add_arguments(self, parser):
-        parser.add_argument("csv_file", type=str, help="Path to the CSV file")
+        parser.add_argument(
+            "csv_file",
+            type=str,
+            help="Path to the CSV file (.gz, .bz2 and .xz are decompressed, - is stdin)",
+        )
         parser.add_argument(
             "--truncate",
             action="store_true",
             help="Delete all existing records before loading",
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Insert only new rows and update changed ones, matching on "
+                "CAMIS, inspection date, violation code and inspection type"
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Parse and convert chunks in this many processes while this "
+                "one splits the file into blocks and writes to the database "
+                "(default: 1, no pool)"
+            ),
+        )
+        parser.add_argument(
+            "--fast",
+            action="store_true",
+            help=(
+                "SQLite bulk-load mode: WAL journal, relaxed sync, large "
+                "cache and transactions"
+            ),
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help=(
+                "Continue the last unfinished load of this file after its "
+                "last committed chunk, in that load's mode"
+            ),
+        )
+        parser.add_argument(
+            "--shadow",
+            action="store_true",
+            help=(
+                "Full reload into staging tables that replace the live ones "
+                "in one short transaction, so the site never serves a "
+                "partial dataset (SQLite only)"
+            ),
+        )
 
     def handle(self, *args, **options):
         csv_file = options["csv_file"]
+        if options["truncate"] and options["incremental"]:
+            raise CommandError("--truncate and --incremental cannot be combined")
+        if options["resume"] and options["truncate"]:
+            raise CommandError("--resume cannot be combined with --truncate")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
 
-        if options["truncate"]:
-            self.stdout.write("Deleting all existing RestaurantInspection records...")
-            RestaurantInspection.objects.all().delete()
-
-        self.stdout.write(f"Loading CSV from {csv_file} in chunks...")
-
-        chunksize = 5000
-        total_inserted = 0
-        total_rows = sum(1 for _ in open(csv_file, encoding="utf-8")) - 1
-        self.stdout.write(f"Total rows in file: {total_rows}")
-
-        for chunk in pd.read_csv(csv_file, chunksize=chunksize, encoding="utf-8"):
-            inspections = []
-
-            for _, row in chunk.iterrows():
-
-                def parse_date(date_val):
-                    if pd.isna(date_val):
-                        return None
-                    try:
-                        return pd.to_datetime(date_val).date()
-                    except (ValueError, TypeError):
-                        return None
-
-                inspections.append(
-                    RestaurantInspection(
-                        CAMIS=row.get("CAMIS"),
-                        DBA=row.get("DBA"),
-                        BORO=row.get("BORO"),
-                        BUILDING=row.get("BUILDING"),
-                        STREET=row.get("STREET"),
-                        ZIPCODE=(
-                            str(row.get("ZIPCODE"))
-                            if pd.notnull(row.get("ZIPCODE"))
-                            else None
-                        ),
-                        PHONE=row.get("PHONE"),
-                        CUISINE_DESCRIPTION=row.get("CUISINE DESCRIPTION"),
-                        INSPECTION_DATE=parse_date(row.get("INSPECTION DATE")),
-                        ACTION=row.get("ACTION"),
-                        VIOLATION_CODE=row.get("VIOLATION CODE"),
-                        VIOLATION_DESCRIPTION=row.get("VIOLATION DESCRIPTION"),
-                        CRITICAL_FLAG=row.get("CRITICAL FLAG"),
-                        SCORE=(
-                            row.get("SCORE") if pd.notnull(row.get("SCORE")) else None
-                        ),
-                        GRADE=row.get("GRADE"),
-                        GRADE_DATE=parse_date(row.get("GRADE DATE")),
-                        RECORD_DATE=parse_date(row.get("RECORD DATE")),
-                        INSPECTION_TYPE=row.get("INSPECTION TYPE"),
-                        Latitude=(
-                            row.get("Latitude")
-                            if pd.notnull(row.get("Latitude"))
-                            else None
-                        ),
-                        Longitude=(
-                            row.get("Longitude")
-                            if pd.notnull(row.get("Longitude"))
-                            else None
-                        ),
-                        Community_Board=row.get("Community Board"),
-                        Council_District=row.get("Council District"),
-                        Census_Tract=row.get("Census Tract"),
-                        BIN=row.get("BIN"),
-                        BBL=row.get("BBL"),
-                        NTA=row.get("NTA"),
-                        Location_Point1=row.get("Location Point1"),
-                    )
+        connection = connections[router.db_for_write(RestaurantInspection)]
+        if options["shadow"]:
+            if options["truncate"] or options["incremental"] or options["resume"]:
+                raise CommandError(
+                    "--shadow is a full reload and cannot be combined with "
+                    "--truncate, --incremental or --resume"
                 )
+            if connection.vendor != "sqlite":
+                raise CommandError("--shadow is only supported on SQLite")
+
+        fingerprint = ingest.fingerprint(csv_file)
+        if options["resume"]:
+            run = IngestRun.resumable(fingerprint)
+            if run is None:
+                raise CommandError(f"No unfinished load of {csv_file} to resume")
+            self.stdout.write(
+                f"Resuming after {run.rows_committed} rows "
+                f"({run.chunks_committed} chunks)..."
+            )
 
-            RestaurantInspection.objects.bulk_create(inspections)
-            total_inserted += len(inspections)
-            pct = (total_inserted / total_rows) * 100
+        # Rows an interrupted load committed come back unchanged from a
+        # rerun and record no deltas, so its deltas are refreshed and
+        # released to notifications with this run
+        interrupted = [
+            earlier
+            for earlier in IngestRun.unfinished(csv_file, fingerprint)
+            if not options["resume"] or earlier.pk != run.pk
+        ]
+        if interrupted:
             self.stdout.write(
-                f"Inserted {total_inserted}/{total_rows} rows ({pct:.2f}%)"
+                f"Taking over {len(interrupted)} interrupted load(s) of {csv_file}"
             )
 
+        # Opened before --truncate so a bad path cannot empty the table
+        with ingest.open_source(csv_file) as (stream, counter):
+            if not options["resume"]:
+                run = IngestRun.objects.create(
+                    source=csv_file[:255],
+                    # Shadow tables are recreated on every run, so a shadow
+                    # load cannot be resumed
+                    fingerprint="" if options["shadow"] else fingerprint,
+                    incremental=options["incremental"],
+                    # A shadow load replaces every row too
+                    truncate=options["truncate"] or options["shadow"],
+                    chunk_size=ingest.CHUNK_SIZE,
+                )
+            if options["shadow"]:
+                self.stdout.write(f"Loading CSV from {csv_file} into shadow tables...")
+                try:
+                    shadow.create_tables(connection)
+                    with shadow.using_shadow_tables(connection):
+                        coordinates = self.load(stream, counter, run, options)
+                    self.swap_in(connection, coordinates)
+                finally:
+                    shadow.drop_tables(connection)
+                # The swapped-in summaries were rebuilt from every row
+                for earlier in interrupted:
+                    earlier.complete()
+                run.complete()
+                self.stdout.write(self.style.SUCCESS("Data loaded successfully!"))
+                return
+
+            if options["truncate"]:
+                self.stdout.write(
+                    "Deleting all existing RestaurantInspection records..."
+                )
+                RestaurantInspection.objects.all().delete()
+
+            self.stdout.write(f"Loading CSV from {csv_file} in chunks...")
+            coordinates = self.load(stream, counter, run, options)
+
+        self.finish(run, coordinates, interrupted)
         self.stdout.write(self.style.SUCCESS("Data loaded successfully!"))
+
+    def finish(self, run, coordinates, interrupted=()):
+        """
+        Refresh what ``run`` changed and mark it complete, along with the
+        ``interrupted`` runs whose work it took over.
+        """
+        # Every chunk recorded its changes; a resumed run includes the
+        # chunks committed before it was interrupted
+        touched_camis = set(
+            IngestDelta.objects.filter(run__in=[run, *interrupted]).values_list(
+                "camis", flat=True
+            )
+        )
+
+        self.stdout.write(f"Refreshing {len(touched_camis)} restaurant summaries...")
+        if run.truncate:
+            RestaurantSummary.rebuild()
+            RestaurantRating.rebuild()
+        else:
+            RestaurantSummary.refresh(touched_camis)
+            RestaurantRating.refresh(touched_camis)
+        RestaurantSummary.set_coordinates(coordinates)
+        for earlier in interrupted:
+            earlier.complete()
+        run.complete()
+
+    def swap_in(self, connection, coordinates):
+        """
+        Build summaries, ratings and indexes on the loaded shadow tables and
+        swap them in for the live ones.
+        """
+        self.stdout.write("Building summaries and search tables in shadow tables...")
+        with shadow.using_shadow_tables(connection):
+            RestaurantSummary.rebuild()
+            RestaurantRating.rebuild()
+            RestaurantSummary.set_coordinates(coordinates)
+        indexes = shadow.build_indexes(connection)
+
+        started = time.perf_counter()
+        shadow.swap(connection, indexes)
+        self.stdout.write(
+            f"Swapped in the new tables in {time.perf_counter() - started:.3f}s"
+        )
+        DatasetVersion.bump()
+
+    def load(self, stream, counter, run, options):
+        """
+        Stream the CSV into RestaurantInspection in one pass, checkpointing
+        ``run`` with every commit. Returns the coordinates found in the file.
+        """
+        coordinates = {}
+        blocks = ingest.read_blocks(stream, chunksize=run.chunk_size)
+        # Committed chunks are parsed again only for their coordinates
+        for block in islice(blocks, run.chunks_committed):
+            coordinates.update(ingest.coordinates(ingest.parse_block(block)))
+
+        # Blocks are parsed and converted in worker processes when
+        # --workers > 1, but come back in file order and are all written
+        # from this process
+        prepared = ingest.prepared_chunks(blocks, workers=options["workers"])
+        coordinates.update(self.write_prepared(prepared, counter, run, options["fast"]))
+        return coordinates
+
+    def write_prepared(self, prepared, counter, run, fast=False):
+        """
+        Write ``(rows, coordinates)`` chunks, checkpointing ``run`` at
+        ``counter.position`` with every commit. Returns the coordinates of
+        the written chunks.
+        """
+        coordinates = {}
+        if fast:
+            bulk_load = ingest.sqlite_bulk_load(
+                connections[router.db_for_write(RestaurantInspection)]
+            )
+            per_transaction = FAST_CHUNKS_PER_TRANSACTION
+        else:
+            bulk_load = nullcontext()
+            per_transaction = 1
+
+        with bulk_load:
+            for group in ingest.batched(prepared, per_transaction):
+                inserted, updated, created, rows = Counter(), Counter(), set(), 0
+                # The group, its deltas and the checkpoint commit together
+                with transaction.atomic():
+                    for chunk_rows, chunk_coordinates in group:
+                        inspections = ingest.build_from_rows(chunk_rows)
+                        chunk_inserted, chunk_updated, chunk_created = self.write_chunk(
+                            inspections, run.incremental
+                        )
+                        inserted.update(chunk_inserted)
+                        updated.update(chunk_updated)
+                        created |= chunk_created
+                        rows += len(inspections)
+                    if run.truncate:
+                        # A full reload recreates every visit; none is news
+                        created = set()
+                    # Downstream jobs pick up what changed from the delta table
+                    IngestDelta.record(
+                        inserted, updated, created, source=run.source, run=run
+                    )
+                    run.checkpoint(
+                        chunks=len(group),
+                        rows=rows,
+                        inserted=sum(inserted.values()),
+                        updated=sum(updated.values()),
+                        byte_offset=counter.position,
+                    )
+                for _, chunk_coordinates in group:
+                    # Coordinates live on the restaurant summary
+                    coordinates.update(chunk_coordinates)
+                self.stdout.write(
+                    f"Inserted {run.rows_inserted}, updated {run.rows_updated} "
+                    f"of {run.rows_committed} rows ({self.progress(counter)})"
+                )
+        return coordinates
+
+    def write_chunk(self, inspections, incremental):
+        """
+        Write one chunk; returns ``(inserted, updated)`` Counters by visit
+        and the set of visits created
+        """
+        if incremental:
+            return ingest.upsert_inspections(inspections)
+        return RestaurantInspection.store(inspections)
+
+    def progress(self, counter):
+        """Share of the input read so far, by (compressed) byte offset"""
+        if counter.size:
+            return f"{counter.position / counter.size:.2%}"
+        return f"{counter.position / 2**20:.1f} MB read"
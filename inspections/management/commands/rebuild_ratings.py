@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from inspections.models import RestaurantRating
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the stored restaurant ratings. Run nightly with --stale so "
+        "ratings follow the moving three-year window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale",
+            action="store_true",
+            help="Only recompute ratings whose three-year window has moved",
+        )
+
+    def handle(self, *args, **options):
+        if options["stale"]:
+            self.stdout.write("Refreshing stale restaurant ratings...")
+            count = RestaurantRating.refresh_stale()
+        else:
+            self.stdout.write("Rebuilding all restaurant ratings...")
+            count = RestaurantRating.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Updated {count} restaurant ratings"))
@@ -0,0 +1,117 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+def populate_summaries(apps, schema_editor):
+    RestaurantInspection = apps.get_model("inspections", "RestaurantInspection")
+    RestaurantSummary = apps.get_model("inspections", "RestaurantSummary")
+
+    rows = (
+        RestaurantInspection.objects.order_by("CAMIS", "-INSPECTION_DATE", "-id")
+        .values(
+            "CAMIS",
+            "DBA",
+            "BORO",
+            "BUILDING",
+            "STREET",
+            "ZIPCODE",
+            "PHONE",
+            "CUISINE_DESCRIPTION",
+            "INSPECTION_DATE",
+            "GRADE",
+            "SCORE",
+        )
+        .iterator(chunk_size=5000)
+    )
+    batch = []
+    summary = None
+    visit_dates = set()
+    for row in rows:
+        if summary is None or summary.CAMIS != row["CAMIS"]:
+            if summary is not None:
+                summary.inspection_count = len(visit_dates)
+                batch.append(summary)
+                if len(batch) >= 1000:
+                    RestaurantSummary.objects.bulk_create(batch)
+                    batch = []
+            summary = RestaurantSummary(
+                CAMIS=row["CAMIS"],
+                DBA=row["DBA"],
+                BORO=row["BORO"],
+                BUILDING=row["BUILDING"],
+                STREET=row["STREET"],
+                ZIPCODE=row["ZIPCODE"],
+                PHONE=row["PHONE"],
+                CUISINE_DESCRIPTION=row["CUISINE_DESCRIPTION"],
+                latest_inspection_date=row["INSPECTION_DATE"],
+            )
+            visit_dates = set()
+        if row["INSPECTION_DATE"] is not None:
+            visit_dates.add(row["INSPECTION_DATE"])
+        if row["INSPECTION_DATE"] == summary.latest_inspection_date:
+            summary.latest_grade = summary.latest_grade or row["GRADE"]
+            if summary.latest_score is None:
+                summary.latest_score = row["SCORE"]
+    if summary is not None:
+        summary.inspection_count = len(visit_dates)
+        batch.append(summary)
+    RestaurantSummary.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0010_ownerrestaurant"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RestaurantSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("CAMIS", models.BigIntegerField(unique=True)),
+                ("DBA", models.CharField(blank=True, max_length=255, null=True)),
+                ("BORO", models.CharField(blank=True, max_length=50, null=True)),
+                ("BUILDING", models.CharField(blank=True, max_length=50, null=True)),
+                ("STREET", models.CharField(blank=True, max_length=255, null=True)),
+                ("ZIPCODE", models.FloatField(blank=True, null=True)),
+                ("PHONE", models.CharField(blank=True, max_length=20, null=True)),
+                (
+                    "CUISINE_DESCRIPTION",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("latest_grade", models.CharField(blank=True, max_length=5, null=True)),
+                ("latest_score", models.FloatField(blank=True, null=True)),
+                ("latest_inspection_date", models.DateField(blank=True, null=True)),
+                ("inspection_count", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["BORO", "DBA"], name="inspections_BORO_97f6c3_idx"
+                    ),
+                    models.Index(
+                        fields=["ZIPCODE"], name="inspections_ZIPCODE_424194_idx"
+                    ),
+                    models.Index(
+                        fields=["CUISINE_DESCRIPTION"],
+                        name="inspections_CUISINE_318220_idx",
+                    ),
+                    models.Index(
+                        fields=["latest_inspection_date"],
+                        name="inspections_latest__79cf57_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
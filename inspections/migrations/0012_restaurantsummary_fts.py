@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from inspections import fts
+
+
+def create_fts_index(apps, schema_editor):
+    if fts.create_index(schema_editor.connection):
+        fts.rebuild_index(schema_editor.connection)
+
+
+def drop_fts_index(apps, schema_editor):
+    fts.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0011_restaurantsummary"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0013_datasetversion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="restaurantinspection",
+            index=models.Index(
+                fields=["CAMIS", "INSPECTION_DATE"], name="inspections_CAMIS_48e100_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="restaurantinspection",
+            index=models.Index(
+                fields=["BORO", "CAMIS"], name="inspections_BORO_c6b6c5_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="restaurantinspection",
+            index=models.Index(
+                fields=["ZIPCODE", "CAMIS"], name="inspections_ZIPCODE_d9bcac_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="restaurantinspection",
+            index=models.Index(
+                fields=["CUISINE_DESCRIPTION", "CAMIS"],
+                name="inspections_CUISINE_a5e21f_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="restaurantinspection",
+            index=models.Index(
+                fields=["GRADE", "INSPECTION_DATE"], name="inspections_GRADE_79d617_idx"
+            ),
+        ),
+    ]
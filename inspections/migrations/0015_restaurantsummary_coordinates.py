@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:21
+
+from django.db import migrations, models
+
+from inspections import geo
+
+
+def create_spatial_index(apps, schema_editor):
+    if geo.create_index(schema_editor.connection):
+        geo.rebuild_index(schema_editor.connection)
+
+
+def drop_spatial_index(apps, schema_editor):
+    geo.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0014_restaurantinspection_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurantsummary",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="restaurantsummary",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="restaurantsummary",
+            index=models.Index(
+                fields=["latitude", "longitude"], name="inspections_latitud_186e2b_idx"
+            ),
+        ),
+        migrations.RunPython(create_spatial_index, drop_spatial_index),
+    ]
@@ -0,0 +1,134 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:26
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min, Q
+
+# The rating rule as of this migration (RestaurantInspection.RATING_*)
+RATING_GRADES = {"A": 5, "B": 4, "C": 3}
+RATING_WINDOW_DAYS = 1095
+RATING_BATCH_SIZE = 500
+
+
+def rate(row, window):
+    grade_counts = {
+        grade: row[f"{window}_{grade}"]
+        for grade in RATING_GRADES
+        if row[f"{window}_{grade}"]
+    }
+    inspection_count = sum(grade_counts.values())
+    avg_rating = (
+        sum(RATING_GRADES[grade] * count for grade, count in grade_counts.items())
+        / inspection_count
+    )
+    if avg_rating >= 4.5:
+        description = f"Excellent (mostly A grades, {inspection_count} inspections)"
+    elif avg_rating >= 3.5:
+        description = f"Good (mostly A-B grades, {inspection_count} inspections)"
+    elif avg_rating >= 2.5:
+        description = f"Fair (mixed grades, {inspection_count} inspections)"
+    else:
+        description = f"Needs improvement ({inspection_count} inspections)"
+    return {
+        "stars": round(avg_rating, 1),
+        # Ties go to the better grade
+        "grade": max(grade_counts, key=grade_counts.get),
+        "inspection_count": inspection_count,
+        "latest_inspection": row[f"{window}_latest"],
+        "avg_score": row[f"{window}_avg_score"] or 0,
+        "description": description,
+    }
+
+
+def populate_ratings(apps, schema_editor):
+    """
+    Rate every restaurant in the inspection table, as
+    RestaurantRating.rebuild() does: graded rows of the last three years,
+    or of all time for restaurants without recent ones
+    """
+    RestaurantInspection = apps.get_model("inspections", "RestaurantInspection")
+    RestaurantRating = apps.get_model("inspections", "RestaurantRating")
+
+    cutoff_date = datetime.now().date() - timedelta(days=RATING_WINDOW_DAYS)
+    recent = Q(INSPECTION_DATE__gte=cutoff_date)
+    aggregates = {"recent_earliest": Min("INSPECTION_DATE", filter=recent)}
+    for window, window_filter in (("recent", recent), ("all", Q())):
+        for grade in RATING_GRADES:
+            aggregates[f"{window}_{grade}"] = Count(
+                "id", filter=window_filter & Q(GRADE=grade)
+            )
+        aggregates[f"{window}_latest"] = Max("INSPECTION_DATE", filter=window_filter)
+        aggregates[f"{window}_avg_score"] = Avg("SCORE", filter=window_filter)
+
+    camis_values = sorted(
+        set(RestaurantInspection.objects.values_list("CAMIS", flat=True))
+    )
+    for start in range(0, len(camis_values), RATING_BATCH_SIZE):
+        batch = camis_values[start : start + RATING_BATCH_SIZE]
+        rows = (
+            RestaurantInspection.objects.filter(
+                CAMIS__in=batch, GRADE__in=list(RATING_GRADES)
+            )
+            .exclude(INSPECTION_DATE__year=1900)  # Exclude invalid dates
+            .values("CAMIS")
+            .order_by()
+            .annotate(**aggregates)
+        )
+        rows = {row["CAMIS"]: row for row in rows}
+        ratings = []
+        for camis in batch:
+            row = rows.get(camis)
+            if row is None:
+                ratings.append(
+                    RestaurantRating(
+                        camis=camis,
+                        description="No graded inspections available",
+                    )
+                )
+            elif row["recent_earliest"] is not None:
+                stale_on = row["recent_earliest"] + timedelta(
+                    days=RATING_WINDOW_DAYS + 1
+                )
+                ratings.append(
+                    RestaurantRating(
+                        camis=camis, stale_on=stale_on, **rate(row, "recent")
+                    )
+                )
+            else:
+                ratings.append(RestaurantRating(camis=camis, **rate(row, "all")))
+        RestaurantRating.objects.bulk_create(ratings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0015_restaurantsummary_coordinates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RestaurantRating",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("camis", models.BigIntegerField(unique=True)),
+                ("stars", models.FloatField(default=0)),
+                ("grade", models.CharField(default="N/A", max_length=5)),
+                ("inspection_count", models.IntegerField(default=0)),
+                ("latest_inspection", models.DateField(blank=True, null=True)),
+                ("avg_score", models.FloatField(blank=True, null=True)),
+                ("description", models.CharField(max_length=255)),
+                ("stale_on", models.DateField(blank=True, db_index=True, null=True)),
+                ("computed_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,152 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from inspections import visits
+
+BATCH_SIZE = 500
+
+
+def populate_visits(apps, schema_editor):
+    RestaurantInspection = apps.get_model("inspections", "RestaurantInspection")
+    RestaurantSummary = apps.get_model("inspections", "RestaurantSummary")
+    Inspection = apps.get_model("inspections", "Inspection")
+    Violation = apps.get_model("inspections", "Violation")
+
+    camis_values = sorted(
+        RestaurantInspection.objects.values_list("CAMIS", flat=True).distinct()
+    )
+    for start in range(0, len(camis_values), BATCH_SIZE):
+        batch = camis_values[start : start + BATCH_SIZE]
+        rows = list(
+            RestaurantInspection.objects.filter(CAMIS__in=batch)
+            .order_by("CAMIS", "-INSPECTION_DATE", "-id")
+            .values(
+                "Community_Board",
+                "Council_District",
+                "Census_Tract",
+                *visits.FEED_FIELDS,
+            )
+        )
+
+        grouped = visits.group_visits(rows)
+        inspections = Inspection.objects.bulk_create(
+            Inspection(**visit) for visit, _ in grouped
+        )
+        Violation.objects.bulk_create(
+            Violation(inspection=inspection, **violation)
+            for inspection, (_, violations) in zip(inspections, grouped)
+            for violation in violations
+        )
+
+        # Census fields of the newest row per restaurant
+        census = {}
+        for row in rows:
+            census.setdefault(row["CAMIS"], row)
+        summaries = list(RestaurantSummary.objects.filter(CAMIS__in=batch))
+        for summary in summaries:
+            row = census[summary.CAMIS]
+            summary.Community_Board = row["Community_Board"]
+            summary.Council_District = row["Council_District"]
+            summary.Census_Tract = row["Census_Tract"]
+        RestaurantSummary.objects.bulk_update(
+            summaries, ["Community_Board", "Council_District", "Census_Tract"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0016_restaurantrating"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurantsummary",
+            name="Census_Tract",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="restaurantsummary",
+            name="Community_Board",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="restaurantsummary",
+            name="Council_District",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="Inspection",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("camis", models.BigIntegerField()),
+                ("inspection_date", models.DateField(blank=True, null=True)),
+                (
+                    "inspection_type",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("action", models.TextField(blank=True, null=True)),
+                ("score", models.FloatField(blank=True, null=True)),
+                ("grade", models.CharField(blank=True, max_length=5, null=True)),
+                ("grade_date", models.DateField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-inspection_date"],
+                "indexes": [
+                    models.Index(
+                        fields=["camis", "inspection_date"],
+                        name="inspections_camis_0ee6ba_idx",
+                    ),
+                    models.Index(
+                        fields=["grade", "inspection_date"],
+                        name="inspections_grade_568b17_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("camis", "inspection_date", "inspection_type"),
+                        name="unique_inspection_visit",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="Violation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.CharField(blank=True, max_length=20, null=True)),
+                ("description", models.TextField(blank=True, null=True)),
+                (
+                    "critical_flag",
+                    models.CharField(blank=True, max_length=50, null=True),
+                ),
+                (
+                    "inspection",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="violations",
+                        to="inspections.inspection",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(populate_visits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0017_inspection_violation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestDelta",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("camis", models.BigIntegerField(db_index=True)),
+                ("inserted", models.IntegerField(default=0)),
+                ("updated", models.IntegerField(default=0)),
+                ("source", models.CharField(blank=True, max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
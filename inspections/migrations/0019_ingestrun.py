@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0018_ingestdelta"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(blank=True, max_length=255)),
+                (
+                    "fingerprint",
+                    models.CharField(blank=True, db_index=True, max_length=64),
+                ),
+                ("incremental", models.BooleanField(default=False)),
+                ("truncate", models.BooleanField(default=False)),
+                ("chunk_size", models.IntegerField()),
+                ("chunks_committed", models.IntegerField(default=0)),
+                ("rows_committed", models.IntegerField(default=0)),
+                ("rows_inserted", models.IntegerField(default=0)),
+                ("rows_updated", models.IntegerField(default=0)),
+                ("byte_offset", models.BigIntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="ingestdelta",
+            name="run",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="deltas",
+                to="inspections.ingestrun",
+            ),
+        ),
+    ]
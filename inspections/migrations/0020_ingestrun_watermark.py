@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0019_ingestrun"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestrun",
+            name="watermark",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0020_ingestrun_watermark"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestdelta",
+            name="consumed_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
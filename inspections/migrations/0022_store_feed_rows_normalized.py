@@ -0,0 +1,364 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+RESTAURANT_FIELDS = [
+    "DBA",
+    "BORO",
+    "BUILDING",
+    "STREET",
+    "ZIPCODE",
+    "PHONE",
+    "CUISINE_DESCRIPTION",
+    "Community_Board",
+    "Council_District",
+    "Census_Tract",
+]
+
+# The feed mapping and view as of this migration, copied from
+# inspections.visits so later changes there don't change what it does
+FEED_FIELDS = (
+    "CAMIS",
+    "INSPECTION_DATE",
+    "INSPECTION_TYPE",
+    "ACTION",
+    "SCORE",
+    "GRADE",
+    "GRADE_DATE",
+    "VIOLATION_CODE",
+    "VIOLATION_DESCRIPTION",
+    "CRITICAL_FLAG",
+)
+
+VISIT_COLUMNS = {
+    "action": "ACTION",
+    "score": "SCORE",
+    "grade": "GRADE",
+    "grade_date": "GRADE_DATE",
+}
+
+VIOLATION_COLUMNS = {
+    "code": "VIOLATION_CODE",
+    "description": "VIOLATION_DESCRIPTION",
+    "critical_flag": "CRITICAL_FLAG",
+}
+
+VIEW = "inspections_restaurantinspection"
+
+VIEW_SQL = f"""
+CREATE VIEW IF NOT EXISTS "{VIEW}" AS
+SELECT
+    violation."id",
+    visit."camis" AS "CAMIS",
+    restaurant."DBA",
+    restaurant."BORO",
+    restaurant."BUILDING",
+    restaurant."STREET",
+    restaurant."ZIPCODE",
+    restaurant."PHONE",
+    restaurant."CUISINE_DESCRIPTION",
+    visit."inspection_date" AS "INSPECTION_DATE",
+    visit."action" AS "ACTION",
+    violation."code" AS "VIOLATION_CODE",
+    violation."description" AS "VIOLATION_DESCRIPTION",
+    violation."critical_flag" AS "CRITICAL_FLAG",
+    visit."score" AS "SCORE",
+    visit."grade" AS "GRADE",
+    visit."grade_date" AS "GRADE_DATE",
+    visit."inspection_type" AS "INSPECTION_TYPE",
+    restaurant."Community_Board",
+    restaurant."Council_District",
+    restaurant."Census_Tract"
+FROM "inspections_violation" violation
+INNER JOIN "inspections_inspection" visit
+    ON visit."id" = violation."inspection_id"
+INNER JOIN "inspections_restaurantsummary" restaurant
+    ON restaurant."CAMIS" = visit."camis"
+"""
+
+
+def link_owners_to_summaries(apps, schema_editor):
+    OwnerRestaurant = apps.get_model("inspections", "OwnerRestaurant")
+    RestaurantSummary = apps.get_model("inspections", "RestaurantSummary")
+
+    seen, stale = set(), []
+    for owner in OwnerRestaurant.objects.select_related("restaurant").order_by("id"):
+        summary_id = (
+            RestaurantSummary.objects.filter(CAMIS=owner.restaurant.CAMIS)
+            .values_list("id", flat=True)
+            .first()
+        )
+        # Links to two rows of one restaurant become one link
+        if summary_id is None or (owner.user_id, summary_id) in seen:
+            stale.append(owner.id)
+            continue
+        seen.add((owner.user_id, summary_id))
+        OwnerRestaurant.objects.filter(id=owner.id).update(summary_id=summary_id)
+    OwnerRestaurant.objects.filter(id__in=stale).delete()
+
+
+def link_owners_to_rows(apps, schema_editor):
+    """
+    Point owner links back at a feed row of their restaurant, its first
+    one. Links to restaurants without rows are removed.
+    """
+    OwnerRestaurant = apps.get_model("inspections", "OwnerRestaurant")
+    RestaurantInspection = apps.get_model("inspections", "RestaurantInspection")
+
+    stale = []
+    for owner in OwnerRestaurant.objects.select_related("summary").order_by("id"):
+        row_id = None
+        if owner.summary is not None:
+            row_id = (
+                RestaurantInspection.objects.filter(CAMIS=owner.summary.CAMIS)
+                .order_by("id")
+                .values_list("id", flat=True)
+                .first()
+            )
+        if row_id is None:
+            stale.append(owner.id)
+            continue
+        OwnerRestaurant.objects.filter(id=owner.id).update(restaurant_id=row_id)
+    OwnerRestaurant.objects.filter(id__in=stale).delete()
+
+
+def split_feed_rows(apps, schema_editor):
+    """
+    Store every RestaurantInspection row as a Violation row with the same
+    id, under its visit, and the newest row's restaurant columns on the
+    summary row
+    """
+    RestaurantInspection = apps.get_model("inspections", "RestaurantInspection")
+    RestaurantSummary = apps.get_model("inspections", "RestaurantSummary")
+    Inspection = apps.get_model("inspections", "Inspection")
+    Violation = apps.get_model("inspections", "Violation")
+
+    # Rebuilt from the rows, which now also cover visits without violations
+    Violation.objects.all().delete()
+    Inspection.objects.all().delete()
+    camis_values = sorted(
+        RestaurantInspection.objects.values_list("CAMIS", flat=True).distinct()
+    )
+    for start in range(0, len(camis_values), BATCH_SIZE):
+        batch = camis_values[start : start + BATCH_SIZE]
+        rows = list(
+            RestaurantInspection.objects.filter(CAMIS__in=batch)
+            .order_by("CAMIS", "-INSPECTION_DATE", "-id")
+            .values("id", *RESTAURANT_FIELDS, *FEED_FIELDS)
+        )
+
+        newest = {}
+        for row in rows:
+            newest.setdefault(row["CAMIS"], row)
+        RestaurantSummary.objects.bulk_create(
+            [
+                RestaurantSummary(
+                    CAMIS=camis, **{field: row[field] for field in RESTAURANT_FIELDS}
+                )
+                for camis, row in newest.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["CAMIS"],
+            update_fields=RESTAURANT_FIELDS,
+        )
+
+        stored = {}
+        for row in rows:
+            key = (row["CAMIS"], row["INSPECTION_DATE"], row["INSPECTION_TYPE"])
+            visit = stored.get(key)
+            if visit is None:
+                stored[key] = Inspection(
+                    camis=row["CAMIS"],
+                    inspection_date=row["INSPECTION_DATE"],
+                    inspection_type=row["INSPECTION_TYPE"],
+                    **{field: row[column] for field, column in VISIT_COLUMNS.items()},
+                )
+                continue
+            for field, column in VISIT_COLUMNS.items():
+                if getattr(visit, field) in (None, "") and row[column] not in (
+                    None,
+                    "",
+                ):
+                    setattr(visit, field, row[column])
+        Inspection.objects.bulk_create(stored.values())
+        Violation.objects.bulk_create(
+            Violation(
+                id=row["id"],
+                inspection=stored[
+                    (row["CAMIS"], row["INSPECTION_DATE"], row["INSPECTION_TYPE"])
+                ],
+                **{field: row[column] for field, column in VIOLATION_COLUMNS.items()},
+            )
+            for row in rows
+        )
+
+
+def join_feed_rows(apps, schema_editor):
+    """
+    Rebuild the flat RestaurantInspection rows, one for every Violation row
+    and with its id, from the violation, its visit and its summary row
+    """
+    RestaurantInspection = apps.get_model("inspections", "RestaurantInspection")
+    RestaurantSummary = apps.get_model("inspections", "RestaurantSummary")
+    Inspection = apps.get_model("inspections", "Inspection")
+    Violation = apps.get_model("inspections", "Violation")
+
+    camis_values = sorted(set(Inspection.objects.values_list("camis", flat=True)))
+    for start in range(0, len(camis_values), BATCH_SIZE):
+        batch = camis_values[start : start + BATCH_SIZE]
+        restaurants = {
+            row["CAMIS"]: row
+            for row in RestaurantSummary.objects.filter(CAMIS__in=batch).values(
+                "CAMIS", *RESTAURANT_FIELDS
+            )
+        }
+        rows = []
+        for violation in (
+            Violation.objects.filter(inspection__camis__in=batch)
+            .select_related("inspection")
+            .order_by("id")
+        ):
+            visit = violation.inspection
+            restaurant = restaurants.get(visit.camis, {})
+            rows.append(
+                RestaurantInspection(
+                    id=violation.id,
+                    CAMIS=visit.camis,
+                    INSPECTION_DATE=visit.inspection_date,
+                    INSPECTION_TYPE=visit.inspection_type,
+                    **{field: restaurant.get(field) for field in RESTAURANT_FIELDS},
+                    **{
+                        column: getattr(visit, field)
+                        for field, column in VISIT_COLUMNS.items()
+                    },
+                    **{
+                        column: getattr(violation, field)
+                        for field, column in VIOLATION_COLUMNS.items()
+                    },
+                )
+            )
+        RestaurantInspection.objects.bulk_create(rows)
+
+
+def create_view(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(VIEW_SQL)
+
+
+def drop_view(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP VIEW IF EXISTS "{VIEW}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0021_ingestdelta_consumed_at"),
+    ]
+
+    operations = [
+        # Owner links point at the restaurant instead of one of its rows
+        migrations.AddField(
+            model_name="ownerrestaurant",
+            name="summary",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="inspections.restaurantsummary",
+            ),
+        ),
+        # Nullable while the links move, so that rolling back can re-add it
+        migrations.AlterField(
+            model_name="ownerrestaurant",
+            name="restaurant",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="inspections.restaurantinspection",
+            ),
+        ),
+        migrations.RunPython(link_owners_to_summaries, link_owners_to_rows),
+        migrations.AlterUniqueTogether(
+            name="ownerrestaurant",
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name="ownerrestaurant",
+            name="restaurant",
+        ),
+        migrations.RenameField(
+            model_name="ownerrestaurant",
+            old_name="summary",
+            new_name="restaurant",
+        ),
+        migrations.AlterField(
+            model_name="ownerrestaurant",
+            name="restaurant",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to="inspections.restaurantsummary",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="ownerrestaurant",
+            unique_together={("user", "restaurant")},
+        ),
+        # The feed rows move into the summary, visit and violation tables and
+        # come back as a view
+        migrations.RunPython(split_feed_rows, join_feed_rows),
+        migrations.DeleteModel(
+            name="RestaurantInspection",
+        ),
+        migrations.CreateModel(
+            name="RestaurantInspection",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("CAMIS", models.BigIntegerField()),
+                ("DBA", models.CharField(blank=True, max_length=255, null=True)),
+                ("BORO", models.CharField(blank=True, max_length=50, null=True)),
+                ("BUILDING", models.CharField(blank=True, max_length=50, null=True)),
+                ("STREET", models.CharField(blank=True, max_length=255, null=True)),
+                ("ZIPCODE", models.FloatField(blank=True, null=True)),
+                ("PHONE", models.CharField(blank=True, max_length=20, null=True)),
+                (
+                    "CUISINE_DESCRIPTION",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("INSPECTION_DATE", models.DateField(blank=True, null=True)),
+                ("ACTION", models.TextField(blank=True, null=True)),
+                (
+                    "VIOLATION_CODE",
+                    models.CharField(blank=True, max_length=20, null=True),
+                ),
+                ("VIOLATION_DESCRIPTION", models.TextField(blank=True, null=True)),
+                (
+                    "CRITICAL_FLAG",
+                    models.CharField(blank=True, max_length=50, null=True),
+                ),
+                ("SCORE", models.FloatField(blank=True, null=True)),
+                ("GRADE", models.CharField(blank=True, max_length=5, null=True)),
+                ("GRADE_DATE", models.DateField(blank=True, null=True)),
+                (
+                    "INSPECTION_TYPE",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("Community_Board", models.FloatField(blank=True, null=True)),
+                ("Council_District", models.FloatField(blank=True, null=True)),
+                ("Census_Tract", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "db_table": "inspections_restaurantinspection",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_view, drop_view),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inspections", "0022_store_feed_rows_normalized"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestdelta",
+            name="inspection_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ingestdelta",
+            name="inspection_type",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="ingestdelta",
+            name="new_visit",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -3,7 +3,7 @@ from django.db import models
 
 class OwnerRestaurant(models.Model):
     user = models.ForeignKey("auth.User", on_delete=models.CASCADE)
-    restaurant = models.ForeignKey("RestaurantInspection", on_delete=models.CASCADE)
+    restaurant = models.ForeignKey("RestaurantSummary", on_delete=models.CASCADE)
     date_added = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -32,12 +32,55 @@ class RestaurantMonthlySales(models.Model):
         return f"{self.camis} - {self.month.strftime('%Y-%m')}: ${self.sales:,.2f}"
 
 
-from django.db import models
-from django.db.models import Avg
+from django.db import models, router
+from django.db.models import Avg, Count, F, Max, Min, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from collections import Counter, defaultdict
+from operator import itemgetter
 from datetime import datetime, timedelta
+import uuid
+
+from inspections import visits
+
+# Sorts visits without a date before every dated one
+NO_DATE = datetime.min.date()
+
+
+def visit_key(row):
+    """The natural key of a feed row's visit"""
+    return (row.CAMIS, row.INSPECTION_DATE, row.INSPECTION_TYPE)
+
+
+class RestaurantInspectionQuerySet(models.QuerySet):
+    """
+    Rows of the feed-shaped view. The view cannot be written: new rows are
+    split into the stored tables by RestaurantInspection.store(), and
+    deleting rows deletes their Violation rows.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        self.model.store(self.model.clean_values(objs))
+        return objs
+
+    def delete(self):
+        """
+        Delete the rows, and the visits left without any. Restaurants left
+        without visits lose their summary row on the next refresh().
+        """
+        deleted, _ = Violation.objects.filter(id__in=self.values("id")).delete()
+        Inspection.objects.filter(violations__isnull=True).delete()
+        return deleted, {self.model._meta.label: deleted}
 
 
 class RestaurantInspection(models.Model):
+    """
+    One row of the inspection feed. Rows are not stored in this shape: the
+    model reads a view (see visits.py) that joins every Violation row to
+    its Inspection visit and its restaurant's RestaurantSummary.
+    """
+
     CAMIS = models.BigIntegerField()
     DBA = models.CharField(max_length=255, null=True, blank=True)
     BORO = models.CharField(max_length=50, null=True, blank=True)
@@ -69,58 +112,311 @@ class RestaurantInspection(models.Model):
         null=True, blank=True
     )  # Changed to match database structure
 
+    objects = RestaurantInspectionQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = visits.VIEW
+
     def __str__(self):
         return f"{self.DBA} ({self.CAMIS})"
 
+    def save(self, *args, **kwargs):
+        # A saved row updates its own Violation row, a new one adds one
+        self.store(self.clean_values([self]), match=self.pk is not None)
+        # Bulk loads bypass save() and refresh derived tables themselves
+        RestaurantSummary.refresh([self.CAMIS])
+        RestaurantRating.refresh([self.CAMIS])
+
+    def delete(self, *args, **kwargs):
+        result = type(self).objects.filter(pk=self.pk).delete()
+        RestaurantSummary.refresh([self.CAMIS])
+        RestaurantRating.refresh([self.CAMIS])
+        return result
+
+    RATING_GRADES = {"A": 5, "B": 4, "C": 3}
+    RATING_WINDOW_DAYS = 1095
+    RATING_BATCH_SIZE = 500
+    STORE_BATCH_SIZE = 500
+
+    @classmethod
+    def clean_values(cls, rows):
+        """
+        Convert the field values of ``rows`` in place (date strings and
+        the like) so store() compares them with stored ones. The loader
+        builds its rows with converted values already.
+        """
+        fields = [field for field in cls._meta.concrete_fields if not field.primary_key]
+        for row in rows:
+            for field in fields:
+                setattr(
+                    row, field.attname, field.to_python(getattr(row, field.attname))
+                )
+        return rows
+
+    @classmethod
+    def store(cls, rows, match=False):
+        """
+        Write feed rows (instances of this model) to the stored tables, in
+        batches of STORE_BATCH_SIZE restaurants. Each row's violation
+        columns get a Violation row of their own, whose id becomes the
+        row's pk. Its visit columns go to the Inspection with the same
+        CAMIS, date and type, created on first sight; later rows overwrite
+        the attributes they do not leave blank. Its restaurant columns go
+        to the RestaurantSummary row, unless the restaurant has a later
+        stored visit than the row's.
+
+        With ``match``, a row that is already stored, by pk or else by
+        CAMIS, date, type and violation code, updates that Violation row
+        instead of adding one. Returns ``(inserted, updated, created)``:
+        Counters of rows by the natural key of their visit, where a row
+        counts as updated when anything it shows changed, and the set of
+        visits that were not stored before.
+        """
+        by_camis = defaultdict(list)
+        for row in rows:
+            by_camis[row.CAMIS].append(row)
+        camis_values = sorted(by_camis)
+        inserted, updated, created = Counter(), Counter(), set()
+        for start in range(0, len(camis_values), cls.STORE_BATCH_SIZE):
+            batch = camis_values[start : start + cls.STORE_BATCH_SIZE]
+            batch_inserted, batch_updated, batch_created = cls._store_batch(
+                batch, [row for camis in batch for row in by_camis[camis]], match
+            )
+            inserted.update(batch_inserted)
+            updated.update(batch_updated)
+            created |= batch_created
+        return inserted, updated, created
+
+    @classmethod
+    def _store_batch(cls, batch, rows, match):
+        stored_visits = {
+            visit.natural_key(): visit
+            for visit in Inspection.objects.filter(camis__in=batch)
+        }
+
+        stored_rows, by_id, last_rows = defaultdict(list), {}, {}
+        if match:
+            visit_keys = {visit.id: key for key, visit in stored_visits.items()}
+            for violation in Violation.objects.filter(
+                inspection__camis__in=batch
+            ).order_by("id"):
+                violation.key = (*visit_keys[violation.inspection_id], violation.code)
+                stored_rows[violation.key].append(violation)
+                by_id[violation.id] = violation
+                last_rows[visit_keys[violation.inspection_id]] = violation.id
+
+        matches, row_values = [], []
+        for row in rows:
+            values = {
+                field: getattr(row, column)
+                for field, column in visits.VIOLATION_COLUMNS.items()
+            }
+            current = by_id.pop(row.pk, None)
+            if current is not None:
+                stored_rows[current.key].remove(current)
+            elif candidates := stored_rows[visit_key(row) + (row.VIOLATION_CODE,)]:
+                # Repeated keys pair up with an identical stored row first,
+                # then with stored rows in order, so a reload pairs them the
+                # same way whichever chunks they fall in.
+                current = next(
+                    (
+                        candidate
+                        for candidate in candidates
+                        if all(
+                            getattr(candidate, field) == value
+                            for field, value in values.items()
+                        )
+                    ),
+                    candidates[0],
+                )
+                candidates.remove(current)
+                del by_id[current.id]
+            matches.append(current)
+            row_values.append(values)
+
+        # Rows rank by their stored id, new ones after every stored row in
+        # batch order, as they are about to be numbered. A visit and a
+        # restaurant take their values from their last rows.
+        ranked = [
+            ((0, current.id) if current else (1, position), row)
+            for position, (row, current) in enumerate(zip(rows, matches))
+        ]
+        stored_ranks = {key: (0, last_rows.get(key, 0)) for key in stored_visits}
+        changed_camis = RestaurantSummary.store_restaurants(
+            ranked, stored_visits, stored_ranks
+        )
+        created_keys, changed_keys = Inspection.store_visits(
+            ranked, stored_visits, stored_ranks
+        )
+
+        inserted, updated = Counter(), Counter()
+        to_create, to_update, fields, moved_from = [], [], set(), set()
+        for row, current, values in zip(rows, matches, row_values):
+            key = visit_key(row)
+            visit = stored_visits[key]
+            if current is None:
+                to_create.append(
+                    (row, Violation(id=row.pk, inspection=visit, **values))
+                )
+                inserted[key] += 1
+                continue
+
+            row.pk = current.id
+            changed = [
+                field
+                for field, value in values.items()
+                if getattr(current, field) != value
+            ]
+            for field in changed:
+                setattr(current, field, values[field])
+            if current.inspection_id != visit.id:
+                moved_from.add(current.inspection_id)
+                current.inspection = visit
+                changed.append("inspection")
+            if changed:
+                fields.update(changed)
+                to_update.append(current)
+            if changed or key in changed_keys or row.CAMIS in changed_camis:
+                updated[key] += 1
+
+        Violation.objects.bulk_create(violation for _, violation in to_create)
+        for row, violation in to_create:
+            row.pk = violation.pk
+        if to_update:
+            Violation.objects.bulk_create(
+                to_update,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=sorted(fields),
+            )
+        if moved_from:
+            Inspection.objects.filter(
+                id__in=moved_from, violations__isnull=True
+            ).delete()
+        database = router.db_for_write(cls)
+        for row in rows:
+            row._state.adding = False
+            row._state.db = database
+        return inserted, updated, created_keys
+
+    @classmethod
+    def latest_for(cls, camis_values, since=None):
+        """
+        ``{camis: inspection}`` with the latest inspection row of each
+        restaurant (on or after ``since``), in one windowed query per batch
+        of RATING_BATCH_SIZE values. ``camis_values`` may also be a queryset
+        of CAMIS values, which is used as a single subquery.
+        """
+        if isinstance(camis_values, models.QuerySet):
+            batches = [camis_values]
+        else:
+            camis_values = sorted(set(camis_values))
+            batches = [
+                camis_values[start : start + cls.RATING_BATCH_SIZE]
+                for start in range(0, len(camis_values), cls.RATING_BATCH_SIZE)
+            ]
+
+        latest = {}
+        for batch in batches:
+            rows = cls.objects.filter(CAMIS__in=batch)
+            if since is not None:
+                rows = rows.filter(INSPECTION_DATE__gte=since)
+            rows = rows.annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=F("CAMIS"),
+                    order_by=[F("INSPECTION_DATE").desc(), F("id").desc()],
+                )
+            ).filter(position=1)
+            latest.update((row.CAMIS, row) for row in rows)
+        return latest
+
     @classmethod
     def get_restaurant_rating(cls, camis):
         """
         Calculate overall restaurant rating based on recent inspections.
         Returns a dictionary with rating info.
         """
-        # Get recent inspections for this restaurant (within last 3 years)
-        cutoff_date = datetime.now().date() - timedelta(days=1095)
-        recent_inspections = cls.objects.filter(
-            CAMIS=camis, GRADE__in=["A", "B", "C"], INSPECTION_DATE__gte=cutoff_date
-        ).exclude(
-            INSPECTION_DATE__year=1900
-        )  # Exclude invalid dates
-
-        if not recent_inspections.exists():
-            # Fallback to all inspections if no recent ones
-            recent_inspections = cls.objects.filter(
-                CAMIS=camis, GRADE__in=["A", "B", "C"]
-            ).exclude(INSPECTION_DATE__year=1900)
-
-        if not recent_inspections.exists():
-            return {
-                "stars": 0,
-                "grade": "N/A",
-                "inspection_count": 0,
-                "latest_inspection": None,
-                "description": "No graded inspections available",
-            }
+        return cls.get_ratings_for([camis])[camis]
+
+    @classmethod
+    def get_ratings_for(cls, camis_values):
+        """
+        Ratings for many restaurants at once, as ``{camis: rating}``.
+
+        Each batch is a single grouped query: conditional aggregates compute
+        the last-three-years window and the all-time fallback side by side.
+        """
+        return {camis: rating for camis, rating, _ in cls.compute_ratings(camis_values)}
+
+    @classmethod
+    def compute_ratings(cls, camis_values, today=None):
+        """
+        Yield ``(camis, rating, stale_on)`` for every requested CAMIS, where
+        ``stale_on`` is the first day the three-year window drops one of the
+        inspections behind the rating (None when the rating cannot age).
+        Counts are per visit (the Inspection table), not per violation row.
+        """
+        camis_values = list(dict.fromkeys(camis_values))
+        today = today or datetime.now().date()
+        cutoff_date = today - timedelta(days=cls.RATING_WINDOW_DAYS)
+        recent = Q(inspection_date__gte=cutoff_date)
+        aggregates = {"recent_earliest": Min("inspection_date", filter=recent)}
+        for window, window_filter in (("recent", recent), ("all", Q())):
+            for grade in cls.RATING_GRADES:
+                aggregates[f"{window}_{grade}"] = Count(
+                    "id", filter=window_filter & Q(grade=grade)
+                )
+            aggregates[f"{window}_latest"] = Max(
+                "inspection_date", filter=window_filter
+            )
+            aggregates[f"{window}_avg_score"] = Avg("score", filter=window_filter)
+
+        for start in range(0, len(camis_values), cls.RATING_BATCH_SIZE):
+            batch = camis_values[start : start + cls.RATING_BATCH_SIZE]
+            rows = (
+                Inspection.objects.filter(
+                    camis__in=batch, grade__in=list(cls.RATING_GRADES)
+                )
+                .exclude(inspection_date__year=1900)  # Exclude invalid dates
+                .values("camis")
+                .order_by()
+                .annotate(**aggregates)
+            )
+            rows = {row["camis"]: row for row in rows}
+            for camis in batch:
+                row = rows.get(camis)
+                if row is None:
+                    yield camis, cls._no_rating(), None
+                elif row["recent_earliest"] is not None:
+                    stale_on = row["recent_earliest"] + timedelta(
+                        days=cls.RATING_WINDOW_DAYS + 1
+                    )
+                    yield camis, cls._rating_from_aggregates(row, "recent"), stale_on
+                else:
+                    # Fallback to all inspections if no recent ones
+                    yield camis, cls._rating_from_aggregates(row, "all"), None
+
+    @classmethod
+    def _rating_from_aggregates(cls, row, window):
+        grade_counts = {
+            grade: row[f"{window}_{grade}"]
+            for grade in cls.RATING_GRADES
+            if row[f"{window}_{grade}"]
+        }
+        inspection_count = sum(grade_counts.values())
 
         # Calculate average grade (A=5, B=4, C=3)
-        grade_values = {"A": 5, "B": 4, "C": 3}
-
-        grades = recent_inspections.values_list("GRADE", flat=True)
-        total_points = sum(grade_values.get(grade, 0) for grade in grades)
-        avg_rating = total_points / len(grades) if grades else 0
-
-        # Get the most common grade
-        grade_counts = {}
-        for grade in grades:
-            grade_counts[grade] = grade_counts.get(grade, 0) + 1
-        most_common_grade = (
-            max(grade_counts, key=grade_counts.get) if grade_counts else "N/A"
+        total_points = sum(
+            cls.RATING_GRADES[grade] * count for grade, count in grade_counts.items()
         )
+        avg_rating = total_points / inspection_count
 
-        # Get latest inspection info
-        latest = recent_inspections.order_by("-INSPECTION_DATE").first()
+        # Most common grade; ties go to the better grade
+        most_common_grade = max(grade_counts, key=grade_counts.get)
 
         # Create description
-        inspection_count = recent_inspections.count()
         if avg_rating >= 4.5:
             description = f"Excellent (mostly A grades, {inspection_count} inspections)"
         elif avg_rating >= 3.5:
@@ -134,9 +430,19 @@ class RestaurantInspection(models.Model):
             "stars": round(avg_rating, 1),
             "grade": most_common_grade,
             "inspection_count": inspection_count,
-            "latest_inspection": latest.INSPECTION_DATE if latest else None,
+            "latest_inspection": row[f"{window}_latest"],
             "description": description,
-            "avg_score": recent_inspections.aggregate(avg=Avg("SCORE"))["avg"] or 0,
+            "avg_score": row[f"{window}_avg_score"] or 0,
+        }
+
+    @staticmethod
+    def _no_rating():
+        return {
+            "stars": 0,
+            "grade": "N/A",
+            "inspection_count": 0,
+            "latest_inspection": None,
+            "description": "No graded inspections available",
         }
 
     def get_grade_display(self):
@@ -152,6 +458,636 @@ class RestaurantInspection(models.Model):
         return grade_descriptions.get(self.GRADE, "Unknown")
 
 
+class DatasetVersion(models.Model):
+    """Single-row token that changes whenever inspection data changes.
+
+    Caches built from the inspection data include the token in their keys,
+    so bumping it invalidates them in every process at once.
+    """
+
+    token = models.CharField(max_length=32)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dataset version {self.token}"
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list("token", flat=True).first() or "0"
+
+    @classmethod
+    def bump(cls):
+        token = uuid.uuid4().hex
+        cls.objects.update_or_create(pk=1, defaults={"token": token})
+        return token
+
+
+class RestaurantSummary(models.Model):
+    """
+    One row per restaurant: where the feed's restaurant columns are stored,
+    plus values derived from its Inspection visits, which refresh() keeps
+    up to date.
+    """
+
+    REFRESH_BATCH_SIZE = 500
+    # Stored from the feed rather than derived
+    RESTAURANT_FIELDS = [
+        "DBA",
+        "BORO",
+        "BUILDING",
+        "STREET",
+        "ZIPCODE",
+        "PHONE",
+        "CUISINE_DESCRIPTION",
+        "Community_Board",
+        "Council_District",
+        "Census_Tract",
+    ]
+    DERIVED_FIELDS = [
+        "latest_grade",
+        "latest_score",
+        "latest_inspection_date",
+        "inspection_count",
+    ]
+
+    CAMIS = models.BigIntegerField(unique=True)
+    DBA = models.CharField(max_length=255, null=True, blank=True)
+    BORO = models.CharField(max_length=50, null=True, blank=True)
+    BUILDING = models.CharField(max_length=50, null=True, blank=True)
+    STREET = models.CharField(max_length=255, null=True, blank=True)
+    ZIPCODE = models.FloatField(null=True, blank=True)
+    PHONE = models.CharField(max_length=20, null=True, blank=True)
+    CUISINE_DESCRIPTION = models.CharField(max_length=255, null=True, blank=True)
+    Community_Board = models.FloatField(null=True, blank=True)
+    Council_District = models.FloatField(null=True, blank=True)
+    Census_Tract = models.FloatField(null=True, blank=True)
+
+    # Derived from the most recent inspection
+    latest_grade = models.CharField(max_length=5, null=True, blank=True)
+    latest_score = models.FloatField(null=True, blank=True)
+    latest_inspection_date = models.DateField(null=True, blank=True)
+    inspection_count = models.IntegerField(default=0)  # Distinct inspection dates
+
+    # From the CSV feed; not derived from inspections, so refresh() keeps them
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["BORO", "DBA"]),
+            models.Index(fields=["ZIPCODE"]),
+            models.Index(fields=["CUISINE_DESCRIPTION"]),
+            models.Index(fields=["latest_inspection_date"]),
+            models.Index(fields=["latitude", "longitude"]),
+        ]
+
+    def __str__(self):
+        return f"{self.DBA} ({self.CAMIS})"
+
+    @property
+    def search_rating(self):
+        """Simple grade-based rating shown in search results"""
+        grade_ratings = {
+            "A": (5, "Excellent"),
+            "B": (4, "Good"),
+            "C": (3, "Fair"),
+        }
+        if self.latest_grade:
+            grade = self.latest_grade
+            stars, description = grade_ratings.get(grade, (2, "Needs improvement"))
+        else:
+            grade = "N/A"
+            stars, description = 0, "No grade available"
+        return {
+            "stars": stars,
+            "grade": grade,
+            "description": description,
+            "inspection_count": self.inspection_count,
+            "latest_inspection": self.latest_inspection_date,
+        }
+
+    @classmethod
+    def refresh(cls, camis_values):
+        """
+        Recompute the derived columns of the given restaurants from their
+        visits. Restaurants without visits lose their row.
+        """
+        camis_values = sorted({int(camis) for camis in camis_values})
+        if not camis_values:
+            return
+        for start in range(0, len(camis_values), cls.REFRESH_BATCH_SIZE):
+            cls._refresh_batch(camis_values[start : start + cls.REFRESH_BATCH_SIZE])
+        DatasetVersion.bump()
+
+    @classmethod
+    def store_restaurants(cls, ranked_rows, stored_visits, stored_ranks):
+        """
+        Store the restaurant columns of feed rows, taken from each
+        restaurant's latest row: by inspection date, then rank.
+        ``ranked_rows`` are ``(rank, row)`` pairs, and ``stored_ranks``
+        the rank of the last row of each of ``stored_visits`` (``{natural
+        key: Inspection}``); rows older than the latest stored one are
+        skipped, so reloading rows in any chunks changes nothing. Returns
+        the CAMIS values of existing rows that changed.
+        """
+        latest = {}
+        for key in stored_visits:
+            rank = (key[1] or NO_DATE, stored_ranks[key])
+            latest[key[0]] = max(latest.get(key[0], rank), rank)
+        newest = {}
+        for rank, row in ranked_rows:
+            rank = (row.INSPECTION_DATE or NO_DATE, rank)
+            if row.CAMIS not in newest or rank > newest[row.CAMIS][0]:
+                newest[row.CAMIS] = (rank, row)
+
+        summaries = cls.objects.in_bulk(list(newest), field_name="CAMIS")
+        stored, changed = [], set()
+        for camis, (rank, row) in newest.items():
+            values = {field: getattr(row, field) for field in cls.RESTAURANT_FIELDS}
+            summary = summaries.get(camis)
+            if summary is None:
+                stored.append(cls(CAMIS=camis, **values))
+            elif rank >= latest.get(camis, rank) and any(
+                getattr(summary, field) != value for field, value in values.items()
+            ):
+                stored.append(cls(CAMIS=camis, **values))
+                changed.add(camis)
+        # One INSERT for new and changed rows; bulk_update would build a
+        # CASE per field and row
+        cls.objects.bulk_create(
+            stored,
+            update_conflicts=True,
+            unique_fields=["CAMIS"],
+            update_fields=cls.RESTAURANT_FIELDS,
+        )
+        return changed
+
+    @classmethod
+    def set_coordinates(cls, coordinates):
+        """Store ``{camis: (latitude, longitude)}`` on existing summary rows"""
+        camis_values = sorted(coordinates)
+        changed = 0
+        for start in range(0, len(camis_values), cls.REFRESH_BATCH_SIZE):
+            batch = camis_values[start : start + cls.REFRESH_BATCH_SIZE]
+            summaries = [
+                summary
+                for summary in cls.objects.filter(CAMIS__in=batch)
+                if (summary.latitude, summary.longitude) != coordinates[summary.CAMIS]
+            ]
+            for summary in summaries:
+                summary.latitude, summary.longitude = coordinates[summary.CAMIS]
+            cls.objects.bulk_update(summaries, ["latitude", "longitude"])
+            changed += len(summaries)
+        if changed:
+            DatasetVersion.bump()
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the derived columns of every restaurant"""
+        cls.objects.exclude(CAMIS__in=Inspection.objects.values("camis")).delete()
+        cls.refresh(cls.objects.values_list("CAMIS", flat=True))
+
+    @classmethod
+    def _refresh_batch(cls, batch):
+        summaries = cls.objects.in_bulk(batch, field_name="CAMIS")
+        derived = {}
+        visit_dates = defaultdict(set)
+        for visit in Inspection.objects.filter(camis__in=batch).order_by(
+            "camis", "-inspection_date", "-id"
+        ):
+            values = derived.get(visit.camis)
+            if values is None:
+                # Visits arrive newest first
+                values = derived[visit.camis] = {
+                    "latest_grade": None,
+                    "latest_score": None,
+                    "latest_inspection_date": visit.inspection_date,
+                }
+            if visit.inspection_date is not None:
+                visit_dates[visit.camis].add(visit.inspection_date)
+            if visit.inspection_date == values["latest_inspection_date"]:
+                # Several visits on the latest day: the first grade and score
+                values["latest_grade"] = values["latest_grade"] or visit.grade
+                if values["latest_score"] is None:
+                    values["latest_score"] = visit.score
+
+        changed = []
+        for camis, values in derived.items():
+            values["inspection_count"] = len(visit_dates[camis])
+            summary = summaries.get(camis)
+            if summary is not None and any(
+                getattr(summary, field) != value for field, value in values.items()
+            ):
+                for field, value in values.items():
+                    setattr(summary, field, value)
+                changed.append(summary)
+        cls.objects.filter(CAMIS__in=batch).exclude(CAMIS__in=list(derived)).delete()
+        cls.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=cls.DERIVED_FIELDS,
+        )
+
+
+class Inspection(models.Model):
+    """One inspection visit; the feed repeats it on every violation row"""
+
+    camis = models.BigIntegerField()
+    inspection_date = models.DateField(null=True, blank=True)
+    inspection_type = models.CharField(max_length=255, null=True, blank=True)
+    action = models.TextField(null=True, blank=True)
+    score = models.FloatField(null=True, blank=True)
+    grade = models.CharField(max_length=5, null=True, blank=True)
+    grade_date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-inspection_date"]
+        indexes = [
+            models.Index(fields=["camis", "inspection_date"]),
+            models.Index(fields=["grade", "inspection_date"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["camis", "inspection_date", "inspection_type"],
+                name="unique_inspection_visit",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.camis} on {self.inspection_date}: {self.grade or 'no grade'}"
+
+    def natural_key(self):
+        return (self.camis, self.inspection_date, self.inspection_type)
+
+    @classmethod
+    def store_visits(cls, ranked_rows, stored_visits, stored_ranks):
+        """
+        Upsert the visits of feed rows on their natural key, adding the new
+        ones to ``stored_visits`` (``{natural key: Inspection}``).
+        ``ranked_rows`` are ``(rank, row)`` pairs, and ``stored_ranks`` the
+        rank of each stored visit's last row. A visit takes the values of
+        its rows in rank order, blank ones never overwriting others, and
+        skips rows ranked before its stored last row: rows that disagree
+        settle on the last one whatever chunks they are stored in. Returns
+        ``(created, changed)``, the keys of the new visits and of the
+        stored visits that changed.
+        """
+        merged = {}
+        for rank, row in sorted(ranked_rows, key=itemgetter(0)):
+            key = visit_key(row)
+            row_values = {
+                field: getattr(row, column)
+                for field, column in visits.VISIT_COLUMNS.items()
+            }
+            visit = stored_visits.get(key)
+            if visit is not None and rank < stored_ranks[key]:
+                continue
+            if key not in merged:
+                merged[key] = (
+                    row_values
+                    if visit is None
+                    else {field: getattr(visit, field) for field in row_values}
+                )
+            merged[key].update(
+                (field, value)
+                for field, value in row_values.items()
+                if value not in (None, "")
+            )
+
+        created, changed, fields = {}, {}, set()
+        for key, values in merged.items():
+            visit = stored_visits.get(key)
+            if visit is None:
+                stored_visits[key] = created[key] = cls(
+                    camis=key[0],
+                    inspection_date=key[1],
+                    inspection_type=key[2],
+                    **values,
+                )
+                continue
+            for field, value in values.items():
+                if getattr(visit, field) != value:
+                    setattr(visit, field, value)
+                    changed[key] = visit
+                    fields.add(field)
+        cls.objects.bulk_create(created.values())
+        cls.objects.bulk_create(
+            changed.values(),
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=sorted(fields),
+        )
+        return set(created), set(changed)
+
+
+class Violation(models.Model):
+    """
+    The violation columns of one feed row. A visit without violations
+    keeps its single row, with blank columns, as in the feed.
+    """
+
+    inspection = models.ForeignKey(
+        Inspection, on_delete=models.CASCADE, related_name="violations"
+    )
+    code = models.CharField(max_length=20, null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    critical_flag = models.CharField(max_length=50, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.code}: {self.description}"
+
+
+class RestaurantRating(models.Model):
+    """Stored result of RestaurantInspection.get_restaurant_rating per CAMIS"""
+
+    camis = models.BigIntegerField(unique=True)
+    stars = models.FloatField(default=0)
+    grade = models.CharField(max_length=5, default="N/A")
+    inspection_count = models.IntegerField(default=0)
+    latest_inspection = models.DateField(null=True, blank=True)
+    avg_score = models.FloatField(null=True, blank=True)
+    description = models.CharField(max_length=255)
+    # First day the three-year window changes this rating; null if it cannot
+    stale_on = models.DateField(null=True, blank=True, db_index=True)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.camis}: {self.stars} stars ({self.grade})"
+
+    def as_dict(self):
+        """Same shape as RestaurantInspection.get_restaurant_rating()"""
+        rating = {
+            "stars": self.stars,
+            "grade": self.grade,
+            "inspection_count": self.inspection_count,
+            "latest_inspection": self.latest_inspection,
+            "description": self.description,
+        }
+        if self.inspection_count:
+            rating["avg_score"] = self.avg_score
+        return rating
+
+    @classmethod
+    def ratings_for(cls, camis_values):
+        """
+        ``{camis: rating}`` from the stored table. Restaurants that have not
+        been rated yet are computed on the fly.
+        """
+        camis_values = list(dict.fromkeys(camis_values))
+        ratings = {
+            rating.camis: rating.as_dict()
+            for rating in cls.objects.filter(camis__in=camis_values)
+        }
+        missing = [camis for camis in camis_values if camis not in ratings]
+        if missing:
+            ratings.update(RestaurantInspection.get_ratings_for(missing))
+        return ratings
+
+    @classmethod
+    def refresh(cls, camis_values, today=None):
+        """
+        Recompute stored ratings for the given CAMIS values. Restaurants
+        without inspections lose their row.
+        """
+        camis_values = sorted({int(camis) for camis in camis_values})
+        batch_size = RestaurantInspection.RATING_BATCH_SIZE
+        return sum(
+            cls._refresh_batch(camis_values[start : start + batch_size], today)
+            for start in range(0, len(camis_values), batch_size)
+        )
+
+    @classmethod
+    def _refresh_batch(cls, camis_values, today):
+        existing = set(
+            Inspection.objects.filter(camis__in=camis_values)
+            .values_list("camis", flat=True)
+            .distinct()
+        )
+        cls.objects.filter(camis__in=camis_values).exclude(
+            camis__in=list(existing)
+        ).delete()
+
+        ratings = []
+        for camis, rating, stale_on in RestaurantInspection.compute_ratings(
+            [camis for camis in camis_values if camis in existing], today=today
+        ):
+            ratings.append(
+                cls(
+                    camis=camis,
+                    stars=rating["stars"],
+                    grade=rating["grade"],
+                    inspection_count=rating["inspection_count"],
+                    latest_inspection=rating["latest_inspection"],
+                    avg_score=rating.get("avg_score"),
+                    description=rating["description"],
+                    stale_on=stale_on,
+                )
+            )
+        cls.objects.bulk_create(
+            ratings,
+            update_conflicts=True,
+            unique_fields=["camis"],
+            update_fields=[
+                "stars",
+                "grade",
+                "inspection_count",
+                "latest_inspection",
+                "avg_score",
+                "description",
+                "stale_on",
+                "computed_at",
+            ],
+        )
+        return len(ratings)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the whole table from the visit table in one vectorized pass"""
+        from inspections import ratings
+
+        return ratings.recompute_all()
+
+    @classmethod
+    def refresh_stale(cls, today=None):
+        """Recompute ratings whose three-year window has moved since they were stored"""
+        today = today or datetime.now().date()
+        return cls.refresh(
+            cls.objects.filter(stale_on__lte=today).values_list("camis", flat=True),
+            today=today,
+        )
+
+
+class IngestRun(models.Model):
+    """
+    One load_inspections or sync_inspections run and its checkpoint: how
+    many chunks, rows and input bytes have been committed. The checkpoint is
+    saved in the same transaction as the chunks it covers, so a run that
+    dies can resume from the next chunk of the same file.
+    """
+
+    source = models.CharField(max_length=255, blank=True)
+    # Empty for stdin, which cannot be resumed
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
+    incremental = models.BooleanField(default=False)
+    truncate = models.BooleanField(default=False)
+    chunk_size = models.IntegerField()
+    chunks_committed = models.IntegerField(default=0)
+    rows_committed = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    byte_offset = models.BigIntegerField(default=0)
+    # sync_inspections: the latest :updated_at seen in the open-data feed
+    watermark = models.CharField(max_length=32, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        state = "complete" if self.completed_at else f"{self.chunks_committed} chunks"
+        return f"{self.source} ({state})"
+
+    @classmethod
+    def resumable(cls, fingerprint):
+        """The latest unfinished run of the file with this fingerprint"""
+        if not fingerprint:
+            return None
+        return (
+            cls.objects.filter(fingerprint=fingerprint, completed_at__isnull=True)
+            .order_by("-id")
+            .first()
+        )
+
+    @classmethod
+    def unfinished(cls, source, fingerprint=""):
+        """
+        Runs of ``source``, or of the file with ``fingerprint``, that never
+        completed. Their deltas are only released by a run that takes them
+        over.
+        """
+        runs = Q(source=source[:255])
+        if fingerprint:
+            runs |= Q(fingerprint=fingerprint)
+        return list(cls.objects.filter(runs, completed_at__isnull=True))
+
+    def checkpoint(self, chunks, rows, inserted, updated, byte_offset):
+        """Add committed chunks to the checkpoint; call inside their transaction"""
+        self.chunks_committed += chunks
+        self.rows_committed += rows
+        self.rows_inserted += inserted
+        self.rows_updated += updated
+        self.byte_offset = byte_offset
+        self.save(
+            update_fields=[
+                "chunks_committed",
+                "rows_committed",
+                "rows_inserted",
+                "rows_updated",
+                "byte_offset",
+                "updated_at",
+            ]
+        )
+
+    @classmethod
+    def last_watermark(cls, source):
+        """The watermark of the latest completed sync of ``source``"""
+        run = (
+            cls.objects.filter(source=source[:255], completed_at__isnull=False)
+            .exclude(watermark="")
+            .order_by("-id")
+            .first()
+        )
+        return run.watermark if run else ""
+
+    def complete(self):
+        self.completed_at = timezone.now()
+        self.save(update_fields=["watermark", "completed_at", "updated_at"])
+
+
+class IngestDelta(models.Model):
+    """
+    Rows one load_inspections run inserted or changed for one visit of a
+    restaurant, and whether the run created the visit.
+    check_restaurant_updates consumes each delta once, after its run has
+    completed.
+    """
+
+    camis = models.BigIntegerField(db_index=True)
+    # The visit's natural key with camis; both empty on deltas recorded
+    # per restaurant, before visits were tracked
+    inspection_date = models.DateField(null=True, blank=True)
+    inspection_type = models.CharField(max_length=255, null=True, blank=True)
+    new_visit = models.BooleanField(default=False)
+    inserted = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    source = models.CharField(max_length=255, blank=True)
+    run = models.ForeignKey(
+        IngestRun,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="deltas",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    consumed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.camis}: +{self.inserted} ~{self.updated} ({self.source})"
+
+    @classmethod
+    def pending(cls, before):
+        """
+        Unconsumed deltas of runs that completed before ``before``. A run
+        records no deltas once complete, so the set cannot grow while it is
+        being processed.
+        """
+        return cls.objects.filter(consumed_at__isnull=True).filter(
+            Q(run__completed_at__lte=before)
+            | Q(run__isnull=True, created_at__lte=before)
+        )
+
+    @classmethod
+    def consume(cls, before):
+        """
+        Mark ``pending(before)`` consumed; returns how many deltas were still
+        pending. Call inside the transaction that acts on them.
+        """
+        return cls.pending(before).update(consumed_at=timezone.now())
+
+    @classmethod
+    def record(cls, inserted, updated, created=(), source="", run=None):
+        """
+        Store Counters of inserted and updated rows by visit natural key,
+        flagging the ``created`` visits
+        """
+        deltas = []
+        keys = sorted(
+            set(inserted) | set(updated),
+            key=lambda key: (key[0], key[1] or NO_DATE, key[2] or ""),
+        )
+        for key in keys:
+            camis, inspection_date, inspection_type = key
+            deltas.append(
+                cls(
+                    camis=camis,
+                    inspection_date=inspection_date,
+                    inspection_type=inspection_type,
+                    new_visit=key in created,
+                    inserted=inserted.get(key, 0),
+                    updated=updated.get(key, 0),
+                    source=source[:255],
+                    run=run,
+                )
+            )
+        cls.objects.bulk_create(deltas)
+
+
 class RestaurantReview(models.Model):
     """User-submitted reviews for restaurants"""
 
@@ -0,0 +1,165 @@
+"""
+Citywide rating recomputation with pandas.
+
+RestaurantInspection.compute_ratings() is the reference implementation and
+works per batch of CAMIS values through the ORM. This module applies the same
+rule to every restaurant at once: the graded visits are loaded into a single
+DataFrame and the window selection, grade histogram, averages and
+descriptions are all grouped, vectorized operations.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+
+from inspections.models import (
+    Inspection,
+    RestaurantInspection,
+    RestaurantRating,
+    RestaurantSummary,
+)
+
+GRADES = list(RestaurantInspection.RATING_GRADES)
+POINTS = np.array([RestaurantInspection.RATING_GRADES[grade] for grade in GRADES])
+
+# Lower bounds of the description bands, best first
+DESCRIPTIONS = [
+    (4.5, "Excellent (mostly A grades, "),
+    (3.5, "Good (mostly A-B grades, "),
+    (2.5, "Fair (mixed grades, "),
+]
+
+RATING_FIELDS = [
+    "stars",
+    "grade",
+    "inspection_count",
+    "latest_inspection",
+    "avg_score",
+    "description",
+    "stale_on",
+    "computed_at",
+]
+
+
+def load_frame():
+    """Graded visits as a DataFrame of camis, inspection_date, grade, score"""
+    rows = (
+        Inspection.objects.filter(grade__in=GRADES)
+        .exclude(inspection_date__year=1900)  # Exclude invalid dates
+        .order_by()
+        .values_list("camis", "inspection_date", "grade", "score")
+    )
+    frame = pd.DataFrame.from_records(
+        rows.iterator(chunk_size=10000),
+        columns=["camis", "inspection_date", "grade", "score"],
+    )
+    frame["inspection_date"] = pd.to_datetime(frame["inspection_date"])
+    frame["score"] = pd.to_numeric(frame["score"])
+    return frame
+
+
+def compute_ratings(frame, today=None):
+    """
+    Ratings for every CAMIS in ``frame``, as a DataFrame indexed by CAMIS
+    with the RestaurantRating columns.
+    """
+    today = today or datetime.now().date()
+    window_days = RestaurantInspection.RATING_WINDOW_DAYS
+    cutoff = pd.Timestamp(today - timedelta(days=window_days))
+
+    # Use the last three years where a restaurant has any, else all time
+    recent = (frame["inspection_date"] >= cutoff).to_numpy()
+    has_recent = (
+        pd.Series(recent).groupby(frame["camis"].to_numpy()).transform("any")
+    ).to_numpy()
+    window = frame[recent | ~has_recent]
+
+    counts = (
+        pd.crosstab(window["camis"], window["grade"])
+        .reindex(columns=GRADES, fill_value=0)
+        .to_numpy()
+    )
+    grouped = window.groupby("camis").agg(
+        latest=("inspection_date", "max"), avg_score=("score", "mean")
+    )
+    earliest_recent = frame[recent].groupby("camis")["inspection_date"].min()
+
+    inspection_count = counts.sum(axis=1)
+    average = (counts @ POINTS) / inspection_count
+    description_prefix = np.select(
+        [average >= bound for bound, _ in DESCRIPTIONS],
+        [prefix for _, prefix in DESCRIPTIONS],
+        default="Needs improvement (",
+    )
+
+    ratings = pd.DataFrame(index=grouped.index)
+    # Python's round() so stars match the per-restaurant routine exactly
+    ratings["stars"] = [round(value, 1) for value in average.tolist()]
+    # argmax picks the first maximum, so ties go to the better grade
+    ratings["grade"] = np.array(GRADES)[counts.argmax(axis=1)]
+    ratings["inspection_count"] = inspection_count
+    ratings["latest_inspection"] = grouped["latest"].dt.date
+    ratings["avg_score"] = grouped["avg_score"].fillna(0)
+    ratings["description"] = (
+        pd.Series(description_prefix, index=ratings.index)
+        + ratings["inspection_count"].astype(str)
+        + " inspections)"
+    )
+    stale_on = earliest_recent + pd.Timedelta(days=window_days + 1)
+    ratings["stale_on"] = stale_on.reindex(ratings.index).dt.date
+    return ratings
+
+
+def recompute_all(today=None):
+    """
+    Recompute the stored rating of every restaurant and write them back in
+    bulk. Returns the number of ratings written.
+    """
+    computed = compute_ratings(load_frame(), today=today).to_dict("index")
+    camis_values = set(RestaurantSummary.objects.values_list("CAMIS", flat=True))
+    now = timezone.now()
+
+    rows = []
+    for camis in sorted(camis_values):
+        row = computed.get(camis)
+        if row is not None:
+            fields = {
+                "stars": row["stars"],
+                "grade": row["grade"],
+                "inspection_count": int(row["inspection_count"]),
+                "latest_inspection": _optional(row["latest_inspection"]),
+                "avg_score": float(row["avg_score"]),
+                "description": row["description"],
+                "stale_on": _optional(row["stale_on"]),
+            }
+        else:
+            fields = {
+                **RestaurantInspection._no_rating(),
+                "avg_score": None,
+                "stale_on": None,
+            }
+        rows.append(RestaurantRating(camis=camis, computed_at=now, **fields))
+
+    batch_size = RestaurantInspection.RATING_BATCH_SIZE
+    existing = set(RestaurantRating.objects.values_list("camis", flat=True))
+    orphans = sorted(existing - camis_values)
+    for start in range(0, len(orphans), batch_size):
+        RestaurantRating.objects.filter(
+            camis__in=orphans[start : start + batch_size]
+        ).delete()
+    # An upsert rather than bulk_update: bulk_update's CASE-per-row SQL
+    # takes about a minute for a full city, the upsert a few seconds
+    RestaurantRating.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["camis"],
+        update_fields=RATING_FIELDS,
+    )
+    return len(rows)
+
+
+def _optional(value):
+    return None if pd.isna(value) else value
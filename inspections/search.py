@@ -0,0 +1,330 @@
+"""
+Restaurant search shared by the HTML search page and the JSON API.
+
+Filters, sort keys and paging all run in the database against
+RestaurantSummary, so a page costs one COUNT plus one LIMIT query no matter
+how many restaurants match.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import math
+from datetime import date
+
+from django.core.cache import caches
+from django.core.paginator import Paginator
+from django.db.models import Case, DateField, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from inspections import facets, fts, geo
+from inspections.models import DatasetVersion, RestaurantSummary
+
+PAGE_SIZE = 20
+
+SORT_OPTIONS = (
+    "relevance",
+    "name",
+    "rating_high",
+    "rating_low",
+    "grade",
+    "latest_inspection",
+    "distance",
+)
+
+STARS = Case(
+    When(latest_grade="A", then=Value(5)),
+    When(latest_grade="B", then=Value(4)),
+    When(latest_grade="C", then=Value(3)),
+    When(Q(latest_grade__isnull=True) | Q(latest_grade=""), then=Value(0)),
+    default=Value(2),
+    output_field=IntegerField(),
+)
+
+GRADE_ORDER = Case(
+    *[
+        When(latest_grade=grade, then=Value(position))
+        for position, grade in enumerate("ABCNPZ", start=1)
+    ],
+    default=Value(7),
+    output_field=IntegerField(),
+)
+
+
+def _parse_float(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _parse_zipcode(value):
+    """Canonical digits of a whole-number ZIP code; anything else is ignored"""
+    number = _parse_float(value)
+    if number is None or not number.is_integer() or number < 0:
+        return ""
+    return str(int(number))
+
+
+def parse_params(data):
+    """Read the search filters from a QueryDict (or any mapping)"""
+    sort_by = data.get("sort_by", "relevance").strip()
+    lat = _parse_float(data.get("lat"))
+    lng = _parse_float(data.get("lng"))
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        lat = lng = None
+    else:
+        # ~1 m; also lets nearby repeat searches share a cache entry
+        lat, lng = round(lat, 5), round(lng, 5)
+    radius = _parse_float(data.get("radius")) or geo.DEFAULT_RADIUS_KM
+    cuisine = data.get("cuisine", "").strip()
+    borough = data.get("borough", "").strip()
+    return {
+        "query": " ".join(data.get("q", "").split()),
+        "cuisine": "" if cuisine.lower() == "all cuisines" else cuisine,
+        "zipcode": _parse_zipcode(data.get("zipcode", "").strip()),
+        "borough": "" if borough.lower() == "all boroughs" else borough,
+        "sort_by": sort_by if sort_by in SORT_OPTIONS else "relevance",
+        "lat": lat,
+        "lng": lng,
+        "radius": min(max(radius, 0.0), geo.MAX_RADIUS_KM),
+    }
+
+
+def has_location(params):
+    return params["lat"] is not None
+
+
+def has_filters(params):
+    return has_location(params) or any(
+        params[key] for key in ("query", "cuisine", "zipcode", "borough")
+    )
+
+
+def sort_key(params):
+    """Return ``(expression, descending)`` for the requested sort"""
+    sort_by = sort_key_name(params)
+    if sort_by == "distance":
+        return F("distance_km"), False
+    if sort_by == "relevance":
+        return F("search_rank"), False
+    if sort_by == "rating_high":
+        return STARS, True
+    if sort_by == "rating_low":
+        return STARS, False
+    if sort_by == "grade":
+        return GRADE_ORDER, False
+    if sort_by == "latest_inspection":
+        return (
+            Coalesce(
+                "latest_inspection_date",
+                Value(date(1900, 1, 1)),
+                output_field=DateField(),
+            ),
+            True,
+        )
+    return Coalesce("DBA", Value("")), False
+
+
+def search_queryset(params):
+    """
+    Build the filtered RestaurantSummary queryset, annotated with
+    ``sort_key`` and ordered by it with CAMIS as the tiebreaker.
+    """
+    # Borough and cuisine are resolved against the cached facet values so the
+    # database sees an indexable IN (...) instead of a LIKE scan
+    sidebar_facets = facets.get_facets()
+    search_filter = Q()
+    if params["cuisine"]:
+        cuisine = params["cuisine"].lower()
+        search_filter &= Q(
+            CUISINE_DESCRIPTION__in=[
+                facet["value"]
+                for facet in sidebar_facets["cuisine"]
+                if cuisine in facet["value"].lower()
+            ]
+        )
+    if params["zipcode"]:
+        search_filter &= Q(ZIPCODE=int(params["zipcode"]))
+    if params["borough"]:
+        borough = params["borough"].lower()
+        search_filter &= Q(
+            BORO__in=[
+                facet["value"]
+                for facet in sidebar_facets["borough"]
+                if facet["value"].lower() == borough
+            ]
+        )
+
+    summaries = RestaurantSummary.objects.filter(search_filter)
+    if params["query"]:
+        # Name/cuisine text goes through the full-text index when present
+        summaries = fts.filter_text(summaries, params["query"])
+    if has_location(params):
+        summaries = geo.filter_nearby(
+            summaries, params["lat"], params["lng"], params["radius"]
+        )
+
+    expression, descending = sort_key(params)
+    summaries = summaries.annotate(sort_key=expression)
+    ordering = "-sort_key" if descending else "sort_key"
+    return summaries.order_by(ordering, "CAMIS")
+
+
+def encode_cursor(params, summary):
+    """Opaque cursor pointing just past ``summary`` in the current ordering"""
+    value = summary.sort_key
+    if isinstance(value, date):
+        value = value.isoformat()
+    payload = json.dumps([params["sort_by"], value, summary.CAMIS])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _is_number(value, kinds=(int, float)):
+    return (
+        isinstance(value, kinds)
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def _cursor_value(sort_by, value):
+    """The sort value of a cursor as the applied sort compares it"""
+    if sort_by == "latest_inspection":
+        return date.fromisoformat(value)
+    if sort_by == "name":
+        valid = isinstance(value, str)
+    elif sort_by in ("distance", "relevance"):
+        valid = _is_number(value)
+    else:
+        # Star and grade positions
+        valid = _is_number(value, int)
+    if not valid:
+        raise TypeError(f"Unexpected {sort_by} cursor value {value!r}")
+    return value
+
+
+def decode_cursor(params, cursor):
+    """Return ``(sort_value, camis)``; raises ValueError for foreign cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_by, value, camis = json.loads(base64.urlsafe_b64decode(padded))
+    except (TypeError, ValueError, binascii.Error) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if sort_by != params["sort_by"] or not _is_number(camis, int):
+        raise ValueError("Cursor does not match this search")
+    try:
+        value = _cursor_value(sort_key_name(params), value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    return value, camis
+
+
+def keyset_page(params, cursor=None, limit=PAGE_SIZE):
+    """
+    Return ``(summaries, next_cursor)`` for the page after ``cursor``.
+
+    Seeking on ``(sort_key, CAMIS)`` instead of using OFFSET keeps every page
+    as cheap as the first one.
+    """
+    summaries = search_queryset(params)
+    if cursor:
+        value, camis = decode_cursor(params, cursor)
+        _, descending = sort_key(params)
+        past_value = Q(sort_key__lt=value) if descending else Q(sort_key__gt=value)
+        summaries = summaries.filter(past_value | Q(sort_key=value, CAMIS__gt=camis))
+
+    page = list(summaries[: limit + 1])
+    next_cursor = encode_cursor(params, page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def cache_key(params, page_number):
+    """
+    Canonical cache key: case, whitespace and the "All ..." placeholders
+    do not change the results, so they do not change the key either.
+    """
+    canonical = [
+        params["query"].lower(),
+        params["cuisine"].lower(),
+        params["zipcode"],
+        params["borough"].lower(),
+        params["lat"],
+        params["lng"],
+        params["radius"] if has_location(params) else None,
+        sort_key_name(params),
+        str(page_number),
+    ]
+    digest = hashlib.sha1(json.dumps(canonical).encode()).hexdigest()
+    return f"inspections:search:{DatasetVersion.current()}:{digest}"
+
+
+def sort_key_name(params):
+    """The sort that will actually be applied, after defaults/fallbacks"""
+    sort_by = params["sort_by"]
+    if has_location(params) and (
+        sort_by == "distance" or (sort_by == "relevance" and not params["query"])
+    ):
+        return "distance"
+    if sort_by == "relevance" and params["query"]:
+        return "relevance"
+    if sort_by in ("relevance", "distance"):
+        return "name"
+    return sort_by
+
+
+class _PageWindow:
+    """Sequence of ``total`` results of which only one page is materialized"""
+
+    def __init__(self, total, start, rows):
+        self.total = total
+        self.start = start
+        self.rows = rows
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = (index.start or 0) - self.start
+            stop = (self.total if index.stop is None else index.stop) - self.start
+            return self.rows[max(start, 0) : max(stop, 0)]
+        return self.rows[index - self.start]
+
+
+def result_row(summary):
+    """Session-independent part of one search result"""
+    return {
+        "info": summary,
+        "rating": summary.search_rating,
+        "reviews": [],  # Skip reviews for performance
+        "citations": [],
+        "distance_km": getattr(summary, "distance_km", None),
+    }
+
+
+def cached_page(params, page_number):
+    """
+    Return ``(paginator, page)`` whose object_list holds result rows for the
+    requested page. Rows are cached per dataset version and shared between
+    visitors, so they carry no favorite/follow flags.
+    """
+    results_cache = caches["search_results"]
+    key = cache_key(params, page_number)
+    entry = results_cache.get(key)
+    if entry is None:
+        paginator = Paginator(search_queryset(params), PAGE_SIZE)
+        page = paginator.get_page(page_number)
+        entry = {
+            "total": paginator.count,
+            "start": (page.number - 1) * PAGE_SIZE,
+            "rows": [result_row(summary) for summary in page],
+        }
+        results_cache.set(key, entry)
+
+    paginator = Paginator(
+        _PageWindow(entry["total"], entry["start"], entry["rows"]), PAGE_SIZE
+    )
+    return paginator, paginator.get_page(page_number)
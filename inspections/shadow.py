@@ -0,0 +1,186 @@
+"""
+Full reloads through shadow tables (SQLite only).
+
+The new dataset is built in staging copies of the dataset tables, named
+``<table>__shadow``, while the site keeps reading the live tables. The usual
+load and rebuild code fills them: ``using_shadow_tables(connection)``
+rewrites the table names in the SQL that one connection runs, so only the
+management command's own queries go to the copies. Models are not touched,
+and other threads, which have their own connections, keep using the live
+tables. The FTS and R*Tree search tables are built on the copies as well.
+``swap()`` then drops the live tables and renames the copies over them in
+one transaction, so readers see either the complete old dataset or the
+complete new one.
+
+SQLite index names are global and indexes cannot be renamed, so the
+secondary indexes are not staged. Once the swap has committed, each one is
+built a single time on the swapped-in table under its original name (which
+migrations refer to); until then readers of the new tables go without them.
+The feed-shaped RestaurantInspection view reads the live tables only; the
+loader and the rebuilds write and read the tables themselves.
+"""
+
+import re
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from inspections import fts, geo, visits
+from inspections.models import OwnerRestaurant, RestaurantSummary
+from inspections.snapshot import MODELS
+
+SUFFIX = "__shadow"
+FTS_TABLE = fts.FTS_TABLE + SUFFIX
+RTREE_TABLE = geo.RTREE_TABLE + SUFFIX
+
+
+def shadow_name(name):
+    return name + SUFFIX
+
+
+def _live_tables():
+    return [model._meta.db_table for model in MODELS]
+
+
+_LIVE_TABLE = re.compile(
+    rf'"({"|".join(re.escape(model._meta.db_table) for model in MODELS)})"'
+)
+
+
+def _rename_tables(sql):
+    """Point every quoted dataset table name in ``sql`` at its shadow"""
+    return _LIVE_TABLE.sub(lambda match: f'"{match[1]}{SUFFIX}"', sql)
+
+
+def _schema(cursor, kind, table):
+    cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = %s AND tbl_name = %s "
+        "AND sql IS NOT NULL",
+        [kind, table],
+    )
+    return cursor.fetchall()
+
+
+def drop_tables(connection):
+    """Remove shadow tables left over from an earlier, interrupted reload"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        cursor.execute(f"DROP TABLE IF EXISTS {RTREE_TABLE}")
+        for table in reversed(_live_tables()):
+            cursor.execute(f'DROP TABLE IF EXISTS "{shadow_name(table)}"')
+
+
+def create_tables(connection):
+    """Empty shadow copies of the dataset tables, without secondary indexes"""
+    drop_tables(connection)
+    with connection.cursor() as cursor:
+        for table in _live_tables():
+            (_, sql), *_ = _schema(cursor, "table", table)
+            cursor.execute(_rename_tables(sql))
+
+
+@contextmanager
+def using_shadow_tables(connection):
+    """
+    Run this connection's queries against the shadow tables. Django gives
+    each thread its own connection, so nothing else in the process is
+    redirected, and leaving the block always restores the connection.
+    """
+
+    def redirect(execute, sql, params, many, context):
+        return execute(_rename_tables(sql), params, many, context)
+
+    with connection.execute_wrapper(redirect):
+        yield
+
+
+def build_indexes(connection):
+    """
+    Build the staged search tables. Returns the live tables' secondary index
+    definitions, as ``(name, sql)`` pairs, for ``swap()`` to build once the
+    shadow tables are live.
+    """
+    with connection.cursor() as cursor:
+        indexes = [
+            index
+            for table in _live_tables()
+            for index in _schema(cursor, "index", table)
+        ]
+    summary = shadow_name(fts.CONTENT_TABLE)
+    fts.build_detached_index(connection, FTS_TABLE, summary)
+    geo.build_detached_index(connection, RTREE_TABLE, summary)
+    return indexes
+
+
+def _remap_owners(connection):
+    """
+    Point owner links at the shadow summary row of the same restaurant.
+    Links to restaurants missing from the new data are removed, as a
+    truncating reload would.
+    """
+    owners = list(
+        OwnerRestaurant.objects.order_by("id").values_list("id", "restaurant__CAMIS")
+    )
+    with using_shadow_tables(connection):
+        shadow_ids = dict(
+            RestaurantSummary.objects.filter(
+                CAMIS__in={camis for _, camis in owners}
+            ).values_list("CAMIS", "id")
+        )
+    stale = [owner_id for owner_id, camis in owners if camis not in shadow_ids]
+    OwnerRestaurant.objects.filter(id__in=stale).delete()
+    # Shadow ids restart at 1 and can equal an old id another link still
+    # holds, so park the links on negative ids before flipping them back
+    for owner_id, camis in owners:
+        if camis in shadow_ids:
+            OwnerRestaurant.objects.filter(id=owner_id).update(
+                restaurant_id=-shadow_ids[camis]
+            )
+    OwnerRestaurant.objects.filter(restaurant_id__lt=0).update(
+        restaurant_id=-F("restaurant_id")
+    )
+
+
+def swap(connection, indexes):
+    """
+    Replace the live dataset and search tables with the shadow ones in one
+    transaction of drops and renames, then build ``indexes`` (from
+    ``build_indexes()``) on the swapped-in tables and ANALYZE them
+    """
+    # Dropping the live summary table deletes the rows owner links point
+    # at; with checks on that fails at commit even though the links
+    # already point at the shadow rows that take their place
+    checks_disabled = connection.disable_constraint_checking()
+    try:
+        with transaction.atomic(using=connection.alias):
+            _remap_owners(connection)
+            fts.drop_index(connection)
+            geo.drop_index(connection)
+            visits.drop_view(connection)
+            with connection.cursor() as cursor:
+                for table in reversed(_live_tables()):
+                    cursor.execute(f'DROP TABLE "{table}"')
+                for table in _live_tables():
+                    cursor.execute(
+                        f'ALTER TABLE "{shadow_name(table)}" RENAME TO "{table}"'
+                    )
+                if FTS_TABLE in connection.introspection.table_names(cursor):
+                    cursor.execute(f"ALTER TABLE {FTS_TABLE} RENAME TO {fts.FTS_TABLE}")
+                if RTREE_TABLE in connection.introspection.table_names(cursor):
+                    cursor.execute(
+                        f"ALTER TABLE {RTREE_TABLE} RENAME TO {geo.RTREE_TABLE}"
+                    )
+            # The sync triggers and the view go back with the tables; the
+            # secondary indexes are built once the swap is committed
+            fts.create_index(connection)
+            geo.create_index(connection)
+            visits.create_view(connection)
+    finally:
+        if checks_disabled:
+            connection.enable_constraint_checking()
+    with connection.cursor() as cursor:
+        for _, sql in indexes:
+            cursor.execute(sql)
+        for table in _live_tables():
+            cursor.execute(f'ANALYZE "{table}"')
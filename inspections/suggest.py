@@ -0,0 +1,99 @@
+"""
+In-process prefix index for restaurant name autocomplete.
+
+Every word of every normalized DBA name is stored in one sorted list, so a
+prefix lookup is two bisects plus ranking the (usually small) slice between
+them. The index is built on first use and rebuilt when the dataset version
+changes.
+"""
+
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from datetime import date
+
+from inspections.models import DatasetVersion, RestaurantSummary
+
+GRADE_RANK = {"A": 0, "B": 1, "C": 2}
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class PrefixIndex:
+    def __init__(self, restaurants):
+        """``restaurants`` yields (camis, name, borough, grade, latest_date)"""
+        keyed = []
+        for camis, name, borough, grade, latest in restaurants:
+            normalized = normalize(name)
+            if not normalized:
+                continue
+            entry = (
+                GRADE_RANK.get(grade, len(GRADE_RANK)),
+                -(latest or date.min).toordinal(),
+                normalized,
+                camis,
+                name,
+                borough,
+                grade,
+            )
+            # Index the name from each word so "pizza" finds "Joe's Pizza"
+            words = normalized.split(" ")
+            for position in range(len(words)):
+                keyed.append((" ".join(words[position:]), entry))
+        keyed.sort(key=lambda item: item[0])
+        self._keys = [key for key, _ in keyed]
+        self._entries = [entry for _, entry in keyed]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, prefix, limit=10):
+        """Best ``limit`` restaurants whose name has a word starting with prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + "\uffff", lo=start)
+        unique = {entry[3]: entry for entry in self._entries[start:end]}
+        return [
+            {
+                "camis": camis,
+                "name": name,
+                "borough": borough,
+                "grade": grade,
+            }
+            for _, _, _, camis, name, borough, grade in heapq.nsmallest(
+                limit, unique.values()
+            )
+        ]
+
+
+def get_index():
+    """Return the index for the current dataset version, building it if needed"""
+    global _index, _index_version
+    version = DatasetVersion.current()
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                _index = PrefixIndex(
+                    RestaurantSummary.objects.values_list(
+                        "CAMIS",
+                        "DBA",
+                        "BORO",
+                        "latest_grade",
+                        "latest_inspection_date",
+                    ).iterator(chunk_size=5000)
+                )
+                _index_version = version
+    return _index
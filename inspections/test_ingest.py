@@ -0,0 +1,158 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tempfile
+from datetime import date
+from unittest import mock
+
+import pandas as pd
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from inspections import ingest
+from inspections.models import Violation
+
+CSV = (
+    "CAMIS,DBA,BUILDING,ZIPCODE,PHONE,INSPECTION DATE,VIOLATION CODE,SCORE,GRADE,"
+    "GRADE DATE,Latitude,Longitude\n"
+    "50000001,Csv Cafe,1,10004,2125550100,03/01/2024,10F,12,A,03/01/2024,40.7,-74.0\n"
+    "50000002,Csv Pizza,20,,,2024-02-02,,,,,0,0\n"
+    ",No Camis,,,,01/01/2024,,,,,,\n"
+    "50000003,Bad Date,,11201,,not a date,04L,7,,,,\n"
+)
+
+
+class TransformChunkTests(SimpleTestCase):
+    def setUp(self):
+        self.chunk = next(ingest.read_chunks(io.StringIO(CSV)))
+        self.frame = ingest.transform_chunk(self.chunk)
+        self.records = self.frame.to_dict("records")
+
+    def test_columns_follow_the_model(self):
+        self.assertEqual(list(self.frame.columns), ingest.MODEL_FIELDS)
+        # Columns missing from the file come through as blanks
+        self.assertIsNone(self.records[0]["CUISINE_DESCRIPTION"])
+
+    def test_values_are_converted_per_column(self):
+        cafe = self.records[0]
+        self.assertEqual(cafe["CAMIS"], 50000001)
+        self.assertEqual(cafe["INSPECTION_DATE"], date(2024, 3, 1))
+        self.assertEqual((cafe["SCORE"], cafe["ZIPCODE"]), (12.0, 10004.0))
+        # Codes and phone numbers stay text
+        self.assertEqual((cafe["PHONE"], cafe["BUILDING"]), ("2125550100", "1"))
+
+    def test_blanks_become_none(self):
+        pizza = self.records[1]
+        self.assertEqual(pizza["INSPECTION_DATE"], date(2024, 2, 2))
+        for field in ("ZIPCODE", "PHONE", "SCORE", "GRADE", "GRADE_DATE"):
+            self.assertIsNone(pizza[field], field)
+        self.assertIsNone(self.records[2]["INSPECTION_DATE"])
+
+    def test_rows_without_camis_are_dropped(self):
+        self.assertEqual(
+            [r["CAMIS"] for r in self.records], [50000001, 50000002, 50000003]
+        )
+
+    def test_coordinates_skip_ungeocoded_rows(self):
+        self.assertEqual(ingest.coordinates(self.chunk), {50000001: (40.7, -74.0)})
+
+    def test_build_inspections(self):
+        inspections = ingest.build_inspections(self.frame)
+        self.assertEqual(inspections[0].DBA, "Csv Cafe")
+        self.assertEqual(inspections[0].VIOLATION_CODE, "10F")
+
+    def test_prepared_chunks_keep_file_order_across_workers(self):
+        def blocks():
+            return ingest.read_blocks(io.BytesIO(CSV.encode()), chunksize=1)
+
+        inline = list(ingest.prepared_chunks(blocks()))
+        self.assertEqual(inline[0], ingest.prepare_chunk(self.chunk.iloc[:1]))
+        self.assertEqual(list(ingest.prepared_chunks(blocks(), workers=2)), inline)
+
+    def test_blocks_split_on_records_not_lines(self):
+        data = (
+            "CAMIS,DBA,VIOLATION DESCRIPTION\r\n"
+            '1,"Two\nLines","Quote ""here""\n, comma"\r\n'
+            "\r\n"
+            "2,Plain,\r\n"
+            '3,"Last",no newline'
+        ).encode()
+        blocks = list(ingest.read_blocks(io.BytesIO(data), chunksize=2))
+        self.assertEqual(len(blocks), 2)
+        expected = pd.read_csv(io.BytesIO(data), dtype=str)
+        parsed = pd.concat([ingest.parse_block(block) for block in blocks])
+        pd.testing.assert_frame_equal(parsed.reset_index(drop=True), expected)
+        # Unbuffered streams are split the same way
+        raw = ingest.CountingReader(io.BytesIO(data))
+        self.assertEqual(list(ingest.read_blocks(raw, chunksize=2)), blocks)
+
+
+class OpenSourceTests(SimpleTestCase):
+    def write(self, suffix, data):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_compressed_files_are_read_in_one_pass(self):
+        for suffix, compress in [
+            (".csv", bytes),
+            (".csv.gz", gzip.compress),
+            (".csv.bz2", bz2.compress),
+            (".CSV.XZ", lzma.compress),
+        ]:
+            with self.subTest(suffix):
+                path = self.write(suffix, compress(CSV.encode()))
+                with ingest.open_source(path) as (stream, counter):
+                    self.assertEqual(counter.size, os.path.getsize(path))
+                    chunk = next(ingest.read_chunks(stream))
+                    self.assertEqual(len(chunk), 4)
+                    # Progress counts the bytes on disk
+                    self.assertEqual(counter.position, counter.size)
+
+    def test_dash_reads_stdin(self):
+        stdin = io.TextIOWrapper(io.BytesIO(CSV.encode()))
+        with mock.patch("sys.stdin", stdin):
+            with ingest.open_source("-") as (stream, counter):
+                self.assertIsNone(counter.size)
+                self.assertEqual(len(next(ingest.read_chunks(stream))), 4)
+                self.assertEqual(counter.position, len(CSV.encode()))
+        self.assertFalse(stdin.closed)
+
+
+class SqliteBulkLoadTests(TestCase):
+    table = Violation._meta.db_table
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name = %s AND sql IS NOT NULL",
+                [self.table],
+            )
+            return sorted(name for (name,) in cursor.fetchall())
+
+    def cache_size(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA cache_size")
+            return cursor.fetchone()[0]
+
+    def test_settings_come_back_and_indexes_stay(self):
+        indexes, cache_size = self.index_names(), self.cache_size()
+        self.assertTrue(indexes)
+        with ingest.sqlite_bulk_load(connection):
+            # A load killed here leaves every index in place
+            self.assertEqual(self.index_names(), indexes)
+            self.assertEqual(self.cache_size(), ingest.BULK_CACHE_SIZE)
+        self.assertEqual(self.index_names(), indexes)
+        self.assertEqual(self.cache_size(), cache_size)
+
+    def test_settings_come_back_after_a_failed_load(self):
+        cache_size = self.cache_size()
+        with self.assertRaises(ValueError):
+            with ingest.sqlite_bulk_load(connection):
+                raise ValueError
+        self.assertEqual(self.cache_size(), cache_size)
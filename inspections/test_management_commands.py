@@ -1,7 +1,66 @@
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
-from inspections.models import RestaurantInspection, FollowedRestaurant
-from io import StringIO
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.db import connection
+from inspections import fts, ingest, shadow
+from inspections.management.commands.load_inspections import (
+    Command as LoadInspectionsCommand,
+)
+from inspections.models import (
+    DatasetVersion,
+    IngestDelta,
+    IngestRun,
+    Inspection,
+    OwnerRestaurant,
+    RestaurantInspection,
+    RestaurantNotification,
+    FollowedRestaurant,
+    RestaurantRating,
+    RestaurantSummary,
+    Violation,
+)
+from inspections.snapshot import MODELS
+from collections import Counter
+from datetime import date
+from io import BytesIO, StringIO, TextIOWrapper
+from unittest import mock
+import gzip
+import os
+import tempfile
+
+CSV_HEADER = (
+    "CAMIS,DBA,BORO,BUILDING,STREET,ZIPCODE,PHONE,CUISINE DESCRIPTION,"
+    "INSPECTION DATE,ACTION,VIOLATION CODE,VIOLATION DESCRIPTION,CRITICAL FLAG,"
+    "SCORE,GRADE,GRADE DATE,RECORD DATE,INSPECTION TYPE,Latitude,Longitude,"
+    "Community Board,Council District,Census Tract,BIN,BBL,NTA,Location Point1\n"
+)
+CSV_ROWS = [
+    "50000001,Csv Cafe,Manhattan,1,Broadway,10004,2125550100,Coffee/Tea,"
+    "03/01/2024,Violations were cited,10F,Improper storage,Not Critical,"
+    "12,A,03/01/2024,10/01/2025,Cycle Inspection / Initial Inspection,"
+    "40.70,-74.01,101,1,900,1000001,1000010001,MN01,\n",
+    "50000001,Csv Cafe,Manhattan,1,Broadway,10004,2125550100,Coffee/Tea,"
+    "01/15/2023,Violations were cited,04L,Evidence of mice,Critical,"
+    "28,B,01/15/2023,10/01/2025,Cycle Inspection / Initial Inspection,"
+    "40.70,-74.01,101,1,900,1000001,1000010001,MN01,\n",
+    "50000002,Csv Pizza,Brooklyn,20,Court St,11201,7185550100,Pizza,"
+    "02/02/2024,Violations were cited,02B,Hot food below 140F,Critical,"
+    "30,,,10/01/2025,Cycle Inspection / Initial Inspection,"
+    ",,302,33,500,3000001,3000010001,BK09,\n",
+]
+
+
+def write_inspections_csv(rows=CSV_ROWS):
+    handle = tempfile.NamedTemporaryFile(
+        "w", suffix=".csv", delete=False, encoding="utf-8"
+    )
+    with handle:
+        handle.write(CSV_HEADER)
+        handle.writelines(rows)
+    return handle.name
 
 
 class ManagementCommandsTestCase(TestCase):
@@ -58,6 +117,210 @@ class ManagementCommandsTestCase(TestCase):
         call_command("check_restaurant_updates", stdout=out)
         self.assertIn("Notification check complete", out.getvalue())
 
+    def test_check_restaurant_updates_notifies_every_follower(self):
+        RestaurantInspection.objects.create(
+            CAMIS=12345678,
+            DBA="Test Restaurant",
+            INSPECTION_DATE="2023-06-01",
+            GRADE="C",
+        )
+        for session_key in ("def456", "ghi789"):
+            FollowedRestaurant.objects.create(
+                session_key=session_key,
+                camis=12345678,
+                restaurant_name="Test Restaurant",
+                last_known_grade="A",
+                last_inspection_date="2024-01-01",
+                notify_violations=False,
+            )
+        out = StringIO()
+        call_command("check_restaurant_updates", "--days", "100000", stdout=out)
+        self.assertIn("Created 3 new notifications for 3 followed", out.getvalue())
+
+        first = FollowedRestaurant.objects.get(session_key="abc123")
+        self.assertEqual(first.last_known_grade, "A")
+        self.assertEqual(str(first.last_inspection_date), "2024-01-01")
+        self.assertEqual(
+            sorted(
+                RestaurantNotification.objects.filter(
+                    followed_restaurant=first
+                ).values_list("notification_type", flat=True)
+            ),
+            ["new_inspection", "score_improvement", "violation_added"],
+        )
+        # Followers who were already up to date only hear about nothing new
+        self.assertEqual(
+            RestaurantNotification.objects.exclude(followed_restaurant=first).count(),
+            0,
+        )
+
+    def test_check_restaurant_updates_queries_scale_with_restaurants(self):
+        # Rules run in memory; the query count does not grow with followers
+        with self.assertNumQueries(8):
+            call_command(
+                "check_restaurant_updates", "--days", "100000", stdout=StringIO()
+            )
+        FollowedRestaurant.objects.bulk_create(
+            FollowedRestaurant(
+                session_key=f"follower{i}",
+                camis=12345678,
+                restaurant_name="Test Restaurant",
+                last_known_grade="B",
+            )
+            for i in range(50)
+        )
+        with self.assertNumQueries(8):
+            call_command(
+                "check_restaurant_updates", "--days", "100000", stdout=StringIO()
+            )
+        # Grade, inspection and violation notices for each new follower; the
+        # first one has already been told about this inspection
+        self.assertEqual(RestaurantNotification.objects.count(), 3 + 50 * 3)
+        self.assertFalse(
+            FollowedRestaurant.objects.exclude(last_known_grade="A").exists()
+        )
+
+    def test_check_restaurant_updates_without_new_data_costs_one_query(self):
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command("check_restaurant_updates", stdout=out)
+        self.assertIn("No new inspection data", out.getvalue())
+        self.assertFalse(RestaurantNotification.objects.exists())
+
+    def test_check_restaurant_updates_consumes_load_deltas_once(self):
+        follower = FollowedRestaurant.objects.create(
+            session_key="abc123",
+            camis=50000001,
+            restaurant_name="Csv Cafe",
+            last_known_grade="B",
+            last_inspection_date="2023-01-15",
+        )
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        call_command("load_inspections", csv_file, stdout=StringIO())
+
+        out = StringIO()
+        call_command("check_restaurant_updates", stdout=out)
+        self.assertIn("Created 2 new notifications for 1 followed", out.getvalue())
+        self.assertEqual(
+            sorted(
+                follower.restaurantnotification_set.values_list(
+                    "notification_type", flat=True
+                )
+            ),
+            ["new_inspection", "score_improvement"],
+        )
+        self.assertFalse(IngestDelta.objects.filter(consumed_at__isnull=True).exists())
+
+        # Cron firing again finds nothing to do
+        out = StringIO()
+        call_command("check_restaurant_updates", stdout=out)
+        self.assertIn("No new inspection data", out.getvalue())
+
+        # A full reload of the same data changes nothing for the follower
+        call_command("load_inspections", csv_file, "--truncate", stdout=StringIO())
+        call_command("check_restaurant_updates", stdout=StringIO())
+        self.assertEqual(follower.restaurantnotification_set.count(), 2)
+
+        # A late-arriving inspection is noticed however old its date is
+        late_csv = write_inspections_csv(
+            [CSV_ROWS[0].replace("03/01/2024", "05/01/2024").replace(",A,", ",C,")]
+        )
+        self.addCleanup(os.remove, late_csv)
+        call_command("load_inspections", late_csv, "--incremental", stdout=StringIO())
+        call_command("check_restaurant_updates", stdout=StringIO())
+        self.assertEqual(
+            follower.restaurantnotification_set.filter(
+                notification_type__in=["new_inspection", "score_decline"]
+            ).count(),
+            3,
+        )
+        follower.refresh_from_db()
+        self.assertEqual(follower.last_known_grade, "C")
+
+    def test_check_restaurant_updates_reports_backfilled_visits(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        call_command("load_inspections", csv_file, stdout=StringIO())
+        IngestDelta.objects.update(consumed_at=timezone.now())
+        follower = FollowedRestaurant.objects.create(
+            session_key="abc123",
+            camis=50000001,
+            restaurant_name="Csv Cafe",
+            last_known_grade="A",
+            last_inspection_date="2024-03-01",
+        )
+
+        # A visit from before the latest one arrives late
+        late_row = CSV_ROWS[1].replace("01/15/2023", "06/01/2022").replace(",B,", ",C,")
+        backfill = write_inspections_csv([late_row])
+        self.addCleanup(os.remove, backfill)
+        call_command("load_inspections", backfill, "--incremental", stdout=StringIO())
+        call_command("check_restaurant_updates", stdout=StringIO())
+        self.assertEqual(
+            sorted(
+                follower.restaurantnotification_set.values_list(
+                    "notification_type", flat=True
+                )
+            ),
+            ["new_inspection", "violation_added"],
+        )
+        self.assertIn(
+            "June 01, 2022",
+            follower.restaurantnotification_set.get(
+                notification_type="new_inspection"
+            ).message,
+        )
+        # The latest inspection is still the one the follower knows
+        follower.refresh_from_db()
+        self.assertEqual(
+            (follower.last_known_grade, follower.last_inspection_date),
+            ("A", date(2024, 3, 1)),
+        )
+
+        # Reported once, and not again by a full reload
+        call_command("check_restaurant_updates", stdout=StringIO())
+        everything = write_inspections_csv([*CSV_ROWS, late_row])
+        self.addCleanup(os.remove, everything)
+        call_command("load_inspections", everything, "--truncate", stdout=StringIO())
+        call_command("check_restaurant_updates", stdout=StringIO())
+        self.assertEqual(follower.restaurantnotification_set.count(), 2)
+
+    def test_check_restaurant_updates_batches_large_changes(self):
+        run = IngestRun.objects.create(source="full reload", chunk_size=1)
+        IngestDelta.record(
+            Counter(
+                {
+                    (camis, None, None): 1
+                    for camis in [12345678, *range(50000000, 50000005)]
+                }
+            ),
+            Counter(),
+            run=run,
+        )
+        run.complete()
+        with mock.patch.object(RestaurantInspection, "RATING_BATCH_SIZE", 2):
+            latest = RestaurantInspection.latest_for(
+                [12345678, *range(50000000, 50000005)]
+            )
+            out = StringIO()
+            call_command("check_restaurant_updates", stdout=out)
+        self.assertEqual(list(latest), [12345678])
+        self.assertIn("Created 3 new notifications", out.getvalue())
+
+    def test_check_restaurant_updates_waits_for_the_run_to_complete(self):
+        run = IngestRun.objects.create(source="in progress", chunk_size=1)
+        IngestDelta.record(Counter({(12345678, None, None): 1}), Counter(), run=run)
+        out = StringIO()
+        call_command("check_restaurant_updates", stdout=out)
+        self.assertIn("No new inspection data", out.getvalue())
+
+        run.complete()
+        out = StringIO()
+        call_command("check_restaurant_updates", stdout=out)
+        self.assertIn("Created 3 new notifications", out.getvalue())
+        self.assertIsNotNone(IngestDelta.objects.get().consumed_at)
+
     def test_load_inspections_command_truncate(self):
         # Just test the command parses arguments and runs (no real file loaded)
         out = StringIO()
@@ -65,3 +328,419 @@ class ManagementCommandsTestCase(TestCase):
             call_command("load_inspections", "fake.csv", "--truncate", stdout=out)
         except Exception as e:
             self.assertIn("fake.csv", str(e))  # Should error on missing file
+
+    def test_load_inspections_builds_summaries(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        out = StringIO()
+        call_command("load_inspections", csv_file, stdout=out)
+        self.assertIn("Data loaded successfully", out.getvalue())
+        self.assertEqual(RestaurantInspection.objects.filter(CAMIS=50000001).count(), 2)
+
+        cafe = RestaurantSummary.objects.get(CAMIS=50000001)
+        self.assertEqual(cafe.latest_grade, "A")
+        self.assertEqual(cafe.inspection_count, 2)
+        self.assertEqual(cafe.ZIPCODE, 10004)
+        pizza = RestaurantSummary.objects.get(CAMIS=50000002)
+        self.assertIsNone(pizza.latest_grade)
+        self.assertEqual(pizza.latest_score, 30)
+        self.assertEqual((cafe.latitude, cafe.longitude), (40.70, -74.01))
+        self.assertIsNone(pizza.latitude)
+
+    def test_load_inspections_rates_touched_restaurants(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        RestaurantRating.objects.create(camis=50000009, description="orphan")
+        call_command("load_inspections", csv_file, stdout=StringIO())
+        cafe = RestaurantRating.objects.get(camis=50000001)
+        self.assertEqual(
+            cafe.as_dict(), RestaurantInspection.get_restaurant_rating(50000001)
+        )
+        self.assertEqual(RestaurantRating.objects.get(camis=50000002).grade, "N/A")
+        # Untouched rows survive an incremental load
+        self.assertTrue(RestaurantRating.objects.filter(camis=50000009).exists())
+
+    def test_rebuild_ratings_command(self):
+        RestaurantRating.objects.create(camis=50000009, description="orphan")
+        RestaurantInspection.objects.bulk_create(
+            [RestaurantInspection(CAMIS=50000003, GRADE="B")]
+        )
+        RestaurantSummary.refresh([50000003])
+        out = StringIO()
+        call_command("rebuild_ratings", stdout=out)
+        self.assertIn("Updated 2 restaurant ratings", out.getvalue())
+        self.assertEqual(
+            list(RestaurantRating.objects.values_list("camis", "grade")),
+            [(12345678, "A"), (50000003, "B")],
+        )
+
+        RestaurantRating.objects.filter(camis=50000003).update(
+            stale_on="2000-01-01", grade="?"
+        )
+        out = StringIO()
+        call_command("rebuild_ratings", "--stale", stdout=out)
+        self.assertIn("Updated 1 restaurant ratings", out.getvalue())
+        self.assertEqual(RestaurantRating.objects.get(camis=50000003).grade, "B")
+
+    def test_load_inspections_incremental_upserts_on_natural_key(self):
+        first = write_inspections_csv()
+        self.addCleanup(os.remove, first)
+        call_command("load_inspections", first, stdout=StringIO())
+        # One delta per visit, all of them new
+        self.assertEqual(
+            sorted(
+                IngestDelta.objects.values_list(
+                    "camis", "inspection_date", "inserted", "updated", "new_visit"
+                )
+            ),
+            [
+                (50000001, date(2023, 1, 15), 1, 0, True),
+                (50000001, date(2024, 3, 1), 1, 0, True),
+                (50000002, date(2024, 2, 2), 1, 0, True),
+            ],
+        )
+        IngestDelta.objects.all().delete()
+
+        # Same file again: nothing to do, caches stay valid
+        version = DatasetVersion.current()
+        out = StringIO()
+        call_command("load_inspections", first, "--incremental", stdout=out)
+        self.assertIn("Inserted 0, updated 0 of 3 rows", out.getvalue())
+        self.assertFalse(IngestDelta.objects.exists())
+        self.assertEqual(DatasetVersion.current(), version)
+
+        # The pizza visit gets graded and the cafe has a new visit
+        rows = list(CSV_ROWS)
+        rows[2] = rows[2].replace("30,,,", "30,A,02/02/2024,")
+        rows.append(rows[0].replace("03/01/2024", "06/01/2024"))
+        second = write_inspections_csv(rows)
+        self.addCleanup(os.remove, second)
+        call_command("load_inspections", second, "--incremental", stdout=StringIO())
+
+        self.assertEqual(RestaurantInspection.objects.filter(CAMIS=50000001).count(), 3)
+        self.assertEqual(RestaurantInspection.objects.filter(CAMIS=50000002).count(), 1)
+        self.assertEqual(
+            sorted(
+                IngestDelta.objects.values_list(
+                    "camis", "inspection_date", "inserted", "updated", "new_visit"
+                )
+            ),
+            [
+                (50000001, date(2024, 6, 1), 1, 0, True),
+                (50000002, date(2024, 2, 2), 0, 1, False),
+            ],
+        )
+        self.assertEqual(
+            RestaurantSummary.objects.get(CAMIS=50000002).latest_grade, "A"
+        )
+        self.assertEqual(
+            RestaurantSummary.objects.get(CAMIS=50000001).inspection_count, 3
+        )
+
+    def test_load_inspections_incremental_reload_records_no_deltas(self):
+        # A second row of the cafe's latest visit disagrees on the grade,
+        # the score and the restaurant's name
+        disagreeing = (
+            CSV_ROWS[0]
+            .replace("Csv Cafe,", "Csv Cafe II,")
+            .replace("10F,Improper storage", "06D,Unclean utensils")
+            .replace("12,A,", "20,B,")
+        )
+        # and a repeat of its 10F row is flagged critical
+        repeated = CSV_ROWS[0].replace(
+            "Improper storage,Not Critical", "Improper storage again,Critical"
+        )
+        csv_file = write_inspections_csv([*CSV_ROWS, repeated, disagreeing])
+        self.addCleanup(os.remove, csv_file)
+        with mock.patch.object(ingest, "CHUNK_SIZE", 1):
+            call_command("load_inspections", csv_file, stdout=StringIO())
+        stored = list(Inspection.objects.values_list("camis", "score", "grade"))
+        name = RestaurantSummary.objects.get(CAMIS=50000001).DBA
+        IngestDelta.objects.all().delete()
+
+        # Reloading in any chunks changes nothing and records nothing
+        for chunk_size in (1, 2, ingest.CHUNK_SIZE):
+            out = StringIO()
+            with mock.patch.object(ingest, "CHUNK_SIZE", chunk_size):
+                call_command("load_inspections", csv_file, "--incremental", stdout=out)
+            self.assertIn("Inserted 0, updated 0 of 5 rows", out.getvalue())
+            self.assertFalse(IngestDelta.objects.exists())
+        self.assertEqual(
+            list(Inspection.objects.values_list("camis", "score", "grade")), stored
+        )
+        # The last row of the visit wins
+        self.assertIn((50000001, 20.0, "B"), stored)
+        self.assertEqual(name, "Csv Cafe II")
+
+    def test_load_inspections_with_worker_processes(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        out = StringIO()
+        call_command("load_inspections", csv_file, "--workers", "2", stdout=out)
+        self.assertIn("Inserted 3, updated 0 of 3 rows", out.getvalue())
+        self.assertEqual(
+            sorted(RestaurantInspection.objects.values_list("CAMIS", "VIOLATION_CODE")),
+            [
+                (12345678, "04L"),
+                (50000001, "04L"),
+                (50000001, "10F"),
+                (50000002, "02B"),
+            ],
+        )
+        cafe = RestaurantSummary.objects.get(CAMIS=50000001)
+        self.assertEqual((cafe.latitude, cafe.longitude), (40.70, -74.01))
+
+        with self.assertRaises(CommandError):
+            call_command("load_inspections", csv_file, "--workers", "0")
+
+    def test_load_inspections_fast_mode(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        out = StringIO()
+        call_command("load_inspections", csv_file, "--fast", stdout=out)
+        self.assertIn("Inserted 3, updated 0 of 3 rows", out.getvalue())
+        self.assertEqual(
+            RestaurantSummary.objects.get(CAMIS=50000001).inspection_count, 2
+        )
+
+        out = StringIO()
+        call_command(
+            "load_inspections", csv_file, "--fast", "--incremental", stdout=out
+        )
+        self.assertIn("Inserted 0, updated 0 of 3 rows", out.getvalue())
+
+    def test_load_inspections_streams_gzip_and_stdin(self):
+        data = (CSV_HEADER + "".join(CSV_ROWS)).encode()
+        handle, csv_file = tempfile.mkstemp(suffix=".csv.gz")
+        with os.fdopen(handle, "wb") as file:
+            file.write(gzip.compress(data))
+        self.addCleanup(os.remove, csv_file)
+        out = StringIO()
+        call_command("load_inspections", csv_file, stdout=out)
+        self.assertIn("Inserted 3, updated 0 of 3 rows (100.00%)", out.getvalue())
+
+        out = StringIO()
+        with mock.patch("sys.stdin", TextIOWrapper(BytesIO(data))):
+            call_command("load_inspections", "-", "--incremental", stdout=out)
+        self.assertIn("Inserted 0, updated 0 of 3 rows (0.0 MB read)", out.getvalue())
+
+    def test_load_inspections_missing_file_keeps_data(self):
+        with self.assertRaises(FileNotFoundError):
+            call_command("load_inspections", "missing.csv", "--truncate")
+        self.assertTrue(RestaurantInspection.objects.exists())
+
+    def test_load_inspections_resumes_after_a_crash(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        with mock.patch.object(ingest, "CHUNK_SIZE", 1), self.crash_in_chunk(2):
+            with self.assertRaisesMessage(RuntimeError, "killed"):
+                call_command("load_inspections", csv_file, stdout=StringIO())
+
+        # Only the first chunk and its checkpoint were committed
+        run = IngestRun.objects.get()
+        self.assertEqual((run.chunks_committed, run.rows_committed), (1, 1))
+        self.assertIsNone(run.completed_at)
+        self.assertEqual(RestaurantInspection.objects.filter(CAMIS=50000001).count(), 1)
+
+        out = StringIO()
+        call_command("load_inspections", csv_file, "--resume", stdout=out)
+        self.assertIn("Resuming after 1 rows (1 chunks)", out.getvalue())
+        self.assertIn("Inserted 3, updated 0 of 3 rows", out.getvalue())
+        run.refresh_from_db()
+        self.assertEqual((run.chunks_committed, run.rows_committed), (3, 3))
+        self.assertIsNotNone(run.completed_at)
+        self.assertEqual(RestaurantInspection.objects.filter(CAMIS=50000001).count(), 2)
+        self.assertEqual(
+            sorted(run.deltas.values_list("camis", "inserted")),
+            [(50000001, 1), (50000001, 1), (50000002, 1)],
+        )
+
+        # Restaurants from before the crash were refreshed too
+        cafe = RestaurantSummary.objects.get(CAMIS=50000001)
+        self.assertEqual(cafe.inspection_count, 2)
+        self.assertEqual((cafe.latitude, cafe.longitude), (40.70, -74.01))
+
+        with self.assertRaisesMessage(CommandError, "No unfinished load"):
+            call_command("load_inspections", csv_file, "--resume")
+
+    def crash_in_chunk(self, number):
+        """Patch write_chunk to fail after writing chunk ``number``"""
+        write_chunk = LoadInspectionsCommand.write_chunk
+        calls = []
+
+        def crash(command, inspections, incremental):
+            calls.append(inspections)
+            result = write_chunk(command, inspections, incremental)
+            if len(calls) == number:
+                self.indexes_at_crash = self.index_names()
+                raise RuntimeError("killed")
+            return result
+
+        return mock.patch.object(LoadInspectionsCommand, "write_chunk", crash)
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name IN (%s, %s) AND sql IS NOT NULL ORDER BY name",
+                [Inspection._meta.db_table, Violation._meta.db_table],
+            )
+            return [name for (name,) in cursor.fetchall()]
+
+    def test_load_inspections_fast_resume_keeps_indexes(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        indexes = self.index_names()
+        self.assertTrue(indexes)
+
+        with mock.patch.object(ingest, "CHUNK_SIZE", 1), mock.patch(
+            "inspections.management.commands.load_inspections."
+            "FAST_CHUNKS_PER_TRANSACTION",
+            1,
+        ), self.crash_in_chunk(2):
+            with self.assertRaisesMessage(RuntimeError, "killed"):
+                call_command("load_inspections", csv_file, "--fast", stdout=StringIO())
+        # A process killed at this point never runs cleanup code
+        self.assertEqual(self.indexes_at_crash, indexes)
+
+        out = StringIO()
+        call_command("load_inspections", csv_file, "--resume", "--fast", stdout=out)
+        self.assertIn("Resuming after 1 rows (1 chunks)", out.getvalue())
+        self.assertEqual(self.index_names(), indexes)
+        self.assertIsNotNone(IngestRun.objects.get().completed_at)
+
+    def test_load_inspections_rerun_takes_over_an_interrupted_load(self):
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        with mock.patch.object(ingest, "CHUNK_SIZE", 1), self.crash_in_chunk(3):
+            with self.assertRaisesMessage(RuntimeError, "killed"):
+                call_command("load_inspections", csv_file, stdout=StringIO())
+        interrupted = IngestRun.objects.get()
+        # Both cafe rows are stored, but the cafe was never summarized
+        self.assertIsNone(RestaurantSummary.objects.get(CAMIS=50000001).latest_grade)
+
+        # Rerun from the start: the cafe rows come back unchanged
+        out = StringIO()
+        call_command("load_inspections", csv_file, "--incremental", stdout=out)
+        self.assertIn("Taking over 1 interrupted load(s)", out.getvalue())
+        self.assertIn("Inserted 1, updated 0 of 3 rows", out.getvalue())
+        self.assertEqual(
+            RestaurantSummary.objects.get(CAMIS=50000001).latest_grade, "A"
+        )
+        self.assertTrue(RestaurantRating.objects.filter(camis=50000001).exists())
+        interrupted.refresh_from_db()
+        self.assertIsNotNone(interrupted.completed_at)
+        self.assertIn(
+            50000001,
+            IngestDelta.pending(timezone.now()).values_list("camis", flat=True),
+        )
+
+    def test_load_inspections_shadow_swaps_in_a_full_reload(self):
+        def schema():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT type, name FROM sqlite_master "
+                    "WHERE name LIKE 'inspections_%' ORDER BY name"
+                )
+                return cursor.fetchall()
+
+        before = schema()
+        user = User.objects.create(username="owner")
+        RestaurantInspection.objects.create(CAMIS=50000001, DBA="Old Cafe")
+        kept = RestaurantSummary.objects.get(CAMIS=50000001)
+        OwnerRestaurant.objects.create(user=user, restaurant=kept)
+        gone = RestaurantSummary.objects.get(CAMIS=12345678)
+        OwnerRestaurant.objects.create(user=user, restaurant=gone)
+
+        csv_file = write_inspections_csv()
+        self.addCleanup(os.remove, csv_file)
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command("load_inspections", csv_file, "--shadow", "--fast", stdout=out)
+        self.assertIn("Swapped in the new tables", out.getvalue())
+
+        # Each secondary index is built once, under its own name, after the
+        # swap has committed
+        created = [
+            query["sql"].split('"')[1]
+            for query in queries.captured_queries
+            if query["sql"].startswith("CREATE") and " INDEX " in query["sql"]
+        ]
+        tables = [model._meta.db_table for model in MODELS]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' "
+                f"AND tbl_name IN ({', '.join(['%s'] * len(tables))}) "
+                "AND sql IS NOT NULL",
+                tables,
+            )
+            indexes = [name for (name,) in cursor.fetchall()]
+        self.assertTrue(indexes)
+        self.assertCountEqual(created, indexes)
+        swapped = max(
+            position
+            for position, query in enumerate(queries.captured_queries)
+            if query["sql"].startswith("ALTER TABLE")
+        )
+        self.assertTrue(
+            all(
+                position > swapped
+                for position, query in enumerate(queries.captured_queries)
+                if query["sql"].startswith("CREATE") and " INDEX " in query["sql"]
+            )
+        )
+
+        # The CSV replaced the whole dataset; tables and indexes keep their names
+        self.assertEqual(schema(), before)
+        self.assertEqual(
+            sorted(RestaurantInspection.objects.values_list("CAMIS", "DBA")),
+            [(50000001, "Csv Cafe"), (50000001, "Csv Cafe"), (50000002, "Csv Pizza")],
+        )
+        self.assertEqual(
+            sorted(RestaurantSummary.objects.values_list("CAMIS", flat=True)),
+            [50000001, 50000002],
+        )
+        self.assertEqual(RestaurantRating.objects.get(camis=50000001).grade, "A")
+        self.assertEqual(RestaurantSummary.objects.get(CAMIS=50000001).latitude, 40.70)
+        self.assertTrue(IngestRun.objects.get().completed_at)
+
+        # Owner links follow their restaurant into the new rows
+        owner = OwnerRestaurant.objects.get()
+        self.assertEqual(owner.restaurant.CAMIS, 50000001)
+        self.assertNotEqual(owner.restaurant_id, kept.id)
+
+        # Search is populated and kept in sync by its triggers again
+        summaries = RestaurantSummary.objects.all()
+        self.assertEqual(fts.filter_text(summaries, "csv").count(), 2)
+        RestaurantInspection.objects.create(CAMIS=50000003, DBA="Csv Bagels")
+        self.assertEqual(fts.filter_text(summaries, "csv").count(), 3)
+
+    def test_shadow_redirect_is_scoped_to_the_connection(self):
+        table = RestaurantSummary._meta.db_table
+        shadow.create_tables(connection)
+        self.addCleanup(shadow.drop_tables, connection)
+        with self.assertRaises(ZeroDivisionError):
+            with shadow.using_shadow_tables(connection):
+                RestaurantSummary.objects.create(CAMIS=50000001, DBA="Staged")
+                self.assertEqual(RestaurantSummary.objects.count(), 1)
+                1 / 0
+
+        # The model never changed, and the live table is read again
+        self.assertEqual(RestaurantSummary._meta.db_table, table)
+        self.assertFalse(RestaurantSummary.objects.filter(CAMIS=50000001).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT "DBA" FROM "{table}{shadow.SUFFIX}"')
+            self.assertEqual(cursor.fetchall(), [("Staged",)])
+
+    def test_load_inspections_shadow_rejects_other_modes(self):
+        for flag in ("--truncate", "--incremental", "--resume"):
+            with self.assertRaisesMessage(CommandError, "--shadow is a full reload"):
+                call_command("load_inspections", "x.csv", "--shadow", flag)
+
+    def test_load_inspections_rejects_resume_with_truncate(self):
+        with self.assertRaises(CommandError):
+            call_command("load_inspections", "x.csv", "--resume", "--truncate")
+
+    def test_load_inspections_rejects_truncate_with_incremental(self):
+        with self.assertRaises(CommandError):
+            call_command("load_inspections", "x.csv", "--truncate", "--incremental")
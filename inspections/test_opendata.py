@@ -0,0 +1,265 @@
+import csv
+import io
+import threading
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qsl, urlsplit
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from inspections import ingest, opendata
+from inspections.models import (
+    FollowedRestaurant,
+    IngestRun,
+    RestaurantInspection,
+    RestaurantRating,
+    RestaurantSummary,
+)
+
+FIELDS = [
+    "camis",
+    "dba",
+    "cuisine_description",
+    "inspection_date",
+    "violation_code",
+    "inspection_type",
+    "score",
+    "grade",
+    "latitude",
+    "longitude",
+    ":id",
+    ":updated_at",
+]
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """A Socrata resource endpoint serving ``server.rows`` as CSV"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        query = dict(parse_qsl(urlsplit(self.path).query))
+        server.queries.append(query)
+        server.clients.add(self.client_address)
+        status = 404 if int(query["$offset"]) >= server.fail_from else server.status
+        if status != 200:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        rows = sorted(server.rows, key=lambda row: row[":id"])
+        if "$where" in query:
+            since = datetime.fromisoformat(query["$where"].split("'")[1])
+            rows = [
+                row
+                for row in rows
+                if datetime.fromisoformat(row[":updated_at"]) > since
+            ]
+        offset, limit = int(query["$offset"]), int(query["$limit"])
+        out = io.StringIO()
+        writer = csv.DictWriter(out, FIELDS)
+        writer.writeheader()
+        writer.writerows(rows[offset : offset + limit])
+        body = out.getvalue().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def feed_row(row_id, camis, updated_at, **values):
+    row = dict.fromkeys(FIELDS, "")
+    row.update(
+        {
+            "camis": camis,
+            "dba": f"Feed {camis}",
+            "inspection_date": "2024-03-01T00:00:00.000",
+            "inspection_type": "Cycle Inspection / Initial Inspection",
+            ":id": f"row-{row_id:04}",
+            ":updated_at": updated_at,
+        },
+        **values,
+    )
+    return row
+
+
+class FeedServerMixin:
+    def start_server(self, rows):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+        self.server.rows = rows
+        self.server.queries = []
+        self.server.clients = set()
+        self.server.status = 200
+        self.server.fail_from = float("inf")
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        self.url = f"http://{host}:{port}/resource/test.csv"
+
+
+class FeedTests(FeedServerMixin, SimpleTestCase):
+    def test_pages_through_one_kept_alive_connection(self):
+        self.start_server(
+            [feed_row(i, 50000000 + i, "2024-03-02T10:00:00.000Z") for i in range(5)]
+        )
+        with opendata.make_session() as session:
+            feed = opendata.Feed(self.url, page_size=2, session=session)
+            pages = list(feed.pages())
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(
+            [query["$offset"] for query in self.server.queries], ["0", "2", "4"]
+        )
+        self.assertNotIn("$where", self.server.queries[0])
+        self.assertEqual(len(self.server.clients), 1)
+        self.assertEqual(feed.watermark, "2024-03-02T10:00:00.000Z")
+        self.assertGreater(feed.position, 0)
+
+        # API fields come back under the CSV export's headers
+        rows, _ = ingest.prepare_chunk(pages[0])
+        inspection = ingest.build_from_rows(rows)[0]
+        self.assertEqual(inspection.CAMIS, 50000000)
+        self.assertEqual(inspection.INSPECTION_DATE, date(2024, 3, 1))
+
+    def test_since_filters_on_updated_at(self):
+        self.start_server(
+            [
+                feed_row(1, 50000001, "2024-03-01T10:00:00.000Z"),
+                feed_row(2, 50000002, "2024-03-02T10:00:00.000Z"),
+            ]
+        )
+        feed = opendata.Feed(self.url, since="2024-03-01T10:00:00.000Z")
+        [page] = feed.pages()
+
+        self.assertEqual(page["CAMIS"].tolist(), ["50000002"])
+        self.assertEqual(
+            self.server.queries[0]["$where"],
+            ":updated_at > '2024-03-01T10:00:00.000Z'",
+        )
+
+
+class SyncInspectionsCommandTests(FeedServerMixin, TestCase):
+    def setUp(self):
+        self.start_server(
+            [
+                feed_row(1, 50000001, "2024-03-01T10:00:00.000Z", grade="A"),
+                feed_row(2, 50000001, "2024-03-01T10:00:00.000Z", violation_code="10F"),
+                feed_row(
+                    3,
+                    50000002,
+                    "2024-03-01T11:00:00.000Z",
+                    grade="B",
+                    latitude="40.7",
+                    longitude="-74.0",
+                ),
+            ]
+        )
+
+    def sync(self, *args):
+        out = StringIO()
+        call_command(
+            "sync_inspections", "--url", self.url, "--page-size", "2", *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_daily_sync_fetches_only_changed_rows(self):
+        output = self.sync()
+        self.assertIn("Fetching all rows", output)
+        self.assertEqual(
+            RestaurantInspection.objects.filter(CAMIS__gte=50000001).count(), 3
+        )
+        self.assertEqual(RestaurantSummary.objects.get(CAMIS=50000002).latitude, 40.7)
+        first = IngestRun.objects.get(source=self.url)
+        self.assertEqual(first.watermark, "2024-03-01T11:00:00.000Z")
+        self.assertIsNotNone(first.completed_at)
+
+        # One restaurant is regraded and a new one opens
+        self.server.rows[2].update(
+            grade="A", **{":updated_at": "2024-03-02T09:00:00.000Z"}
+        )
+        self.server.rows.append(feed_row(4, 50000003, "2024-03-02T09:30:00.000Z"))
+        self.server.queries.clear()
+
+        output = self.sync()
+        self.assertIn("changed after 2024-03-01T11:00:00.000Z", output)
+        self.assertIn("Inserted 1, updated 1 of 2 rows", output)
+        self.assertTrue(all("$where" in query for query in self.server.queries))
+        self.assertEqual(RestaurantInspection.objects.get(CAMIS=50000002).GRADE, "A")
+        self.assertEqual(
+            RestaurantInspection.objects.filter(CAMIS__gte=50000001).count(), 4
+        )
+        latest = IngestRun.objects.filter(source=self.url).first()
+        self.assertEqual(latest.watermark, "2024-03-02T09:30:00.000Z")
+        self.assertEqual(
+            set(latest.deltas.values_list("camis", flat=True)), {50000002, 50000003}
+        )
+
+        # Nothing changed since: one empty page, no writes
+        self.server.queries.clear()
+        self.assertIn("Refreshing 0 restaurant summaries", self.sync())
+        self.assertEqual(len(self.server.queries), 1)
+        self.assertEqual(
+            IngestRun.objects.filter(source=self.url).first().watermark,
+            "2024-03-02T09:30:00.000Z",
+        )
+
+    def test_failed_sync_keeps_the_watermark(self):
+        self.sync()
+        self.server.status = 404
+        with self.assertRaisesMessage(CommandError, "Sync from"):
+            self.sync()
+        self.assertEqual(IngestRun.last_watermark(self.url), "2024-03-01T11:00:00.000Z")
+
+        self.server.status = 200
+        self.sync("--full")
+        self.assertNotIn("$where", self.server.queries[-1])
+
+    def test_interrupted_sync_is_refreshed_and_notified_by_the_next(self):
+        follower = FollowedRestaurant.objects.create(
+            session_key="abc123",
+            camis=50000001,
+            restaurant_name="Feed 50000001",
+        )
+        # The first page commits, the second fails
+        self.server.fail_from = 2
+        with self.assertRaises(CommandError):
+            self.sync()
+        interrupted = IngestRun.objects.get(source=self.url)
+        self.assertIsNone(interrupted.completed_at)
+        # The restaurant is stored, but its summary was never refreshed
+        self.assertIsNone(RestaurantSummary.objects.get(CAMIS=50000001).latest_grade)
+        call_command("check_restaurant_updates", stdout=StringIO())
+        self.assertFalse(follower.restaurantnotification_set.exists())
+
+        self.server.fail_from = float("inf")
+        output = self.sync()
+        self.assertIn("Taking over 1 interrupted sync", output)
+        # The refetched first page is unchanged, but its restaurant is
+        # still summarized and rated
+        self.assertIn("Inserted 1, updated 0 of 3 rows", output)
+        self.assertEqual(
+            RestaurantSummary.objects.get(CAMIS=50000001).latest_grade, "A"
+        )
+        self.assertTrue(RestaurantRating.objects.filter(camis=50000001).exists())
+        interrupted.refresh_from_db()
+        self.assertIsNotNone(interrupted.completed_at)
+
+        call_command("check_restaurant_updates", stdout=StringIO())
+        # Both rows are one visit, graded A
+        self.assertCountEqual(
+            follower.restaurantnotification_set.values_list(
+                "notification_type", flat=True
+            ),
+            ["score_improvement", "new_inspection"],
+        )
@@ -0,0 +1,110 @@
+import re
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from inspections import search
+from inspections.models import (
+    FollowedRestaurant,
+    Inspection,
+    RestaurantInspection,
+    RestaurantSummary,
+    Violation,
+)
+
+# The feed-shaped view expands to its tables, aliased in the plan
+FULL_SCAN = re.compile(
+    r"\bSCAN (inspections_inspection|inspections_violation|"
+    r"inspections_restaurantsummary|visit|violation|restaurant)\b"
+)
+
+
+class QueryPlanTests(TestCase):
+    """Hot queries must be answered from an index, never a full table scan."""
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plans are checked on SQLite only")
+        RestaurantInspection.objects.create(
+            CAMIS=12345678,
+            DBA="Plan Diner",
+            BORO="MANHATTAN",
+            ZIPCODE=10001,
+            CUISINE_DESCRIPTION="American",
+            INSPECTION_DATE="2024-01-01",
+            GRADE="A",
+        )
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(FULL_SCAN.search(plan), f"Full table scan:\n{plan}")
+
+    def test_restaurant_detail_queries(self):
+        self.assertUsesIndex(RestaurantSummary.objects.filter(CAMIS=12345678))
+        self.assertUsesIndex(
+            Inspection.objects.filter(camis=12345678).order_by(
+                "-inspection_date", "-id"
+            )[:10]
+        )
+        self.assertUsesIndex(RestaurantInspection.objects.filter(CAMIS=12345678))
+
+    def test_rating_queries(self):
+        cutoff = date.today() - timedelta(days=1095)
+        graded = Inspection.objects.filter(
+            camis=12345678, grade__in=["A", "B", "C"]
+        ).exclude(inspection_date__year=1900)
+        self.assertUsesIndex(graded.filter(inspection_date__gte=cutoff))
+        self.assertUsesIndex(graded)
+
+    def test_latest_inspection_lookups(self):
+        # toggle_follow
+        latest = Inspection.objects.filter(camis=12345678).order_by("-inspection_date")
+        self.assertUsesIndex(latest[:1])
+        self.assertUsesIndex(
+            latest.filter(inspection_date__gte=date.today() - timedelta(days=1))[:1]
+        )
+
+    def test_grouped_latest_inspection_query(self):
+        # check_restaurant_updates
+        with CaptureQueriesContext(connection) as context:
+            RestaurantInspection.latest_for(
+                FollowedRestaurant.objects.values("camis"),
+                since=date.today() - timedelta(days=1),
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + context.captured_queries[0]["sql"])
+            plan = "\n".join(row[-1] for row in cursor.fetchall())
+        self.assertIsNone(FULL_SCAN.search(plan), f"Full table scan:\n{plan}")
+
+    def test_summary_refresh_query(self):
+        self.assertUsesIndex(
+            Inspection.objects.filter(camis__in=[12345678, 1]).order_by(
+                "camis", "-inspection_date", "-id"
+            )
+        )
+
+    def test_store_lookups(self):
+        self.assertUsesIndex(RestaurantSummary.objects.filter(CAMIS__in=[12345678, 1]))
+        self.assertUsesIndex(Inspection.objects.filter(camis__in=[12345678, 1]))
+        self.assertUsesIndex(
+            Violation.objects.filter(inspection__camis__in=[12345678, 1]).order_by("id")
+        )
+
+    def test_search_filters(self):
+        for params in [
+            {"borough": "manhattan"},
+            {"zipcode": "10001"},
+            {"cuisine": "americ"},
+            {"q": "plan"},
+            {"q": "plan", "borough": "MANHATTAN", "sort_by": "rating_high"},
+            {"lat": "40.75", "lng": "-73.99", "radius": "2"},
+        ]:
+            with self.subTest(params=params):
+                self.assertUsesIndex(
+                    search.search_queryset(search.parse_params(params))
+                )
+
+    def test_summary_lookup_by_camis(self):
+        self.assertUsesIndex(RestaurantSummary.objects.filter(CAMIS__in=[12345678]))
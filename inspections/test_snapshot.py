@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from inspections import fts, geo, snapshot
+from inspections.models import (
+    DatasetVersion,
+    Inspection,
+    RestaurantInspection,
+    RestaurantRating,
+    RestaurantSummary,
+    Violation,
+)
+
+
+class ColumnEncodingTests(SimpleTestCase):
+    def round_trip(self, values, kind):
+        arrays = {
+            f"col.{suffix}": array
+            for suffix, array in snapshot.encode_column(values, kind).items()
+        }
+        return snapshot.decode_column(arrays, "col", kind)
+
+    def test_text_is_dictionary_encoded(self):
+        values = ["Café", None, "Pizza", "Café", ""]
+        encoded = snapshot.encode_column(values, "text")
+        self.assertEqual(encoded["codes"].tolist(), [0, -1, 1, 0, 2])
+        self.assertEqual(self.round_trip(values, "text"), values)
+
+    def test_typed_columns_keep_nulls(self):
+        self.assertEqual(self.round_trip([3, None, 2**40], "int"), [3, None, 2**40])
+        self.assertEqual(self.round_trip([1.5, None], "float"), [1.5, None])
+        self.assertEqual(
+            self.round_trip([date(2024, 3, 1), None, date(1900, 1, 1)], "date"),
+            ["2024-03-01", None, "1900-01-01"],
+        )
+
+    def test_empty_columns(self):
+        for kind in ("int", "float", "text", "date", "datetime"):
+            self.assertEqual(self.round_trip([], kind), [])
+
+
+class SnapshotCommandTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        RestaurantInspection.objects.bulk_create(
+            [
+                RestaurantInspection(
+                    CAMIS=50000001,
+                    DBA="Snapshot Bistro",
+                    CUISINE_DESCRIPTION="French",
+                    INSPECTION_DATE=date(2024, 3, 1),
+                    INSPECTION_TYPE="Cycle Inspection / Initial Inspection",
+                    VIOLATION_CODE="10F",
+                    VIOLATION_DESCRIPTION="Non-food contact surface",
+                    SCORE=12,
+                    GRADE="A",
+                    GRADE_DATE=date(2024, 3, 1),
+                ),
+                RestaurantInspection(
+                    CAMIS=50000002, DBA="Snapshot Deli", INSPECTION_DATE=None
+                ),
+            ]
+        )
+        RestaurantSummary.refresh([50000001, 50000002])
+        RestaurantRating.refresh([50000001, 50000002])
+        RestaurantSummary.set_coordinates({50000001: (40.7, -74.0)})
+
+    def table_contents(self):
+        return [
+            list(model.objects.order_by("pk").values_list())
+            for model in snapshot.MODELS
+        ]
+
+    def test_round_trip_restores_tables_and_indexes(self):
+        before = self.table_contents()
+        call_command("export_snapshot", self.directory, stdout=StringIO())
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted(f"{model._meta.db_table}.npz" for model in snapshot.MODELS),
+        )
+
+        RestaurantInspection.objects.all().delete()
+        RestaurantSummary.objects.filter(CAMIS=50000002).delete()
+        RestaurantRating.objects.all().delete()
+        version = DatasetVersion.current()
+
+        out = StringIO()
+        call_command("import_snapshot", self.directory, stdout=out)
+        self.assertIn("inspections_violation: 2 rows", out.getvalue())
+        self.assertEqual(self.table_contents(), before)
+        self.assertEqual(Violation.objects.get(code="10F").inspection.camis, 50000001)
+        self.assertEqual(RestaurantInspection.objects.count(), 2)
+        self.assertNotEqual(DatasetVersion.current(), version)
+
+        # Search indexes were rebuilt and are kept in sync again
+        summaries = RestaurantSummary.objects.all()
+        self.assertEqual(
+            list(fts.filter_text(summaries, "bistro").values_list("CAMIS", flat=True)),
+            [50000001],
+        )
+        self.assertEqual(
+            list(
+                geo.filter_nearby(summaries, 40.7, -74.0, 1).values_list(
+                    "CAMIS", flat=True
+                )
+            ),
+            [50000001],
+        )
+        RestaurantInspection.objects.create(CAMIS=50000003, DBA="Bistro Two")
+        self.assertEqual(fts.filter_text(summaries, "bistro").count(), 2)
+
+    def test_mismatched_snapshot_is_rejected_before_any_change(self):
+        call_command("export_snapshot", self.directory, stdout=StringIO())
+        path = snapshot.path_for(self.directory, Inspection)
+        with np.load(path) as arrays:
+            arrays = dict(arrays)
+        arrays["__meta__"] = np.array('{"format": 99}')
+        np.savez_compressed(path, **arrays)
+
+        with self.assertRaisesMessage(CommandError, "unsupported format 99"):
+            call_command("import_snapshot", self.directory)
+        self.assertEqual(RestaurantInspection.objects.count(), 2)
+
+        os.remove(path)
+        with self.assertRaisesMessage(CommandError, "is missing"):
+            call_command("import_snapshot", self.directory)
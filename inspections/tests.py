@@ -1,10 +1,22 @@
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from inspections import facets, fts, ratings, search, suggest
 from inspections.templatetags.extra_filters import get_item
-from datetime import date
+from collections import Counter
+from datetime import date, timedelta
+import base64
+import json
+import re
+from unittest import mock
 from inspections.models import (
+    Inspection,
     RestaurantInspection,
+    RestaurantSummary,
+    RestaurantRating,
     RestaurantReview,
     FavoriteRestaurant,
     FollowedRestaurant,
@@ -12,6 +24,7 @@ from inspections.models import (
     RestaurantDetails,
     RestaurantMonthlySales,
     OwnerRestaurant,
+    Violation,
 )
 
 
@@ -213,6 +226,357 @@ class ModelMethodTests(TestCase):
         self.assertEqual(rating_info["inspection_count"], 0)
 
 
+class RestaurantRatingTests(TestCase):
+    def setUp(self):
+        today = date.today()
+        recent = today - timedelta(days=30)
+        old = today - timedelta(days=2000)
+        rows = [
+            # Recent A, A, B outweigh the old C
+            (51000001, recent, "A", 10),
+            (51000001, recent - timedelta(days=60), "A", 12),
+            (51000001, recent - timedelta(days=120), "B", 20),
+            (51000001, old, "C", 40),
+            # Only old grades: falls back to all time
+            (51000002, old, "C", 30),
+            (51000002, old - timedelta(days=90), "B", None),
+            # Placeholder dates and ungraded visits are ignored
+            (51000003, date(1900, 1, 1), "A", 5),
+            (51000003, recent, "N", 18),
+        ]
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(
+                CAMIS=camis, INSPECTION_DATE=day, GRADE=grade, SCORE=score
+            )
+            for camis, day, grade, score in rows
+        )
+        RestaurantSummary.refresh({camis for camis, _, _, _ in rows})
+        self.recent = recent
+        self.old = old
+
+    def test_recent_window(self):
+        rating = RestaurantInspection.get_restaurant_rating(51000001)
+        self.assertEqual(
+            rating,
+            {
+                "stars": 4.7,
+                "grade": "A",
+                "inspection_count": 3,
+                "latest_inspection": self.recent,
+                "description": "Excellent (mostly A grades, 3 inspections)",
+                "avg_score": 14,
+            },
+        )
+
+    def test_falls_back_to_all_inspections(self):
+        rating = RestaurantInspection.get_restaurant_rating(51000002)
+        self.assertEqual(rating["stars"], 3.5)
+        self.assertEqual(rating["grade"], "B")  # ties go to the better grade
+        self.assertEqual(rating["latest_inspection"], self.old)
+        self.assertEqual(rating["avg_score"], 30)
+        self.assertTrue(rating["description"].startswith("Good"))
+
+    def test_no_graded_inspections(self):
+        rating = RestaurantInspection.get_restaurant_rating(51000003)
+        self.assertEqual(rating["grade"], "N/A")
+        self.assertNotIn("avg_score", rating)
+
+    def test_bulk_ratings_use_one_query(self):
+        with self.assertNumQueries(1):
+            ratings = RestaurantInspection.get_ratings_for(
+                [51000001, 51000002, 51000003, 51000004]
+            )
+        self.assertEqual(set(ratings), {51000001, 51000002, 51000003, 51000004})
+        for camis, rating in ratings.items():
+            self.assertEqual(rating, RestaurantInspection.get_restaurant_rating(camis))
+
+
+class StoredRatingTests(TestCase):
+    def setUp(self):
+        self.today = date(2026, 6, 1)
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(CAMIS=52000001, INSPECTION_DATE=day, GRADE=grade)
+            for day, grade in [
+                (date(2024, 3, 1), "A"),
+                (date(2023, 7, 1), "C"),
+                (date(2021, 1, 1), "B"),
+            ]
+        )
+        RestaurantSummary.refresh([52000001])
+        RestaurantRating.refresh([52000001, 52000002], today=self.today)
+
+    def test_refresh_stores_rating_and_window_expiry(self):
+        rating = RestaurantRating.objects.get(camis=52000001)
+        self.assertEqual(rating.stars, 4.0)
+        self.assertEqual(rating.inspection_count, 2)
+        # 2023-07-01 falls out of the 1095-day window on 2026-07-01
+        self.assertEqual(rating.stale_on, date(2026, 7, 1))
+        self.assertFalse(RestaurantRating.objects.filter(camis=52000002).exists())
+
+    def test_refresh_stale_only_touches_expired_rows(self):
+        self.assertEqual(RestaurantRating.refresh_stale(today=self.today), 0)
+        later = date(2026, 7, 1)
+        self.assertEqual(RestaurantRating.refresh_stale(today=later), 1)
+        rating = RestaurantRating.objects.get(camis=52000001)
+        self.assertEqual((rating.stars, rating.grade), (5.0, "A"))
+        self.assertEqual(rating.stale_on, date(2027, 3, 2))
+
+    def test_refresh_runs_in_batches(self):
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(CAMIS=52000010 + i, GRADE="A") for i in range(3)
+        )
+        camis_values = [52000001, 52000002, 52000010, 52000011, 52000012]
+        with mock.patch.object(
+            RestaurantInspection, "RATING_BATCH_SIZE", 2
+        ), CaptureQueriesContext(connection) as context:
+            self.assertEqual(
+                RestaurantRating.refresh(camis_values, today=self.today), 4
+            )
+        # No statement lists more CAMIS values than one batch
+        for query in context.captured_queries:
+            for values in re.findall(r'(?i)camis" IN \(([^()]*)\)', query["sql"]):
+                self.assertLessEqual(values.count(",") + 1, 2, query["sql"])
+        self.assertEqual(
+            set(RestaurantRating.objects.values_list("camis", flat=True)),
+            {52000001, 52000010, 52000011, 52000012},
+        )
+
+    def test_views_read_stored_ratings(self):
+        RestaurantRating.objects.filter(camis=52000001).update(
+            description="Stored rating"
+        )
+        with self.assertNumQueries(1):
+            ratings = RestaurantRating.ratings_for([52000001])
+        self.assertEqual(ratings[52000001]["description"], "Stored rating")
+        response = self.client.get(reverse("restaurant_detail", args=[52000001]))
+        self.assertContains(response, "Stored rating")
+
+    def test_unrated_restaurants_are_computed_on_the_fly(self):
+        RestaurantInspection.objects.bulk_create(
+            [RestaurantInspection(CAMIS=52000003, GRADE="B")]
+        )
+        RestaurantSummary.refresh([52000003])
+        ratings = RestaurantRating.ratings_for([52000003])
+        self.assertEqual(ratings[52000003]["grade"], "B")
+
+    def test_inspection_edits_refresh_the_rating(self):
+        RestaurantInspection.objects.create(
+            CAMIS=52000001, INSPECTION_DATE=date.today(), GRADE="A"
+        )
+        rating = RestaurantRating.objects.get(camis=52000001)
+        self.assertEqual(rating.latest_inspection, date.today())
+
+
+class NormalizedInspectionTests(TestCase):
+    def setUp(self):
+        visit = {
+            "CAMIS": 53000001,
+            "DBA": "Visit Cafe",
+            "INSPECTION_DATE": date.today() - timedelta(days=30),
+            "INSPECTION_TYPE": "Cycle Inspection / Initial Inspection",
+            "ACTION": "Violations were cited",
+            "Census_Tract": 900,
+        }
+        RestaurantInspection.objects.bulk_create(
+            [
+                RestaurantInspection(
+                    **visit,
+                    VIOLATION_CODE="04L",
+                    VIOLATION_DESCRIPTION="Evidence of mice",
+                    CRITICAL_FLAG="Critical",
+                    SCORE=12,
+                    GRADE="A",
+                ),
+                # Same visit, blank grade/score on the second violation row
+                RestaurantInspection(
+                    **visit, VIOLATION_CODE="10F", VIOLATION_DESCRIPTION="Storage"
+                ),
+                RestaurantInspection(
+                    CAMIS=53000001,
+                    INSPECTION_DATE=date.today() - timedelta(days=400),
+                    INSPECTION_TYPE="Cycle Inspection / Initial Inspection",
+                    GRADE="B",
+                ),
+            ]
+        )
+        RestaurantSummary.refresh([53000001])
+
+    def test_rows_grouped_into_visits_and_violations(self):
+        latest, earlier = Inspection.objects.filter(camis=53000001)
+        self.assertEqual((latest.grade, latest.score), ("A", 12))
+        self.assertEqual(
+            sorted(latest.violations.values_list("code", flat=True)), ["04L", "10F"]
+        )
+        self.assertEqual(earlier.grade, "B")
+        # The visit's feed row is kept, with no violation on it
+        self.assertEqual(
+            list(earlier.violations.values_list("code", flat=True)), [None]
+        )
+        summary = RestaurantSummary.objects.get(CAMIS=53000001)
+        self.assertEqual(summary.Census_Tract, 900)
+
+    def test_feed_rows_are_stored_once_per_table(self):
+        self.assertEqual(RestaurantSummary.objects.filter(CAMIS=53000001).count(), 1)
+        self.assertEqual(Inspection.objects.filter(camis=53000001).count(), 2)
+        self.assertEqual(Violation.objects.count(), 3)
+        # The view puts the feed back together, one row per stored row
+        rows = RestaurantInspection.objects.filter(CAMIS=53000001).order_by("id")
+        self.assertEqual(
+            list(rows.values_list("id", "DBA", "VIOLATION_CODE", "GRADE")),
+            [
+                (violation.id, "Visit Cafe", violation.code, violation.inspection.grade)
+                for violation in Violation.objects.order_by("id")
+            ],
+        )
+        self.assertEqual(rows[1].GRADE, "A")
+
+    def test_rows_upsert_on_their_natural_key(self):
+        visit_ids = sorted(Inspection.objects.values_list("id", flat=True))
+        row_ids = sorted(Violation.objects.values_list("id", flat=True))
+        rows = list(RestaurantInspection.objects.filter(CAMIS=53000001).order_by("id"))
+        for row in rows:
+            row.pk = None
+        self.assertEqual(
+            RestaurantInspection.store(rows, match=True), (Counter(), Counter(), set())
+        )
+
+        # The visit keeps the values of its last row, so a disagreeing
+        # earlier row changes nothing however often it is reloaded
+        rows[0].SCORE = 13
+        self.assertEqual(
+            RestaurantInspection.store(rows, match=True), (Counter(), Counter(), set())
+        )
+        self.assertEqual(Inspection.objects.get(camis=53000001, grade="A").score, 12)
+
+        # Both rows of the visit show the new score
+        rows[1].SCORE = 13
+        inserted, updated, created = RestaurantInspection.store(rows, match=True)
+        visit = (53000001, rows[0].INSPECTION_DATE, rows[0].INSPECTION_TYPE)
+        self.assertEqual((inserted, updated, created), (Counter(), {visit: 2}, set()))
+        self.assertEqual(sorted(row.pk for row in rows), row_ids)
+        self.assertEqual(
+            sorted(Inspection.objects.values_list("id", flat=True)), visit_ids
+        )
+        self.assertEqual(Violation.objects.count(), 3)
+
+    def test_refresh_keeps_visit_and_violation_rows(self):
+        ids = list(Violation.objects.values_list("id", "inspection_id"))
+        RestaurantSummary.refresh([53000001])
+        RestaurantSummary.rebuild()
+        self.assertEqual(
+            list(Violation.objects.values_list("id", "inspection_id")), ids
+        )
+
+    def test_rating_counts_visits_not_violations(self):
+        rating = RestaurantInspection.get_restaurant_rating(53000001)
+        self.assertEqual(rating["inspection_count"], 2)
+        self.assertEqual(rating["stars"], 4.5)
+
+    def test_removed_restaurants_lose_their_visits(self):
+        RestaurantInspection.objects.filter(CAMIS=53000001).delete()
+        RestaurantSummary.rebuild()
+        self.assertFalse(Inspection.objects.exists())
+        self.assertFalse(Violation.objects.exists())
+
+    def test_detail_page_lists_violations_per_visit(self):
+        response = self.client.get(reverse("restaurant_detail", args=[53000001]))
+        self.assertEqual(len(response.context["all_inspections"]), 2)
+        self.assertEqual(response.context["total_inspections"], 2)
+        self.assertContains(response, "Evidence of mice")
+        self.assertContains(response, "Storage")
+
+
+class RatingEngineTests(TestCase):
+    def setUp(self):
+        today = date.today()
+        grade_mixes = ["A", "AB", "ABC", "CCB", "BBCC", "C", "AAAB", "CB"]
+        rows = []
+        for number, mix in enumerate(grade_mixes):
+            camis = 54000000 + number
+            for position, grade in enumerate(mix):
+                # Odd restaurants only have visits older than the window
+                age = 200 * position + (1500 if number % 2 else 10)
+                score = None if position == 1 else 7 * number + position
+                rows.append((camis, today - timedelta(days=age), grade, score))
+        rows += [
+            (54000100, date(1900, 1, 1), "A", 1),  # placeholder date only
+            (54000101, today, "N", 20),  # not graded yet
+        ]
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(
+                CAMIS=camis, INSPECTION_DATE=day, GRADE=grade, SCORE=score
+            )
+            for camis, day, grade, score in rows
+        )
+        RestaurantSummary.rebuild()
+        self.camis_values = sorted({row[0] for row in rows})
+
+    def test_matches_per_restaurant_ratings(self):
+        RestaurantRating.objects.create(camis=54000999, description="orphan")
+        self.assertEqual(ratings.recompute_all(), len(self.camis_values))
+        stored = RestaurantRating.objects.in_bulk(field_name="camis")
+        self.assertEqual(sorted(stored), self.camis_values)
+        expected = RestaurantInspection.compute_ratings(self.camis_values)
+        for camis, rating, stale_on in expected:
+            with self.subTest(camis=camis):
+                self.assertEqual(stored[camis].as_dict(), rating)
+                self.assertEqual(stored[camis].stale_on, stale_on)
+
+    def test_updates_existing_rows_in_place(self):
+        RestaurantRating.refresh([54000000])
+        row_id = RestaurantRating.objects.get(camis=54000000).pk
+        RestaurantRating.objects.filter(pk=row_id).update(stars=1, grade="C")
+        ratings.recompute_all()
+        rating = RestaurantRating.objects.get(camis=54000000)
+        self.assertEqual((rating.pk, rating.stars, rating.grade), (row_id, 5.0, "A"))
+
+
+class RestaurantSummaryTests(TestCase):
+    def setUp(self):
+        for inspection_date, grade, score, violation in [
+            ("2023-05-01", "B", 20, "02B"),
+            ("2024-03-01", None, None, "04L"),
+            ("2024-03-01", "A", 9, "10F"),
+        ]:
+            RestaurantInspection.objects.create(
+                CAMIS=12345678,
+                DBA="Summary Diner",
+                BORO="QUEENS",
+                CUISINE_DESCRIPTION="American",
+                INSPECTION_DATE=inspection_date,
+                GRADE=grade,
+                SCORE=score,
+                VIOLATION_CODE=violation,
+            )
+
+    def test_summary_tracks_latest_inspection(self):
+        summary = RestaurantSummary.objects.get(CAMIS=12345678)
+        self.assertEqual(summary.DBA, "Summary Diner")
+        self.assertEqual(summary.latest_grade, "A")
+        self.assertEqual(summary.latest_score, 9)
+        self.assertEqual(summary.latest_inspection_date, date(2024, 3, 1))
+        self.assertEqual(summary.inspection_count, 2)
+        self.assertEqual(summary.search_rating["stars"], 5)
+
+    def test_summary_removed_with_last_inspection(self):
+        for inspection in RestaurantInspection.objects.filter(CAMIS=12345678):
+            inspection.delete()
+        self.assertFalse(RestaurantSummary.objects.filter(CAMIS=12345678).exists())
+
+    def test_rebuild_after_bulk_insert(self):
+        RestaurantInspection.objects.bulk_create(
+            [RestaurantInspection(CAMIS=87654321, DBA="Bulk Bistro", GRADE="C")]
+        )
+        # The restaurant is stored, its derived columns wait for a rebuild
+        summary = RestaurantSummary.objects.get(CAMIS=87654321)
+        self.assertEqual(summary.DBA, "Bulk Bistro")
+        self.assertIsNone(summary.latest_grade)
+        RestaurantSummary.rebuild()
+        summary = RestaurantSummary.objects.get(CAMIS=87654321)
+        self.assertEqual(summary.search_rating["grade"], "C")
+        self.assertEqual(RestaurantSummary.objects.count(), 2)
+
+
 class RestaurantReviewModelTests(TestCase):
     def test_review_creation(self):
         review = RestaurantReview.objects.create(
@@ -361,6 +725,439 @@ class SearchFilterTests(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        for camis, name, cuisine, street in [
+            (31111111, "Joe's Pizza", "Pizza", "Carmine St"),
+            (32222222, "Pizza Pizza Pizza", "Pizza", "Broadway"),
+            (33333333, "Crème Brûlée Café", "French", "Pizzaro Ave"),
+            (34444444, "Taco Town", "Mexican", "Main St"),
+        ]:
+            RestaurantInspection.objects.create(
+                CAMIS=camis,
+                DBA=name,
+                CUISINE_DESCRIPTION=cuisine,
+                STREET=street,
+                BORO="MANHATTAN",
+                INSPECTION_DATE="2024-01-01",
+                GRADE="A",
+            )
+
+    def search(self, query):
+        return list(
+            fts.filter_text(RestaurantSummary.objects.all(), query)
+            .order_by("search_rank", "CAMIS")
+            .values_list("CAMIS", flat=True)
+        )
+
+    def test_prefix_match_ranks_best_match_first(self):
+        results = self.search("piz")
+        self.assertEqual(results[0], 32222222)
+        self.assertCountEqual(results, [31111111, 32222222, 33333333])
+
+    def test_all_words_must_match_and_accents_are_ignored(self):
+        self.assertEqual(self.search("creme cafe"), [33333333])
+        self.assertEqual(self.search("joe pizza"), [31111111])
+
+    def test_index_follows_summary_updates(self):
+        inspection = RestaurantInspection.objects.get(CAMIS=34444444)
+        inspection.DBA = "Burrito Barn"
+        inspection.save()
+        self.assertEqual(self.search("taco"), [])
+        self.assertEqual(self.search("burrito"), [34444444])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(
+            fts.match_expression('pizza" OR NEAR(x'), '"pizza"* "or"* "near"* "x"*'
+        )
+        self.assertEqual(self.search('"*'), [])
+
+    def test_search_view_uses_relevance_order(self):
+        response = self.client.get(reverse("search_restaurants"), {"q": "pizza"})
+        names = [r["info"].DBA for r in response.context["restaurants"]]
+        self.assertEqual(names[0], "Pizza Pizza Pizza")
+
+
+class DatabaseSortingAndPagingTests(TestCase):
+    def setUp(self):
+        grades = ["A", "B", "C", None, "Z"]
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(
+                CAMIS=40000000 + i,
+                DBA=f"Diner {i:02d}",
+                BORO="QUEENS",
+                INSPECTION_DATE=date(2024, 1, 1 + i) if i % 5 else None,
+                GRADE=grades[i % 5],
+            )
+            for i in range(25)
+        )
+        RestaurantSummary.rebuild()
+
+    def sorted_camis(self, sort_by):
+        params = search.parse_params({"borough": "QUEENS", "sort_by": sort_by})
+        return list(search.search_queryset(params).values_list("CAMIS", flat=True))
+
+    def test_rating_sorts_match_grade_stars(self):
+        stars = {
+            s.CAMIS: s.search_rating["stars"] for s in RestaurantSummary.objects.all()
+        }
+        high = self.sorted_camis("rating_high")
+        self.assertEqual([stars[c] for c in high], sorted(stars.values(), reverse=True))
+        low = self.sorted_camis("rating_low")
+        self.assertEqual([stars[c] for c in low], sorted(stars.values()))
+
+    def test_latest_inspection_puts_undated_last(self):
+        ordered = self.sorted_camis("latest_inspection")
+        self.assertEqual(ordered[0], 40000024)
+        self.assertEqual(
+            ordered[-5:], [40000000, 40000005, 40000010, 40000015, 40000020]
+        )
+
+    def test_unknown_sort_falls_back_to_name(self):
+        self.assertEqual(
+            search.parse_params({"sort_by": "drop table"})["sort_by"], "relevance"
+        )
+        self.assertEqual(self.sorted_camis("bogus"), sorted(self.sorted_camis("name")))
+
+    def test_view_renders_only_requested_page(self):
+        response = self.client.get(
+            reverse("search_restaurants"),
+            {"borough": "QUEENS", "sort_by": "name", "page": 2},
+        )
+        self.assertEqual(response.context["total_results"], 25)
+        names = [r["info"].DBA for r in response.context["restaurants"]]
+        self.assertEqual(names, [f"Diner {i:02d}" for i in range(20, 25)])
+
+
+class SavedRestaurantFlagsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="flags", password="pw")
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(CAMIS=45000000 + i, DBA=f"Flag {i:02d}", BORO="BRONX")
+            for i in range(30)
+        )
+        RestaurantSummary.rebuild()
+
+    def test_flags_cover_session_and_user_rows(self):
+        self.client.login(username="flags", password="pw")
+        session_key = self.client.session.session_key
+        FavoriteRestaurant.objects.create(
+            session_key=session_key, camis=45000001, restaurant_name="Flag 01"
+        )
+        FavoriteRestaurant.objects.create(
+            session_key="other-device", user=self.user, camis=45000002
+        )
+        FollowedRestaurant.objects.create(
+            session_key=session_key, camis=45000003, restaurant_name="Flag 03"
+        )
+        FavoriteRestaurant.objects.create(session_key="stranger", camis=45000004)
+
+        response = self.client.get(
+            reverse("search_restaurants"), {"borough": "BRONX", "sort_by": "name"}
+        )
+        rows = {r["info"].CAMIS: r for r in response.context["restaurants"]}
+        self.assertEqual(len(rows), 20)
+        self.assertTrue(rows[45000001]["is_favorited"])
+        self.assertTrue(rows[45000002]["is_favorited"])
+        self.assertTrue(rows[45000003]["is_followed"])
+        self.assertFalse(rows[45000004]["is_favorited"])
+        self.assertFalse(rows[45000001]["is_followed"])
+
+    def test_flag_queries_do_not_grow_with_results(self):
+        self.client.get(reverse("search_restaurants"))
+        params = {"borough": "BRONX", "sort_by": "name"}
+        with CaptureQueriesContext(connection) as page_of_twenty:
+            self.client.get(reverse("search_restaurants"), params)
+        with CaptureQueriesContext(connection) as page_of_ten:
+            self.client.get(reverse("search_restaurants"), {**params, "page": 2})
+        self.assertEqual(len(page_of_twenty), len(page_of_ten))
+
+
+class SearchFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for camis, cuisine, boro, zipcode in [
+            (46000001, "Pizza", "BROOKLYN", 11201),
+            (46000002, "Pizza", "BROOKLYN", 11201),
+            (46000003, "Thai", "QUEENS", 11101),
+            (46000004, "", None, None),
+        ]:
+            RestaurantInspection.objects.create(
+                CAMIS=camis, CUISINE_DESCRIPTION=cuisine, BORO=boro, ZIPCODE=zipcode
+            )
+
+    def test_facets_count_restaurants(self):
+        result = facets.get_facets()
+        self.assertEqual(
+            [(f["value"], f["count"]) for f in result["cuisine"]],
+            [("Pizza", 2), ("Thai", 1)],
+        )
+        self.assertEqual(result["borough"][0]["label"], "BROOKLYN (2)")
+        self.assertEqual(result["zipcode"][0]["value"], "11101")
+
+    def test_facets_cached_until_dataset_version_changes(self):
+        facets.get_facets()
+        with self.assertNumQueries(1):
+            facets.get_facets()
+        RestaurantInspection.objects.create(CAMIS=46000005, CUISINE_DESCRIPTION="Thai")
+        thai = [f for f in facets.get_facets()["cuisine"] if f["value"] == "Thai"]
+        self.assertEqual(thai[0]["count"], 2)
+
+    def test_search_page_lists_facet_counts(self):
+        response = self.client.get(reverse("search_restaurants"))
+        self.assertContains(response, "Pizza (2)")
+
+
+class SearchApiTests(TestCase):
+    def setUp(self):
+        grades = ["A", "B", None, "C"]
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(
+                CAMIS=47000000 + i,
+                DBA=f"Api Deli {i % 7}",
+                BORO="STATEN ISLAND",
+                INSPECTION_DATE=date(2024, 1 + i % 3, 1) if i % 4 else None,
+                GRADE=grades[i % 4],
+            )
+            for i in range(23)
+        )
+        RestaurantSummary.rebuild()
+
+    def walk(self, **params):
+        camis, cursor, pages = [], None, 0
+        while True:
+            query = {"borough": "staten island", "limit": 5, **params}
+            if cursor:
+                query["cursor"] = cursor
+            data = self.client.get(reverse("api_search"), query).json()
+            camis.extend(row["camis"] for row in data["results"])
+            pages += 1
+            cursor = data["next_cursor"]
+            if not cursor:
+                return camis, pages
+
+    def test_cursor_walk_matches_full_ordering(self):
+        for sort_by in search.SORT_OPTIONS:
+            with self.subTest(sort_by=sort_by):
+                expected = list(
+                    search.search_queryset(
+                        search.parse_params(
+                            {"borough": "staten island", "sort_by": sort_by}
+                        )
+                    ).values_list("CAMIS", flat=True)
+                )
+                camis, pages = self.walk(sort_by=sort_by)
+                self.assertEqual(camis, expected)
+                self.assertEqual(pages, 5)
+
+    def test_result_shape(self):
+        data = self.client.get(
+            reverse("api_search"), {"q": "api deli 3", "sort_by": "name"}
+        ).json()
+        row = data["results"][0]
+        self.assertEqual(row["name"], "Api Deli 3")
+        self.assertEqual(row["borough"], "STATEN ISLAND")
+        self.assertIn(row["grade"], ["A", "B", "C", "N/A"])
+        self.assertIsNone(data["next_cursor"])
+
+    def test_invalid_or_foreign_cursor_rejected(self):
+        first = self.client.get(
+            reverse("api_search"), {"sort_by": "name", "limit": 2}
+        ).json()
+        response = self.client.get(
+            reverse("api_search"),
+            {"sort_by": "grade", "cursor": first["next_cursor"]},
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("api_search"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("api_search"), {"limit": "many"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_values_of_the_wrong_type_rejected(self):
+        def cursor(*payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        for sort_by, value in [
+            ("latest_inspection", 5),
+            ("latest_inspection", "yesterday"),
+            ("name", 5),
+            ("grade", "A"),
+            ("grade", 1.5),
+            ("rating_high", True),
+            ("rating_low", None),
+        ]:
+            with self.subTest(sort_by=sort_by, value=value):
+                response = self.client.get(
+                    reverse("api_search"),
+                    {"sort_by": sort_by, "cursor": cursor(sort_by, value, 1)},
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        for camis, name, grade, inspection_date in [
+            (48000001, "Joe's Pizza", "B", "2024-05-01"),
+            (48000002, "Pizza Hut", "A", "2023-01-01"),
+            (48000003, "Pizzeria Uno", "A", "2024-06-01"),
+            (48000004, "Café Pizzicato", None, "2024-07-01"),
+            (48000005, "Burger Joint", "A", "2024-01-01"),
+        ]:
+            RestaurantInspection.objects.create(
+                CAMIS=camis, DBA=name, GRADE=grade, INSPECTION_DATE=inspection_date
+            )
+
+    def test_ranked_by_grade_then_recency(self):
+        response = self.client.get(reverse("api_suggest"), {"q": "PIZ"})
+        names = [row["name"] for row in response.json()["suggestions"]]
+        self.assertEqual(
+            names, ["Pizzeria Uno", "Pizza Hut", "Joe's Pizza", "Café Pizzicato"]
+        )
+
+    def test_matches_later_words_and_ignores_accents(self):
+        index = suggest.get_index()
+        self.assertEqual([r["camis"] for r in index.search("cafe p")], [48000004])
+        self.assertEqual([r["camis"] for r in index.search("joint")], [48000005])
+        self.assertEqual(index.search("   "), [])
+        self.assertEqual(len(index.search("pizz", limit=2)), 2)
+
+    def test_index_rebuilt_when_dataset_changes(self):
+        self.assertEqual(suggest.get_index().search("taco"), [])
+        RestaurantInspection.objects.create(CAMIS=48000006, DBA="Taco Loco")
+        self.assertEqual(suggest.get_index().search("taco")[0]["camis"], 48000006)
+        index = suggest.get_index()
+        with self.assertNumQueries(1):
+            self.assertIs(suggest.get_index(), index)
+
+
+class NearbySearchTests(TestCase):
+    # Around Union Square, Manhattan
+    ORIGIN = {"lat": 40.7359, "lng": -73.9911}
+
+    def setUp(self):
+        places = {
+            49000001: ("Next Door Deli", 40.7361, -73.9909),
+            49000002: ("Flatiron Grill", 40.7411, -73.9897),
+            49000003: ("Soho Noodles", 40.7233, -74.0030),
+            49000004: ("Astoria Taverna", 40.7644, -73.9235),
+            49000005: ("Nowhere Diner", None, None),
+        }
+        for camis, (name, _, _) in places.items():
+            RestaurantInspection.objects.create(CAMIS=camis, DBA=name, GRADE="A")
+        RestaurantSummary.set_coordinates(
+            {
+                camis: (lat, lng)
+                for camis, (_, lat, lng) in places.items()
+                if lat is not None
+            }
+        )
+
+    def nearby(self, **params):
+        params = search.parse_params({**self.ORIGIN, **params})
+        return list(search.search_queryset(params))
+
+    def test_results_sorted_by_distance_within_radius(self):
+        results = self.nearby(radius="2")
+        self.assertEqual([r.CAMIS for r in results], [49000001, 49000002, 49000003])
+        distances = [r.distance_km for r in results]
+        self.assertLess(distances[0], 0.05)
+        self.assertAlmostEqual(distances[1], 0.59, delta=0.05)
+        self.assertLessEqual(distances[-1], 2)
+
+    def test_location_combines_with_other_filters(self):
+        results = self.nearby(radius="10", q="taverna")
+        self.assertEqual([r.CAMIS for r in results], [49000004])
+
+    def test_spatial_index_follows_coordinate_changes(self):
+        RestaurantSummary.set_coordinates({49000005: (40.7358, -73.9912)})
+        self.assertEqual(self.nearby(radius="0.5")[0].CAMIS, 49000005)
+        RestaurantInspection.objects.get(CAMIS=49000005).delete()
+        self.assertNotIn(49000005, [r.CAMIS for r in self.nearby(radius="0.5")])
+
+    def test_invalid_coordinates_are_ignored(self):
+        params = search.parse_params({"lat": "91", "lng": "-73.99"})
+        self.assertFalse(search.has_filters(params))
+        params = search.parse_params({"lat": "nan", "lng": "x"})
+        self.assertIsNone(params["lat"])
+
+    def test_views_report_distance(self):
+        response = self.client.get(reverse("search_restaurants"), self.ORIGIN)
+        self.assertContains(response, "km away")
+        data = self.client.get(reverse("api_search"), self.ORIGIN).json()
+        self.assertEqual(data["results"][0]["camis"], 49000001)
+        self.assertIn("distance_km", data["results"][0])
+
+
+class SearchResultCacheTests(TestCase):
+    def setUp(self):
+        caches["search_results"].clear()
+        RestaurantInspection.objects.bulk_create(
+            RestaurantInspection(
+                CAMIS=49100000 + i, DBA=f"Cached Pizza {i:02d}", BORO="QUEENS"
+            )
+            for i in range(25)
+        )
+        RestaurantSummary.rebuild()
+        self.params = {"q": "cached pizza", "sort_by": "name"}
+
+    def test_equivalent_searches_share_a_key(self):
+        a = search.parse_params(
+            {"q": "  Cached   PIZZA ", "cuisine": "All Cuisines", "zipcode": "11101"}
+        )
+        b = search.parse_params({"q": "cached pizza", "zipcode": "11101.0"})
+        self.assertEqual(search.cache_key(a, 1), search.cache_key(b, 1))
+        self.assertNotEqual(search.cache_key(a, 1), search.cache_key(a, 2))
+
+    def test_zipcode_is_normalized_once_for_filter_and_key(self):
+        whole = search.parse_params({"zipcode": "10001"})
+        for zipcode in ("10001.5", "inf", "1e400", "-5", "abcd"):
+            with self.subTest(zipcode=zipcode):
+                params = search.parse_params({"zipcode": zipcode})
+                self.assertEqual(params["zipcode"], "")
+                self.assertNotEqual(
+                    search.cache_key(params, 1), search.cache_key(whole, 1)
+                )
+                response = self.client.get(
+                    reverse("search_restaurants"), {"zipcode": zipcode}
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_repeat_search_skips_result_queries(self):
+        url = reverse("search_restaurants")
+        with CaptureQueriesContext(connection) as first:
+            expected = self.client.get(url, self.params)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(url, self.params)
+        self.assertLess(len(second), len(first))
+        self.assertEqual(response.context["total_results"], 25)
+        self.assertEqual(
+            [r["info"].CAMIS for r in response.context["restaurants"]],
+            [r["info"].CAMIS for r in expected.context["restaurants"]],
+        )
+        page_two = self.client.get(url, {**self.params, "page": 2})
+        self.assertEqual(len(page_two.context["restaurants"]), 5)
+        self.assertEqual(page_two.context["page_obj"].start_index(), 21)
+
+    def test_saved_flags_are_not_shared_between_visitors(self):
+        url = reverse("search_restaurants")
+        self.client.get(url, self.params)
+        FavoriteRestaurant.objects.create(
+            session_key=self.client.session.session_key, camis=49100000
+        )
+        mine = self.client.get(url, self.params).context["restaurants"]
+        theirs = Client().get(url, self.params).context["restaurants"]
+        self.assertTrue(mine[0]["is_favorited"])
+        self.assertFalse(theirs[0]["is_favorited"])
+
+    def test_data_changes_invalidate_cached_pages(self):
+        url = reverse("search_restaurants")
+        self.client.get(url, self.params)
+        RestaurantInspection.objects.create(CAMIS=49100099, DBA="Cached Pizza 99")
+        response = self.client.get(url, self.params)
+        self.assertEqual(response.context["total_results"], 26)
+
+
 # ==================== NEW EDGE CASE TESTS ====================
 
 
@@ -714,13 +1511,18 @@ class OwnerDashboardTests(TestCase):
             reverse("owner_dashboard"), {"add_camis": "12345678"}
         )
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            OwnerRestaurant.objects.get(user=self.user).restaurant.CAMIS, 12345678
+        )
 
     def test_owner_dashboard_with_reviews(self):
         """Test owner dashboard displays reviews and analytics."""
         from inspections.models import OwnerRestaurant
 
         self.client.login(username="testowner", password="testpass123")
-        OwnerRestaurant.objects.create(user=self.user, restaurant=self.restaurant)
+        OwnerRestaurant.objects.create(
+            user=self.user, restaurant=RestaurantSummary.objects.get(CAMIS=12345678)
+        )
 
         # Add some reviews
         RestaurantReview.objects.create(
@@ -855,7 +1657,8 @@ class ModelStringAndHoursTests(TestCase):
     def test_ownerrestaurant_str(self):
         """Test that OwnerRestaurant string includes username and restaurant name."""
         user = User.objects.create_user(username="owner1", password="pass")
-        resturant = RestaurantInspection.objects.create(CAMIS=11111, DBA="R1")
+        RestaurantInspection.objects.create(CAMIS=11111, DBA="R1")
+        resturant = RestaurantSummary.objects.get(CAMIS=11111)
         ownerResturant = OwnerRestaurant.objects.create(user=user, restaurant=resturant)
         self.assertIn(user.username, str(ownerResturant))
         self.assertIn(resturant.DBA, str(ownerResturant))
@@ -903,10 +1706,12 @@ class ViewsSessionTransferAndBehaviorTests(TestCase):
     def test_owner_dashboard_alert_on_low_rating(self):
         """Test that owner dashboard shows alerts for restaurants with low ratings."""
         user = User.objects.create_user(username="ownerx", password="pw")
-        resturant = RestaurantInspection.objects.create(
+        RestaurantInspection.objects.create(
             CAMIS=66666, DBA="Low R", GRADE="C", INSPECTION_DATE=date.today()
         )
-        OwnerRestaurant.objects.create(user=user, restaurant=resturant)
+        OwnerRestaurant.objects.create(
+            user=user, restaurant=RestaurantSummary.objects.get(CAMIS=66666)
+        )
 
         self.client.login(username="ownerx", password="pw")
         resp = self.client.get(reverse("owner_dashboard"))
@@ -4,6 +4,8 @@ from . import views
 
 urlpatterns = [
     path("search/", views.search_restaurants, name="search_restaurants"),
+    path("api/search/", views.api_search, name="api_search"),
+    path("api/suggest/", views.api_suggest, name="api_suggest"),
     path("", RedirectView.as_view(url="/inspections/search/", permanent=False)),
     path("add_review/", views.add_review, name="add_review"),
     path("restaurant/<int:camis>/", views.restaurant_detail, name="restaurant_detail"),
@@ -5,13 +5,13 @@ from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth.models import User
 
 from django.db.models import Q
-from datetime import date
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.views.decorators.http import require_GET, require_POST
 
 from inspections.models import (
-    RestaurantInspection,
+    Inspection,
+    RestaurantSummary,
+    RestaurantRating,
     RestaurantReview,
     FavoriteRestaurant,
     FollowedRestaurant,
@@ -21,6 +21,7 @@ from inspections.models import (
     OwnerRestaurant,
 )
 
+from . import facets, search, suggest
 from .forms import OwnerSignUpForm
 
 
@@ -82,195 +83,111 @@ def customer_dashboard(request):
 
 
 def search_restaurants(request):
-    query = request.GET.get("q", "").strip()
-    cuisine = request.GET.get("cuisine", "").strip()
-    zipcode = request.GET.get("zipcode", "").strip()
-    borough = request.GET.get("borough", "").strip()
-    sort_by = request.GET.get("sort_by", "name").strip()
+    params = search.parse_params(request.GET)
     page_number = request.GET.get("page", 1)
 
     restaurants = []
     paginator = None
     page_obj = None
 
-    if query or cuisine or zipcode or borough:
-        # Build search filter
-        search_filter = Q()
-        if query:
-            search_filter &= Q(DBA__icontains=query) | Q(
-                CUISINE_DESCRIPTION__icontains=query
-            )
-        if cuisine and cuisine != "All Cuisines":
-            search_filter &= Q(CUISINE_DESCRIPTION__icontains=cuisine)
-        if zipcode:
-            try:
-                zipcode_num = float(zipcode)
-                search_filter &= Q(ZIPCODE=zipcode_num)
-            except ValueError:
-                # If zipcode is not a valid number, ignore it
-                pass
-        if borough and borough != "All Boroughs":
-            search_filter &= Q(BORO__iexact=borough)
-
-        # Get unique restaurants efficiently (SQLite compatible)
-        # First get all matching inspections ordered by restaurant and date
-        inspections = RestaurantInspection.objects.filter(search_filter).order_by(
-            "CAMIS", "-INSPECTION_DATE"
-        )
-
-        # Process to get all unique restaurants (no hard limit)
-        seen_camis = set()
-        limited_restaurants = []
-        for inspection in inspections:
-            if inspection.CAMIS not in seen_camis:
-                seen_camis.add(inspection.CAMIS)
-                limited_restaurants.append(
-                    {
-                        "CAMIS": inspection.CAMIS,
-                        "DBA": inspection.DBA,
-                        "BUILDING": inspection.BUILDING,
-                        "STREET": inspection.STREET,
-                        "BORO": inspection.BORO,
-                        "ZIPCODE": inspection.ZIPCODE,
-                        "CUISINE_DESCRIPTION": inspection.CUISINE_DESCRIPTION,
-                    }
-                )
-
-        # Get latest inspections for all restaurants in one query (much faster)
-        camis_list = [rest["CAMIS"] for rest in limited_restaurants]
-        latest_inspections = {}
-
-        if camis_list:
-            # Get the latest inspection for each restaurant in a single query
-            for inspection in RestaurantInspection.objects.filter(
-                CAMIS__in=camis_list
-            ).order_by("CAMIS", "-INSPECTION_DATE"):
-                if inspection.CAMIS not in latest_inspections:
-                    latest_inspections[inspection.CAMIS] = inspection
-
-        # Create lightweight restaurant objects with minimal data
-        restaurants = []
-        for rest_data in limited_restaurants:
-            latest_inspection = latest_inspections.get(rest_data["CAMIS"])
-
-            # Simple grade-based rating (much faster than full calculation)
-            if latest_inspection and latest_inspection.GRADE:
-                grade = latest_inspection.GRADE
-                if grade == "A":
-                    stars = 5
-                    description = "Excellent"
-                elif grade == "B":
-                    stars = 4
-                    description = "Good"
-                elif grade == "C":
-                    stars = 3
-                    description = "Fair"
-                else:
-                    stars = 2
-                    description = "Needs improvement"
-            else:
-                stars = 0
-                grade = "N/A"
-                description = "No grade available"
-
-            # Check if favorited and followed (quick lookup)
-            is_favorited = is_restaurant_favorited(request, rest_data["CAMIS"])
-            is_followed = is_restaurant_followed(request, rest_data["CAMIS"])
+    if search.has_filters(params):
+        # Sorting and paging happen in SQL; only the visible page is loaded,
+        # and repeat searches are served from the shared results cache
+        paginator, page_obj = search.cached_page(params, page_number)
 
+        # Favorite/follow flags are per visitor, so they are never cached
+        page_rows = list(page_obj)
+        favorited, followed = get_saved_camis(
+            request, [row["info"].CAMIS for row in page_rows]
+        )
+        for row in page_rows:
             restaurants.append(
                 {
-                    "info": type(
-                        "obj",
-                        (object,),
-                        {
-                            "CAMIS": rest_data["CAMIS"],
-                            "DBA": rest_data["DBA"],
-                            "BUILDING": rest_data["BUILDING"],
-                            "STREET": rest_data["STREET"],
-                            "BORO": rest_data["BORO"],
-                            "ZIPCODE": rest_data["ZIPCODE"],
-                            "CUISINE_DESCRIPTION": rest_data["CUISINE_DESCRIPTION"],
-                        },
-                    ),
-                    "rating": {
-                        "stars": stars,
-                        "grade": grade,
-                        "description": description,
-                        "inspection_count": 1,  # Simplified
-                        "latest_inspection": (
-                            latest_inspection.INSPECTION_DATE
-                            if latest_inspection
-                            else None
-                        ),
-                    },
-                    "reviews": [],  # Skip reviews for performance
-                    "is_favorited": is_favorited,
-                    "is_followed": is_followed,
-                    "citations": [],
+                    **row,
+                    "is_favorited": row["info"].CAMIS in favorited,
+                    "is_followed": row["info"].CAMIS in followed,
                 }
             )
 
-        # Sort restaurants based on selected criteria
-        if sort_by == "rating_high":
-            restaurants.sort(key=lambda r: r["rating"]["stars"], reverse=True)
-        elif sort_by == "rating_low":
-            restaurants.sort(key=lambda r: r["rating"]["stars"])
-        elif sort_by == "name":
-            restaurants.sort(key=lambda r: r["info"].DBA or "")
-        elif sort_by == "latest_inspection":
-            restaurants.sort(
-                key=lambda r: r["rating"]["latest_inspection"] or date(1900, 1, 1),
-                reverse=True,
-            )
-        elif sort_by == "grade":
-            grade_order = {"A": 1, "B": 2, "C": 3, "N": 4, "P": 5, "Z": 6}
-            restaurants.sort(key=lambda r: grade_order.get(r["rating"]["grade"], 7))
-
-        # Implement pagination - 20 restaurants per page
-        paginator = Paginator(restaurants, 20)
-
-        try:
-            page_obj = paginator.get_page(page_number)
-        except PageNotAnInteger:
-            page_obj = paginator.get_page(1)
-        except EmptyPage:
-            page_obj = paginator.get_page(paginator.num_pages)
-
-    # Get all available cuisines for the filter dropdown
-    all_cuisines = (
-        RestaurantInspection.objects.values_list("CUISINE_DESCRIPTION", flat=True)
-        .distinct()
-        .exclude(CUISINE_DESCRIPTION__isnull=True)
-        .exclude(CUISINE_DESCRIPTION__exact="")
-        .order_by("CUISINE_DESCRIPTION")
-    )
-
-    # Get all available boroughs for the dropdown
-    all_boroughs = (
-        RestaurantInspection.objects.values_list("BORO", flat=True)
-        .distinct()
-        .exclude(BORO__isnull=True)
-        .exclude(BORO__exact="")
-        .order_by("BORO")
-    )
+    # Dropdown options and counts come from the cached facets
+    sidebar_facets = facets.get_facets()
 
+    total_results = paginator.count if paginator else 0
     context = {
-        "restaurants": page_obj.object_list if page_obj else restaurants,
+        "restaurants": restaurants,
         "page_obj": page_obj,
         "paginator": paginator,
-        "query": query,
-        "cuisine": cuisine,
-        "zipcode": zipcode,
-        "borough": borough,
-        "sort_by": sort_by,
-        "all_cuisines": all_cuisines,
-        "all_boroughs": all_boroughs,
-        "total_results": len(restaurants) if restaurants else 0,
-        "results_limited": len(restaurants) >= 200,
+        "query": params["query"],
+        "cuisine": params["cuisine"],
+        "zipcode": params["zipcode"],
+        "borough": params["borough"],
+        "sort_by": params["sort_by"],
+        "lat": params["lat"],
+        "lng": params["lng"],
+        "radius": params["radius"],
+        "all_cuisines": sidebar_facets["cuisine"],
+        "all_boroughs": sidebar_facets["borough"],
+        "all_zipcodes": sidebar_facets["zipcode"],
+        "total_results": total_results,
+        "results_limited": total_results >= 200,
     }
     return render(request, "inspections/search.html", context)
 
 
+@require_GET
+def api_search(request):
+    """JSON search with keyset pagination; pass ``cursor`` to get the next page"""
+    params = search.parse_params(request.GET)
+    try:
+        limit = min(max(int(request.GET.get("limit", search.PAGE_SIZE)), 1), 100)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+
+    try:
+        summaries, next_cursor = search.keyset_page(
+            params, request.GET.get("cursor"), limit
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    results = []
+    for summary in summaries:
+        rating = summary.search_rating
+        results.append(
+            {
+                "camis": summary.CAMIS,
+                "name": summary.DBA,
+                "address": " ".join(
+                    part for part in (summary.BUILDING, summary.STREET) if part
+                ),
+                "borough": summary.BORO,
+                "zipcode": int(summary.ZIPCODE) if summary.ZIPCODE else None,
+                "cuisine": summary.CUISINE_DESCRIPTION,
+                "grade": rating["grade"],
+                "stars": rating["stars"],
+                "latest_inspection": (
+                    rating["latest_inspection"].isoformat()
+                    if rating["latest_inspection"]
+                    else None
+                ),
+            }
+        )
+        if search.has_location(params):
+            results[-1]["distance_km"] = round(summary.distance_km, 3)
+    return JsonResponse({"results": results, "next_cursor": next_cursor})
+
+
+@require_GET
+def api_suggest(request):
+    """Restaurant name autocomplete served from the in-memory prefix index"""
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    suggestions = suggest.get_index().search(request.GET.get("q", ""), limit)
+    return JsonResponse({"suggestions": suggestions})
+
+
 def add_review(request):
     """Handle adding new restaurant reviews"""
     restaurant_name = None
@@ -306,18 +223,18 @@ def restaurant_detail(request, camis):
     """Display detailed information about a specific restaurant"""
     from inspections.models import RestaurantDetails
 
-    # Get restaurant inspection info
-    restaurant = RestaurantInspection.objects.filter(CAMIS=camis).first()
+    # Get restaurant info
+    restaurant = RestaurantSummary.objects.filter(CAMIS=camis).first()
     if not restaurant:
         return render(request, "inspections/restaurant_not_found.html")
 
-    # Get all inspections for this restaurant
-    all_inspections = RestaurantInspection.objects.filter(CAMIS=camis).order_by(
-        "-INSPECTION_DATE"
+    # Get all inspection visits for this restaurant
+    all_inspections = Inspection.objects.filter(camis=camis).order_by(
+        "-inspection_date", "-id"
     )
 
     # Get rating information
-    rating_info = RestaurantInspection.get_restaurant_rating(camis)
+    rating_info = RestaurantRating.ratings_for([camis])[camis]
 
     # Get all reviews
     reviews = RestaurantReview.objects.filter(camis=camis).order_by("-review_date")
@@ -341,7 +258,8 @@ def restaurant_detail(request, camis):
         "details": details,
         "rating": rating_info,
         "reviews": reviews,
-        "all_inspections": all_inspections[:10],  # Limit to recent 10 inspections
+        # Limit to recent 10 inspections
+        "all_inspections": all_inspections.prefetch_related("violations")[:10],
         "total_inspections": all_inspections.count(),
         "is_favorited": is_favorited,
     }
@@ -383,17 +301,22 @@ def owner_dashboard(request):
     add_success = None
     if request.method == "POST" and "add_camis" in request.POST:
         camis = request.POST.get("add_camis").strip()
-        restaurant = RestaurantInspection.objects.filter(CAMIS=camis).first()
+        restaurant = RestaurantSummary.objects.filter(CAMIS=camis).first()
         if restaurant:
             OwnerRestaurant.objects.get_or_create(
                 user=request.user, restaurant=restaurant
             )
             add_success = restaurant.DBA
-    owner_restaurants = OwnerRestaurant.objects.filter(user=request.user)
+    owner_restaurants = OwnerRestaurant.objects.filter(
+        user=request.user
+    ).select_related("restaurant")
+    ratings = RestaurantRating.ratings_for(
+        entry.restaurant.CAMIS for entry in owner_restaurants
+    )
     dashboard_data = []
     for entry in owner_restaurants:
         r = entry.restaurant
-        rating = RestaurantInspection.get_restaurant_rating(r.CAMIS)
+        rating = ratings[r.CAMIS]
         reviews = RestaurantReview.objects.filter(camis=r.CAMIS).order_by(
             "-review_date"
         )
@@ -495,13 +418,14 @@ def favorites_list(request):
         favorites = FavoriteRestaurant.objects.filter(session_key=session_key)
 
     # Get detailed info for each favorite restaurant
+    camis_values = [fav.camis for fav in favorites]
+    summaries = RestaurantSummary.objects.in_bulk(camis_values, field_name="CAMIS")
+    ratings = RestaurantRating.ratings_for(camis_values)
     favorite_restaurants = []
     for fav in favorites:
-        # Get latest inspection info for this restaurant
-        restaurant = RestaurantInspection.objects.filter(CAMIS=fav.camis).first()
+        restaurant = summaries.get(fav.camis)
         if restaurant:
-            # Get rating information
-            rating_info = RestaurantInspection.get_restaurant_rating(fav.camis)
+            rating_info = ratings[fav.camis]
 
             favorite_restaurants.append(
                 {"favorite": fav, "restaurant": restaurant, "rating": rating_info}
@@ -535,6 +459,32 @@ def is_restaurant_followed(request, camis):
     ).exists()
 
 
+def get_saved_camis(request, camis_values):
+    """
+    Return the (favorited, followed) CAMIS sets for the current session or
+    logged-in user, restricted to ``camis_values``.
+    """
+    owner_filter = Q()
+    if request.session.session_key:
+        owner_filter |= Q(session_key=request.session.session_key)
+    if request.user.is_authenticated:
+        owner_filter |= Q(user=request.user)
+    if not owner_filter or not camis_values:
+        return set(), set()
+
+    favorited = set(
+        FavoriteRestaurant.objects.filter(
+            owner_filter, camis__in=camis_values
+        ).values_list("camis", flat=True)
+    )
+    followed = set(
+        FollowedRestaurant.objects.filter(
+            owner_filter, camis__in=camis_values
+        ).values_list("camis", flat=True)
+    )
+    return favorited, followed
+
+
 @require_POST
 def toggle_follow(request):
     """Toggle follow status for a restaurant via AJAX"""
@@ -561,18 +511,16 @@ def toggle_follow(request):
         # Add to followed restaurants
         # First get current restaurant state for tracking changes
         latest_inspection = (
-            RestaurantInspection.objects.filter(CAMIS=camis)
-            .order_by("-INSPECTION_DATE")
-            .first()
+            Inspection.objects.filter(camis=camis).order_by("-inspection_date").first()
         )
 
         FollowedRestaurant.objects.create(
             session_key=session_key,
             camis=camis,
             restaurant_name=restaurant_name,
-            last_known_grade=latest_inspection.GRADE if latest_inspection else None,
+            last_known_grade=latest_inspection.grade if latest_inspection else None,
             last_inspection_date=(
-                latest_inspection.INSPECTION_DATE if latest_inspection else None
+                latest_inspection.inspection_date if latest_inspection else None
             ),
         )
         is_followed = True
@@ -596,13 +544,14 @@ def followed_restaurants(request):
         followed = FollowedRestaurant.objects.filter(session_key=session_key)
 
     # Get detailed info for each followed restaurant
+    camis_values = [follow.camis for follow in followed]
+    summaries = RestaurantSummary.objects.in_bulk(camis_values, field_name="CAMIS")
+    ratings = RestaurantRating.ratings_for(camis_values)
     followed_restaurants_list = []
     for follow in followed:
-        # Get latest inspection info for this restaurant
-        restaurant = RestaurantInspection.objects.filter(CAMIS=follow.camis).first()
+        restaurant = summaries.get(follow.camis)
         if restaurant:
-            # Get rating information
-            rating_info = RestaurantInspection.get_restaurant_rating(follow.camis)
+            rating_info = ratings[follow.camis]
 
             # Get recent notifications for this restaurant
             recent_notifications = RestaurantNotification.objects.filter(
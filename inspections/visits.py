@@ -0,0 +1,127 @@
+"""
+How the inspection feed maps onto the stored tables.
+
+The feed has one row per violation, repeating the restaurant's name and
+address and the visit's date, type, score and grade on each. A visit is
+identified by (CAMIS, inspection date, inspection type); visits without
+violations still appear once, with blank violation columns.
+
+Each feed row is stored once: its restaurant columns on the restaurant's
+RestaurantSummary row, its visit columns on the Inspection of that visit,
+and its own violation columns on a Violation row (blank for a visit without
+violations). The VIEW joins them back into the feed's shape for
+RestaurantInspection. SQLite refuses to rename a table over one a view
+reads from, so anything that drops or rebuilds these tables (the shadow
+swap, a migration that remakes one of them) drops the view first and
+creates it again afterwards.
+"""
+
+# RestaurantInspection columns needed to build visits
+FEED_FIELDS = (
+    "CAMIS",
+    "INSPECTION_DATE",
+    "INSPECTION_TYPE",
+    "ACTION",
+    "SCORE",
+    "GRADE",
+    "GRADE_DATE",
+    "VIOLATION_CODE",
+    "VIOLATION_DESCRIPTION",
+    "CRITICAL_FLAG",
+)
+
+# Inspection field -> feed column, for the visit's attributes
+VISIT_COLUMNS = {
+    "action": "ACTION",
+    "score": "SCORE",
+    "grade": "GRADE",
+    "grade_date": "GRADE_DATE",
+}
+
+# Violation field -> feed column
+VIOLATION_COLUMNS = {
+    "code": "VIOLATION_CODE",
+    "description": "VIOLATION_DESCRIPTION",
+    "critical_flag": "CRITICAL_FLAG",
+}
+
+VIEW = "inspections_restaurantinspection"
+
+_VIEW_SQL = f"""
+CREATE VIEW IF NOT EXISTS "{VIEW}" AS
+SELECT
+    violation."id",
+    visit."camis" AS "CAMIS",
+    restaurant."DBA",
+    restaurant."BORO",
+    restaurant."BUILDING",
+    restaurant."STREET",
+    restaurant."ZIPCODE",
+    restaurant."PHONE",
+    restaurant."CUISINE_DESCRIPTION",
+    visit."inspection_date" AS "INSPECTION_DATE",
+    visit."action" AS "ACTION",
+    violation."code" AS "VIOLATION_CODE",
+    violation."description" AS "VIOLATION_DESCRIPTION",
+    violation."critical_flag" AS "CRITICAL_FLAG",
+    visit."score" AS "SCORE",
+    visit."grade" AS "GRADE",
+    visit."grade_date" AS "GRADE_DATE",
+    visit."inspection_type" AS "INSPECTION_TYPE",
+    restaurant."Community_Board",
+    restaurant."Council_District",
+    restaurant."Census_Tract"
+FROM "inspections_violation" violation
+INNER JOIN "inspections_inspection" visit
+    ON visit."id" = violation."inspection_id"
+INNER JOIN "inspections_restaurantsummary" restaurant
+    ON restaurant."CAMIS" = visit."camis"
+"""
+
+
+def create_view(connection):
+    """Create the feed-shaped view over the stored tables"""
+    with connection.cursor() as cursor:
+        cursor.execute(_VIEW_SQL)
+
+
+def drop_view(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP VIEW IF EXISTS "{VIEW}"')
+
+
+def group_visits(rows):
+    """
+    Group feed rows (dicts with FEED_FIELDS) into a list of
+    ``(visit, violations)`` pairs of field dicts, in first-seen order.
+    Later rows of a visit only fill in its blank attributes.
+    """
+    visits = {}
+    for row in rows:
+        key = (row["CAMIS"], row["INSPECTION_DATE"], row["INSPECTION_TYPE"])
+        entry = visits.get(key)
+        if entry is None:
+            visit = {
+                "camis": row["CAMIS"],
+                "inspection_date": row["INSPECTION_DATE"],
+                "inspection_type": row["INSPECTION_TYPE"],
+            }
+            visit.update(
+                {field: row[column] for field, column in VISIT_COLUMNS.items()}
+            )
+            entry = visits[key] = (visit, [])
+        else:
+            visit = entry[0]
+            for field, column in VISIT_COLUMNS.items():
+                if visit[field] in (None, "") and row[column] not in (None, ""):
+                    visit[field] = row[column]
+
+        if row["VIOLATION_CODE"] or row["VIOLATION_DESCRIPTION"]:
+            entry[1].append(
+                {
+                    "code": row["VIOLATION_CODE"],
+                    "description": row["VIOLATION_DESCRIPTION"],
+                    "critical_flag": row["CRITICAL_FLAG"],
+                }
+            )
+    return list(visits.values())
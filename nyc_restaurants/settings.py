@@ -98,6 +98,22 @@ DATABASES = {
     }
 }
 
+# Caches
+# Search result pages get their own bounded LRU so they cannot evict facets
+# and other small entries from the default cache.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "search_results": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "search-results",
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 2000, "CULL_FREQUENCY": 10},
+    },
+}
+
 # Honor X-Forwarded-Proto/SSL when behind a proxy (e.g., Render/Heroku)
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 